@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import easyencrypt
+from ciphers.aes256gcmcipher import Aes256GcmCipher
+from kdfs.scryptkdf import ScryptKdf
+
+
+async def source(data: bytes, chunk_size: int):
+    for i in range(0, len(data), chunk_size):
+        # a network upload hands over data a little at a time
+        await asyncio.sleep(0)
+        yield data[i: i + chunk_size]
+
+
+async def stream(data: bytes, executor, segment_size: int) -> int:
+    out = 0
+    async for block in easyencrypt.aencrypt("hunter2", ScryptKdf.fast(), Aes256GcmCipher(), source(data, 64 * 1024),
+                                            segment_size=segment_size, workers=2, executor=executor):
+        out += len(block)
+    return out
+
+
+async def ticker(interval: float, lags: list, done: asyncio.Event):
+    while not done.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def run(args):
+    data = os.urandom(args.size * 1024)
+    executor = ThreadPoolExecutor(args.threads)
+    lags, done = [], asyncio.Event()
+
+    tick = asyncio.create_task(ticker(0.01, lags, done))
+    start = time.perf_counter()
+    total = sum(await asyncio.gather(*(stream(data, executor, args.segment_size) for _ in range(args.streams))))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await tick
+    executor.shutdown()
+
+    lags.sort()
+    print(f"{args.streams} streams x {args.size} KiB in {elapsed:.2f} s ({total / elapsed / 1e6:.1f} MB/s out)")
+    print(f"event loop lag: median {lags[len(lags) // 2] * 1e3:.2f} ms, "
+          f"p99 {lags[int(len(lags) * 0.99)] * 1e3:.2f} ms, max {lags[-1] * 1e3:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encrypts many streams at once and measures event loop lag.")
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--size", type=int, default=1024, help="the size of each stream in KiB")
+    parser.add_argument("--segment-size", type=int, default=256 * 1024)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
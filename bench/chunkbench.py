@@ -0,0 +1,92 @@
+import argparse
+import random
+import time
+from typing import Iterable, List, Set
+
+import easyencrypt
+import segments
+from chunker import Chunker
+from ciphers.aes256gcmcipher import Aes256GcmCipher
+from kdfs.scryptkdf import ScryptKdf
+
+MiB = 1024 * 1024
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def records(enc: bytes) -> List[bytes]:
+    # the length-prefixed chunk records of a version 5 file, which is what a dedup store or rsync would match on
+    pos = 6 + int.from_bytes(enc[2:6], "big")
+    out = []
+    while (length := int.from_bytes(enc[pos: pos + 4], "big")) != 0:
+        out.append(enc[pos: pos + 4 + length])
+        pos += 4 + length
+    return out
+
+
+def fixed_blocks(data: bytes, size: int) -> List[bytes]:
+    return [data[i: i + size] for i in range(0, len(data), size)]
+
+
+def shared(old: Iterable[bytes], new: List[bytes]) -> float:
+    # the fraction of the new version that's already stored
+    have: Set[bytes] = set(old)
+    return sum(len(b) for b in new if b in have) / max(1, sum(len(b) for b in new))
+
+
+def edit(data: bytes, kind: str, count: int, rng: random.Random) -> bytes:
+    out = bytearray(data)
+    for _ in range(count):
+        pos = rng.randrange(len(out))
+        if kind == "insert":
+            out[pos: pos] = rng.randbytes(rng.randint(1, 100))
+        elif kind == "delete":
+            del out[pos: pos + rng.randint(1, 100)]
+        else:
+            n = rng.randint(1, 100)
+            out[pos: pos + n] = rng.randbytes(n)
+    return bytes(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the content-defined chunker's throughput and how much of "
+                                                 "an edited file's ciphertext is shared with the original's.")
+    parser.add_argument("--size", type=int, default=32, help="the size of the test file in MiB")
+    parser.add_argument("--edits", type=int, default=10, help="the number of small edits made to the file")
+    parser.add_argument("--avg", type=int, default=64, help="the average chunk size in KiB, a power of two")
+    args = parser.parse_args()
+
+    chunker = Chunker(args.avg * 1024 // 4, args.avg * 1024, args.avg * 1024 * 4)
+    rng = random.Random(0)
+    data = rng.randbytes(args.size * MiB)
+    cipher, key = Aes256GcmCipher(), bytes(range(32))
+
+    cut = timed(lambda: chunker.cut_map(data))
+    split = timed(lambda: [0 for _ in chunker.split(data)])
+    chunked = timed(lambda: [0 for _ in segments.encrypt_chunked(cipher, key, chunker, data)])
+    plain = timed(lambda: [0 for _ in segments.encrypt(cipher, key, data)])
+    print(f"{'cut points':<32} {len(data) / cut / 1e6:10.1f} MB/s")
+    print(f"{'chunker':<32} {len(data) / split / 1e6:10.1f} MB/s")
+    print(f"{'chunked encrypt':<32} {len(data) / chunked / 1e6:10.1f} MB/s")
+    print(f"{'segmented encrypt (version 2)':<32} {len(data) / plain / 1e6:10.1f} MB/s")
+
+    password, kdf = "bench", ScryptKdf.fast()
+    original = b''.join(easyencrypt.encrypt(password, kdf, cipher, data, chunker=chunker))
+    header = easyencrypt.read_header(original)
+    old_records = records(original)
+
+    print()
+    print(f"{'edit':<32} {'chunked':>10} {'fixed ' + str(args.avg) + ' KiB':>14}")
+    for kind in ["overwrite", "insert", "delete"]:
+        edited = edit(data, kind, args.edits, rng)
+        enc = b''.join(easyencrypt.encrypt_like(password, header, edited))
+        fixed = shared(fixed_blocks(data, args.avg * 1024), fixed_blocks(edited, args.avg * 1024))
+        print(f"{f'{args.edits} x {kind}':<32} {shared(old_records, records(enc)):10.1%} {fixed:14.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import os
+import time
+
+import ciphers.aeadcipher
+import segments
+from bufferedreader import BufferedReader
+from ciphers.aes256gcmcipher import Aes256GcmCipher
+from ciphers.chacha20poly1305cipher import ChaCha20Poly1305Cipher
+
+readers = []
+
+
+def counting_reader(arg):
+    ret = BufferedReader(arg)
+    readers.append(ret)
+    return ret
+
+
+def measure(fn, input_len: int):
+    readers.clear()
+    start = time.perf_counter()
+    out = 0
+    for block in fn():
+        out += len(block)
+    elapsed = time.perf_counter() - start
+    copied = sum(br.bytes_copied for br in readers)
+    return copied / input_len, input_len / elapsed / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures bytes copied by BufferedReader per byte processed.")
+    parser.add_argument("--size", type=int, default=64, help="the amount of data to process in MiB")
+    parser.add_argument("--chunk-size", type=int, default=1024 * 1024, help="the size of the upstream chunks")
+    args = parser.parse_args()
+
+    # count every reader the cipher paths create without changing their code
+    ciphers.aeadcipher.BufferedReader = counting_reader
+    segments.BufferedReader = counting_reader
+
+    key = bytes(range(32))
+    data = os.urandom(args.size * 1024 * 1024)
+
+    def upstream(b: bytes):
+        return [b[i: i + args.chunk_size] for i in range(0, len(b), args.chunk_size)]
+
+    for name, cipher in [("aes-256-gcm", Aes256GcmCipher()), ("chacha20-poly1305", ChaCha20Poly1305Cipher())]:
+        enc = b''.join(cipher.encrypt(key, upstream(data)))
+        enc_seg = b''.join(segments.encrypt(cipher, key, upstream(data)))
+        for path, fn, n in [
+            ("stream encrypt", lambda: cipher.encrypt(key, upstream(data)), len(data)),
+            ("stream decrypt", lambda: cipher.decrypt(key, upstream(enc)), len(enc)),
+            ("segment encrypt", lambda: segments.encrypt(cipher, key, upstream(data)), len(data)),
+            ("segment decrypt", lambda: segments.decrypt(cipher, key, upstream(enc_seg)), len(enc_seg)),
+        ]:
+            ratio, mbps = measure(fn, n)
+            print(f"{name:<20} {path:<16} {ratio:8.4f} bytes copied/byte {mbps:10.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
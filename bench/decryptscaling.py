@@ -0,0 +1,52 @@
+import argparse
+import os
+import time
+
+import segments
+from ciphers.aes256gcmcipher import Aes256GcmCipher
+from ciphers.chacha20poly1305cipher import ChaCha20Poly1305Cipher
+from parallel import default_workers
+
+
+def worker_counts(max_workers: int):
+    n = 1
+    while n < max_workers:
+        yield n
+        n *= 2
+    yield max_workers
+
+
+def measure(cipher, data: bytes, segment_size: int, workers: int, repeat: int) -> float:
+    key = bytes(range(32))
+    enc = b''.join(segments.encrypt(cipher, key, data, segment_size))
+    chunks = [enc[i: i + 1024 * 1024] for i in range(0, len(enc), 1024 * 1024)]
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in segments.decrypt(cipher, key, chunks, segment_size, workers):
+            pass
+        best = min(best, time.perf_counter() - start)
+    return len(data) / best / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures segmented decryption throughput from 1 to N workers.")
+    parser.add_argument("--size", type=int, default=256, help="the amount of data to decrypt in MiB")
+    parser.add_argument("--segment-size", type=int, default=segments.DEFAULT_SEGMENT_SIZE)
+    parser.add_argument("--max-workers", type=int, default=default_workers())
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    data = os.urandom(args.size * 1024 * 1024)
+
+    for name, cipher in [("aes-256-gcm", Aes256GcmCipher()), ("chacha20-poly1305", ChaCha20Poly1305Cipher())]:
+        base = None
+        for workers in worker_counts(args.max_workers):
+            mbps = measure(cipher, data, args.segment_size, workers, args.repeat)
+            base = base or mbps
+            print(f"{name:<20} workers={workers:<4} {mbps:10.1f} MB/s  {mbps / base:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
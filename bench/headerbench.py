@@ -0,0 +1,52 @@
+import argparse
+import json
+import timeit
+
+import binaryheader
+import kdfs.keywrap
+import kdfs.subkey
+from ciphers.aes256gcmcipher import Aes256GcmCipher
+from compressors.zlibcompressor import ZlibCompressor
+from kdfs.argon2kdf import Argon2Kdf
+from kdfs.scryptkdf import ScryptKdf
+
+
+def headers():
+    return [
+        ("argon2/v1", {"kdf": Argon2Kdf.sensitive().serialize(), "cipher": Aes256GcmCipher().serialize()}),
+        ("scrypt/v2", {"kdf": ScryptKdf.sensitive().serialize(), "cipher": Aes256GcmCipher().serialize(),
+                       "version": 2, "segment_size": 1024 * 1024}),
+        ("argon2/v3+subkey", {"kdf": Argon2Kdf.sensitive().serialize(), "cipher": Aes256GcmCipher().serialize(),
+                              "version": 3, "segment_size": 1024 * 1024, "subkey": kdfs.subkey.serialize(bytes(32)),
+                              "compression": ZlibCompressor().serialize()}),
+        ("argon2/v2+keywrap", {"kdf": Argon2Kdf.sensitive().serialize(), "cipher": Aes256GcmCipher().serialize(),
+                               "version": 2, "segment_size": 1024 * 1024,
+                               "keywrap": kdfs.keywrap.wrap(bytes(32), bytes(32))}),
+    ]
+
+
+def per_second(fn, number: int) -> float:
+    return number / min(timeit.repeat(fn, number=number, repeat=5))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the size and speed of the JSON and binary headers.")
+    parser.add_argument("--number", type=int, default=20000, help="the number of headers per timing run")
+    args = parser.parse_args()
+
+    print(f"{'header':<18} {'format':<7} {'bytes':>6} {'serialize/s':>13} {'parse/s':>13}")
+    for name, header in headers():
+        json_body = bytes(json.dumps(header), "utf-8")
+        binary_body = binaryheader.encode(header)
+
+        for fmt, body, serialize, parse in [
+            ("json", json_body, lambda: bytes(json.dumps(header), "utf-8"), lambda: json.loads(str(json_body, "utf-8"))),
+            ("binary", binary_body, lambda: binaryheader.encode(header), lambda: binaryheader.decode(binary_body)),
+        ]:
+            # every header also carries the 6-byte magic and length prefix
+            print(f"{name:<18} {fmt:<7} {len(body) + 6:6d} {per_second(serialize, args.number):13.0f} "
+                  f"{per_second(parse, args.number):13.0f}")
+
+
+if __name__ == "__main__":
+    main()
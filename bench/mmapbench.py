@@ -0,0 +1,76 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import segments
+
+
+def read_syscalls() -> int:
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("syscr:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return -1
+
+
+def stream(path: str):
+    with open(path, "rb") as f:
+        while len(buf := f.read(1024 * 1024)) != 0:
+            yield buf
+
+
+def child(mode: str, path: str):
+    key = bytes(range(32))
+    from ciphers.aes256gcmcipher import Aes256GcmCipher
+    cipher = Aes256GcmCipher()
+
+    syscalls = read_syscalls()
+    start = time.perf_counter()
+    for _ in segments.encrypt(cipher, key, path if mode == "mmap" else stream(path), workers=1):
+        pass
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        "seconds": elapsed,
+        "read_syscalls": read_syscalls() - syscalls if syscalls >= 0 else None,
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares streamed and memory-mapped file encryption.")
+    parser.add_argument("--size", type=int, default=1024, help="the size of the input file in MiB")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "FILE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    fd, path = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for _ in range(args.size):
+                f.write(os.urandom(1024 * 1024))
+
+        for mode in ["stream", "mmap"]:
+            # each mode runs in a fresh interpreter so peak RSS isn't shared
+            out = subprocess.run([sys.executable, "-m", "bench.mmapbench", "--child", mode, path],
+                                 check=True, capture_output=True, text=True).stdout
+            res = json.loads(out)
+            print(f"{mode:<8} {args.size / res['seconds']:10.1f} MiB/s  "
+                  f"read syscalls {res['read_syscalls']}  peak RSS {res['max_rss_kib'] / 1024:.1f} MiB")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import os
+import tempfile
+import time
+
+import pipeline
+import segments
+from bufferedreader import DEFAULT_CHUNK_SIZE
+from ciphers.aes256gcmcipher import Aes256GcmCipher
+from ciphers.chacha20poly1305cipher import ChaCha20Poly1305Cipher
+
+
+def serial_blocks(handle, size: int):
+    # how main.py read stdin before the pipeline
+    while len(buf := handle.read(size)) != 0:
+        yield buf
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares a file to file encryption run serially and through the "
+                                                 "reader/cipher/writer pipeline against the disk and cipher alone.")
+    parser.add_argument("--size", type=int, default=256, help="the size of the file in MiB")
+    parser.add_argument("--dir", default=None, help="where to write the test files. defaults to the temp directory")
+    parser.add_argument("--workers", type=int, default=1, help="the number of cipher threads")
+    args = parser.parse_args()
+
+    key = bytes(range(32))
+    size = args.size * 1024 * 1024
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        src, dst = os.path.join(tmp, "plain"), os.path.join(tmp, "enc")
+        with open(src, "wb") as f:
+            for _ in range(args.size):
+                f.write(os.urandom(1024 * 1024))
+
+        def copy(reader, writer, transform):
+            with open(src, "rb", buffering=0) as i, open(dst, "wb", buffering=0) as o:
+                writer(o, transform(reader(i)))
+                os.fsync(o.fileno())
+
+        def serial_write(o, blocks):
+            for b in blocks:
+                o.write(b)
+
+        def serial_read(i):
+            return serial_blocks(i, DEFAULT_CHUNK_SIZE)
+
+        def pipelined_read(i):
+            return pipeline.read_blocks(i)
+
+        disk = timed(lambda: copy(serial_read, serial_write, lambda x: x))
+        print(f"{'disk copy':<40} {size / disk / 1e6:10.1f} MB/s")
+
+        for name, cipher in [("aes-256-gcm", Aes256GcmCipher()), ("chacha20-poly1305", ChaCha20Poly1305Cipher())]:
+            data = os.urandom(64 * 1024 * 1024)
+            alone = timed(lambda: [0 for _ in segments.encrypt(cipher, key, data, workers=args.workers)])
+            print(f"{name + ' cipher alone':<40} {len(data) / alone / 1e6:10.1f} MB/s")
+
+            def encrypt(blocks):
+                return segments.encrypt(cipher, key, blocks, workers=args.workers)
+
+            serial = timed(lambda: copy(serial_read, serial_write, encrypt))
+            piped = timed(lambda: copy(pipelined_read, pipeline.write_blocks, encrypt))
+            print(f"{name + ' serial':<40} {size / serial / 1e6:10.1f} MB/s")
+            print(f"{name + ' pipelined':<40} {size / piped / 1e6:10.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import easyencrypt
+import segments
+from ciphers.aes256gcmcipher import Aes256GcmCipher
+from ciphers.aes256ocbcipher import Aes256OcbCipher
+from ciphers.chacha20poly1305cipher import ChaCha20Poly1305Cipher
+from ciphers.xchacha20poly1305cipher import XChaCha20Poly1305Cipher
+from kdfs.argon2kdf import Argon2Kdf
+from kdfs.scryptkdf import ScryptKdf
+
+KiB = 1024
+MiB = 1024 * KiB
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def size_name(n: int) -> str:
+    return f"{n // MiB}MiB" if n >= MiB else f"{n // KiB}KiB"
+
+
+def best_of(fn: Callable[[], None], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def drain(it: Iterable[bytes]) -> None:
+    for _ in it:
+        pass
+
+
+def split(b: bytes, size: int) -> List[bytes]:
+    return [b[i: i + size] for i in range(0, len(b), size)]
+
+
+def cipher_list():
+    return [("aes-256-gcm", Aes256GcmCipher()), ("chacha20-poly1305", ChaCha20Poly1305Cipher()),
+            ("aes-256-ocb", Aes256OcbCipher()), ("xchacha20-poly1305", XChaCha20Poly1305Cipher())]
+
+
+def bench_ciphers(quick: bool, repeat: int) -> Iterable[Tuple[str, float, str]]:
+    key = bytes(range(32))
+    sizes = [64 * KiB, MiB] if quick else [64 * KiB, MiB, 16 * MiB]
+    # upstream chunk sizes around the default 1 MiB buffer size
+    chunk_sizes = [16 * KiB, 64 * KiB, MiB]
+
+    for name, cipher in cipher_list():
+        for size in sizes:
+            data = os.urandom(size)
+            enc = b''.join(cipher.encrypt(key, data))
+            enc_seg = b''.join(segments.encrypt(cipher, key, data, workers=1))
+            for chunk_size in chunk_sizes:
+                if chunk_size > size:
+                    continue
+                tag = f"size={size_name(size)}/chunk={size_name(chunk_size)}"
+                plain, ct, ct_seg = split(data, chunk_size), split(enc, chunk_size), split(enc_seg, chunk_size)
+                for path, fn in [
+                    ("encrypt", lambda: drain(cipher.encrypt(key, plain))),
+                    ("decrypt", lambda: drain(cipher.decrypt(key, ct))),
+                    ("segment-encrypt", lambda: drain(segments.encrypt(cipher, key, plain, workers=1))),
+                    ("segment-decrypt", lambda: drain(segments.decrypt(cipher, key, ct_seg, workers=1))),
+                ]:
+                    yield f"cipher/{name}/{path}/{tag}", size / best_of(fn, repeat) / 1e6, "MB/s"
+
+
+def bench_kdfs(quick: bool, repeat: int) -> Iterable[Tuple[str, float, str]]:
+    presets = [("argon2", "fast", Argon2Kdf.fast), ("scrypt", "fast", ScryptKdf.fast)]
+    if not quick:
+        presets += [("argon2", "sensitive", Argon2Kdf.sensitive), ("scrypt", "sensitive", ScryptKdf.sensitive)]
+
+    for name, preset, make in presets:
+        kdf = make()
+        # the sensitive presets take seconds each, so they are only run once
+        n = repeat if preset == "fast" else 1
+        yield f"kdf/{name}/{preset}", best_of(lambda: kdf.derive("hunter2", 32), n), "s"
+
+
+def bench_end_to_end(quick: bool, repeat: int) -> Iterable[Tuple[str, float, str]]:
+    size = 4 * MiB if quick else 64 * MiB
+    data = os.urandom(size)
+    password = "hunter2"
+
+    for name, cipher in cipher_list():
+        kdf = ScryptKdf.fast()
+        enc = b''.join(easyencrypt.encrypt(password, kdf, cipher, split(data, MiB)))
+        yield (f"e2e/{name}/encrypt/size={size_name(size)}",
+               size / best_of(lambda: drain(easyencrypt.encrypt(password, kdf, cipher, split(data, MiB))), repeat) / 1e6,
+               "MB/s")
+        yield (f"e2e/{name}/decrypt/size={size_name(size)}",
+               size / best_of(lambda: drain(easyencrypt.decrypt(password, split(enc, MiB))), repeat) / 1e6,
+               "MB/s")
+        yield (f"e2e/{name}/verify/size={size_name(size)}",
+               size / best_of(lambda: easyencrypt.verify(password, split(enc, MiB)), repeat) / 1e6,
+               "MB/s")
+
+
+def bench_cli(quick: bool, repeat: int) -> Iterable[Tuple[str, float, str]]:
+    size = MiB if quick else 64 * MiB
+    with tempfile.TemporaryDirectory() as tmp:
+        # enc without -c measures the ciphers and saves the result, which mustn't land in the real profile
+        env = {**os.environ, "EASYENCRYPT_PW": "hunter2", "EASYENCRYPT_PROFILE": os.path.join(tmp, "profile.json")}
+        plain, enc, dec = (os.path.join(tmp, x) for x in ["plain", "enc", "dec"])
+        with open(plain, "wb") as f:
+            f.write(os.urandom(size))
+
+        def run(*args: str):
+            subprocess.run([sys.executable, os.path.join(ROOT, "main.py"), *args], env=env, check=True,
+                           stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+
+        # wall-clock includes interpreter startup and imports, which is what a cron job pays
+        yield "cli/kdfs", best_of(lambda: run("kdfs"), repeat), "s"
+        yield (f"cli/enc/size={size_name(size)}",
+               best_of(lambda: run("enc", "-k", "scrypt:log2n=14,r=8", "-in", plain, "-out", enc), repeat), "s")
+        yield f"cli/dec/size={size_name(size)}", best_of(lambda: run("dec", "-in", enc, "-out", dec), repeat), "s"
+
+
+SUITES = {
+    "ciphers": bench_ciphers,
+    "kdfs": bench_kdfs,
+    "e2e": bench_end_to_end,
+    "cli": bench_cli,
+}
+
+# results measured in seconds are better when lower; throughput is better when higher
+LOWER_IS_BETTER = {"s"}
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> List[str]:
+    regressions = []
+    for name, res in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None or base["value"] <= 0:
+            continue
+        ratio = res["value"] / base["value"]
+        if res["unit"] in LOWER_IS_BETTER:
+            ratio = 1 / ratio if ratio > 0 else float("inf")
+        if ratio < 1 - threshold:
+            regressions.append(f"{name}: {base['value']:.4g} -> {res['value']:.4g} {res['unit']} "
+                               f"({(ratio - 1) * 100:+.1f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the easyencrypt benchmark suite.")
+    parser.add_argument("suites", nargs="*", metavar="SUITE", help=f"the suites to run. one or more of {list(SUITES)}")
+    parser.add_argument("-o", "--output", metavar="FILE", help="write the results as JSON to FILE")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag results that regressed against a saved JSON file")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="the fraction a result may regress before it is flagged (default 0.1)")
+    parser.add_argument("--repeat", type=int, default=3, help="take the best of this many runs (default 3)")
+    parser.add_argument("--quick", action="store_true", help="use small inputs and skip the sensitive kdf presets")
+    args = parser.parse_args()
+
+    names = args.suites or list(SUITES)
+    for name in names:
+        if name not in SUITES:
+            parser.error(f"Unknown suite '{name}'. Must be one of {list(SUITES)}")
+
+    results = {}
+    for name in names:
+        for key, value, unit in SUITES[name](args.quick, args.repeat):
+            results[key] = {"value": value, "unit": unit}
+            print(f"{key:<64} {value:12.4g} {unit}", flush=True)
+
+    current = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "quick": args.quick,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), current, args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r}")
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import binascii
+import struct
+from typing import Dict, Optional, Tuple
+
+import b64
+
+# the header body is either JSON, which always starts with '{', or this layout:
+#   u8 format version | u32 segment size (versions 2 and up) | kdf | cipher | extensions
+# integers are big-endian. salts and nonces are raw bytes after a u8 length.
+# extensions are (u8 tag, u16 length, value) until the end of the body, so optional fields can be added later
+JSON_START = b'{'[0]
+
+KDF_IDS = {"argon2id": 1, "argon2i": 2, "argon2d": 3, "scrypt": 4}
+CIPHER_IDS = {"aes-256-gcm": 1, "chacha20-poly1305": 2, "aes-256-ocb": 3, "xchacha20-poly1305": 4}
+COMPRESSOR_IDS = {"zlib": 1, "lzma": 2, "zstd": 3}
+SUBKEY_IDS = {"hkdf-sha256": 1}
+KEYWRAP_IDS = {"aes-256-gcm": 1}
+CHUNKING_IDS = {"gear": 1}
+
+KDF_NAMES = {v: k for k, v in KDF_IDS.items()}
+CIPHER_NAMES = {v: k for k, v in CIPHER_IDS.items()}
+COMPRESSOR_NAMES = {v: k for k, v in COMPRESSOR_IDS.items()}
+SUBKEY_NAMES = {v: k for k, v in SUBKEY_IDS.items()}
+KEYWRAP_NAMES = {v: k for k, v in KEYWRAP_IDS.items()}
+CHUNKING_NAMES = {v: k for k, v in CHUNKING_IDS.items()}
+
+TAG_SUBKEY = 1
+TAG_COMPRESSION = 2
+TAG_KEYWRAP = 3
+# zeros that let a header be rewritten in place with a shorter one
+TAG_PADDING = 4
+# the first key slot's label, and each further key slot in order
+TAG_LABEL = 5
+TAG_SLOT = 6
+TAG_CHUNKING = 7
+
+U8 = struct.Struct(">B")
+U32 = struct.Struct(">I")
+ARGON2 = struct.Struct(">BIII")
+SCRYPT = struct.Struct(">BII")
+EXTENSION = struct.Struct(">BH")
+CHUNKING = struct.Struct(">BIII")
+
+ARGON2_KEYS = {"algorithm", "version", "time_cost", "memory_cost", "parallelism", "salt"}
+SCRYPT_KEYS = {"algorithm", "log2_n", "r", "p", "salt"}
+CIPHER_KEYS = {"algorithm", "nonce"}
+SUBKEY_KEYS = {"algorithm", "salt"}
+COMPRESSION_KEYS = {"algorithm", "level"}
+KEYWRAP_KEYS = {"algorithm", "nonce", "key"}
+SLOT_KEYS = {"kdf", "keywrap"}
+CHUNKING_KEYS = {"algorithm", "min_size", "avg_size", "max_size"}
+HEADER_KEYS = {"kdf", "cipher", "version", "segment_size", "subkey", "compression", "keywrap", "label", "slots",
+               "chunking"}
+
+
+def __raw(value: str) -> Optional[bytes]:
+    raw = b64.decode(value)
+    return raw if len(raw) < 256 else None
+
+
+def __encode_kdf(kdf: Dict) -> Optional[bytes]:
+    algorithm = kdf.get("algorithm")
+    if algorithm in {"argon2id", "argon2i", "argon2d"} and kdf.keys() == ARGON2_KEYS:
+        fixed = ARGON2.pack(kdf["version"], kdf["time_cost"], kdf["memory_cost"], kdf["parallelism"])
+    elif algorithm == "scrypt" and kdf.keys() == SCRYPT_KEYS:
+        fixed = SCRYPT.pack(kdf["log2_n"], kdf["r"], kdf["p"])
+    else:
+        return None
+
+    salt = __raw(kdf["salt"])
+    if salt is None:
+        return None
+    return U8.pack(KDF_IDS[algorithm]) + fixed + U8.pack(len(salt)) + salt
+
+
+def __encode_keywrap(keywrap: Dict) -> Optional[bytes]:
+    if keywrap.keys() != KEYWRAP_KEYS or keywrap["algorithm"] not in KEYWRAP_IDS:
+        return None
+    nonce, key = __raw(keywrap["nonce"]), __raw(keywrap["key"])
+    if nonce is None or key is None:
+        return None
+    return U8.pack(KEYWRAP_IDS[keywrap["algorithm"]]) + U8.pack(len(nonce)) + nonce + U8.pack(len(key)) + key
+
+
+def __encode_label(label: str) -> Optional[bytes]:
+    raw = bytes(label, "utf-8")
+    return raw if len(raw) < 256 else None
+
+
+def __encode_slot(slot: Dict) -> Optional[bytes]:
+    # an empty label can't be told apart from none, so it is left to JSON
+    if not SLOT_KEYS <= slot.keys() <= SLOT_KEYS | {"label"} or slot.get("label") == "":
+        return None
+    label = __encode_label(slot.get("label", ""))
+    kdf, keywrap = __encode_kdf(slot["kdf"]), __encode_keywrap(slot["keywrap"])
+    if label is None or kdf is None or keywrap is None:
+        return None
+    return U8.pack(len(label)) + label + kdf + keywrap
+
+
+def encode(header: Dict) -> Optional[bytes]:
+    # anything this layout can't hold, like a plugin's algorithm or an unknown field, is left to JSON
+    try:
+        if not header.keys() <= HEADER_KEYS:
+            return None
+        cipher, subkey, compression = header["cipher"], header.get("subkey"), header.get("compression")
+        keywrap, label, slots = header.get("keywrap"), header.get("label"), header.get("slots", [])
+        chunking = header.get("chunking")
+        if cipher.keys() != CIPHER_KEYS or cipher["algorithm"] not in CIPHER_IDS:
+            return None
+        if subkey is not None and (subkey.keys() != SUBKEY_KEYS or subkey["algorithm"] not in SUBKEY_IDS):
+            return None
+        if compression is not None and (compression.keys() != COMPRESSION_KEYS or
+                                        compression["algorithm"] not in COMPRESSOR_IDS):
+            return None
+        if chunking is not None and (chunking.keys() != CHUNKING_KEYS or chunking["algorithm"] not in CHUNKING_IDS):
+            return None
+
+        version = header.get("version", 1)
+        parts = [U8.pack(version)]
+        if version >= 2:
+            parts.append(U32.pack(header["segment_size"]))
+
+        kdf = __encode_kdf(header["kdf"])
+        nonce = __raw(cipher["nonce"])
+        if kdf is None or nonce is None:
+            return None
+        parts += [kdf, U8.pack(CIPHER_IDS[cipher["algorithm"]]), U8.pack(len(nonce)), nonce]
+
+        if subkey is not None:
+            salt = __raw(subkey["salt"])
+            if salt is None:
+                return None
+            value = U8.pack(SUBKEY_IDS[subkey["algorithm"]]) + U8.pack(len(salt)) + salt
+            parts += [EXTENSION.pack(TAG_SUBKEY, len(value)), value]
+        if compression is not None:
+            value = U8.pack(COMPRESSOR_IDS[compression["algorithm"]]) + U8.pack(compression["level"])
+            parts += [EXTENSION.pack(TAG_COMPRESSION, len(value)), value]
+        if keywrap is not None:
+            value = __encode_keywrap(keywrap)
+            if value is None:
+                return None
+            parts += [EXTENSION.pack(TAG_KEYWRAP, len(value)), value]
+        if label is not None:
+            value = __encode_label(label)
+            if value is None:
+                return None
+            parts += [EXTENSION.pack(TAG_LABEL, len(value)), value]
+        for slot in slots:
+            value = __encode_slot(slot)
+            if value is None:
+                return None
+            parts += [EXTENSION.pack(TAG_SLOT, len(value)), value]
+        if chunking is not None:
+            value = CHUNKING.pack(CHUNKING_IDS[chunking["algorithm"]], chunking["min_size"], chunking["avg_size"],
+                                  chunking["max_size"])
+            parts += [EXTENSION.pack(TAG_CHUNKING, len(value)), value]
+    except (struct.error, AttributeError, KeyError, TypeError, ValueError):
+        # missing fields, or values out of range for the fixed-size fields
+        return None
+
+    return b''.join(parts)
+
+
+def padding(n: int) -> bytes:
+    if n == 0:
+        return b''
+    if not EXTENSION.size <= n < EXTENSION.size + 2 ** 16:
+        raise ValueError(f"A binary header can't be padded by {n} bytes.")
+    return EXTENSION.pack(TAG_PADDING, n - EXTENSION.size) + bytes(n - EXTENSION.size)
+
+
+def __lookup(names: Dict[int, str], n: int, what: str) -> str:
+    if n not in names:
+        raise ValueError(f"Unknown {what} id {n} in the binary header.")
+    return names[n]
+
+
+def __b64(b: bytes) -> str:
+    return binascii.b2a_base64(b, newline=False).decode("ascii")
+
+
+def __decode_kdf(body: bytes, pos: int) -> Tuple[Dict, int]:
+    algorithm = __lookup(KDF_NAMES, body[pos], "kdf")
+    pos += 1
+    if algorithm == "scrypt":
+        log2_n, r, p = SCRYPT.unpack_from(body, pos)
+        pos += SCRYPT.size
+        kdf = {"algorithm": algorithm, "log2_n": log2_n, "r": r, "p": p}
+    else:
+        argon2_version, time_cost, memory_cost, parallelism = ARGON2.unpack_from(body, pos)
+        pos += ARGON2.size
+        kdf = {"algorithm": algorithm, "version": argon2_version, "time_cost": time_cost,
+               "memory_cost": memory_cost, "parallelism": parallelism}
+    end = pos + 1 + body[pos]
+    kdf["salt"] = __b64(body[pos + 1: end])
+    return kdf, end
+
+
+def __decode_keywrap(body: bytes, pos: int) -> Tuple[Dict, int]:
+    algorithm = __lookup(KEYWRAP_NAMES, body[pos], "keywrap")
+    key_pos = pos + 2 + body[pos + 1]
+    end = key_pos + 1 + body[key_pos]
+    return {"algorithm": algorithm, "nonce": __b64(body[pos + 2: key_pos]), "key": __b64(body[key_pos + 1: end])}, end
+
+
+def decode(body: bytes) -> Dict:
+    # written as straight-line unpack_from calls since this runs once per file and json.loads is C
+    try:
+        version = body[0]
+        pos = 1
+        header = {}
+        if version >= 2:
+            header["version"] = version
+            header["segment_size"] = U32.unpack_from(body, pos)[0]
+            pos += 4
+
+        header["kdf"], end = __decode_kdf(body, pos)
+
+        algorithm = __lookup(CIPHER_NAMES, body[end], "cipher")
+        pos = end + 1
+        end = pos + 1 + body[pos]
+        header["cipher"] = {"algorithm": algorithm, "nonce": __b64(body[pos + 1: end])}
+
+        pos = end
+        while pos < len(body):
+            tag, length = EXTENSION.unpack_from(body, pos)
+            pos += EXTENSION.size
+            end = pos + length
+            if tag == TAG_SUBKEY and length >= 2 and length == 2 + body[pos + 1]:
+                header["subkey"] = {"algorithm": __lookup(SUBKEY_NAMES, body[pos], "subkey"),
+                                    "salt": __b64(body[pos + 2: end])}
+            elif tag == TAG_COMPRESSION and length == 2:
+                header["compression"] = {"algorithm": __lookup(COMPRESSOR_NAMES, body[pos], "compressor"),
+                                         "level": body[pos + 1]}
+            elif tag == TAG_KEYWRAP:
+                header["keywrap"], value_end = __decode_keywrap(body, pos)
+                if value_end != end:
+                    raise ValueError("The binary header's keywrap field is malformed.")
+            elif tag == TAG_PADDING:
+                pass
+            elif tag == TAG_LABEL:
+                header["label"] = str(body[pos: end], "utf-8")
+            elif tag == TAG_SLOT:
+                label_end = pos + 1 + body[pos]
+                kdf, value_end = __decode_kdf(body, label_end)
+                keywrap, value_end = __decode_keywrap(body, value_end)
+                if value_end != end:
+                    raise ValueError("A key slot in the binary header is malformed.")
+                slot = {"kdf": kdf, "keywrap": keywrap}
+                if label_end > pos + 1:
+                    slot["label"] = str(body[pos + 1: label_end], "utf-8")
+                header.setdefault("slots", []).append(slot)
+            elif tag == TAG_CHUNKING and length == CHUNKING.size:
+                algorithm, min_size, avg_size, max_size = CHUNKING.unpack_from(body, pos)
+                header["chunking"] = {"algorithm": __lookup(CHUNKING_NAMES, algorithm, "chunking"),
+                                      "min_size": min_size, "avg_size": avg_size, "max_size": max_size}
+            else:
+                raise ValueError(f"Unknown field {tag} in the binary header.")
+            pos = end
+    except (IndexError, struct.error):
+        raise ValueError("The binary header is truncated.")
+
+    # slices past the end come back short instead of raising
+    if pos > len(body):
+        raise ValueError("The binary header is truncated.")
+    return header
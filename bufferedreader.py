@@ -1,54 +1,216 @@
-from typing import Iterable, Union
+import mmap
+import os
+import stat
+from collections import deque
+from typing import AsyncIterable, Iterable, List, Optional, Union
 
 
-def combine(*arr: Union[bytes, Iterable[bytes]]) -> bytes:
-    def args():
-        for b in arr:
-            if isinstance(b, bytes):
-                yield b
-            else:
-                for ba in b:
-                    yield ba
-    return b"".join(args())
+def __buffer_size() -> int:
+    value = os.environ.get("EASYENCRYPT_BUFFER_SIZE")
+    if value is None:
+        return 1024 * 1024
+    if not value.isdigit() or int(value) <= 0:
+        raise ValueError(f"EASYENCRYPT_BUFFER_SIZE must be a positive number of bytes, was '{value}'.")
+    return int(value)
+
+
+# the one block size used for reading, cipher chunks and the cli's pipeline, so a single setting tunes all of them
+DEFAULT_CHUNK_SIZE = __buffer_size()
+READAHEAD = 8 * 1024 * 1024
+
+
+def map_file(path: str) -> Optional[mmap.mmap]:
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        # pipes, devices and empty files can't be mapped, so those are streamed instead
+        if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+            return None
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+    if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    return mm
 
 
 class BufferedReader:
     def __init__(self, arg: Union[bytes, Iterable[bytes], str]):
-        if isinstance(arg, str):
+        self.mmap = map_file(arg) if isinstance(arg, str) else None
+        if self.mmap is not None:
+            self.file = None
+            self.bytestream = iter([memoryview(self.mmap)])
+        elif isinstance(arg, str):
             self.file = open(arg, "rb")
-            self.bytestream, self.buf = None, None
-        elif isinstance(arg, bytes):
+            self.bytestream = None
+        elif isinstance(arg, (bytes, bytearray, memoryview)):
             self.file = None
-            self.bytestream, self.buf = iter([arg]), bytearray()
+            self.bytestream = iter([arg])
         else:
             self.file = None
-            self.bytestream, self.buf = iter(arg), bytearray()
+            self.bytestream = iter(arg)
+        # upstream chunks are kept as-is; `offset` is the read cursor into the first one
+        self.views = deque()
+        self.offset = 0
+        self.buffered = 0
         self.index = 0
+        self.bytes_copied = 0
+        self.advised = 0
 
     def __enter__(self):
         return self
 
+    def __fill(self, length: int) -> None:
+        while (length < 0 or self.buffered < length) and self.bytestream is not None:
+            try:
+                chunk = next(self.bytestream)
+            except StopIteration:
+                self.bytestream = None
+                return
+            if len(chunk) == 0:
+                continue
+            view = memoryview(chunk)
+            self.views.append(view if view.format == "B" else view.cast("B"))
+            self.buffered += len(self.views[-1])
+
+    def __take(self, length: int) -> List[memoryview]:
+        ret = []
+        while length > 0 and len(self.views) > 0:
+            head = self.views[0]
+            n = min(length, len(head) - self.offset)
+            ret.append(head[self.offset: self.offset + n] if n != len(head) else head)
+            self.offset += n
+            length -= n
+            if self.offset == len(head):
+                self.views.popleft()
+                self.offset = 0
+        taken = sum(len(x) for x in ret)
+        self.buffered -= taken
+        self.index += taken
+        if self.mmap is not None and self.index > self.advised - READAHEAD // 2:
+            self.__advise()
+        return ret
+
+    def __advise(self) -> None:
+        if not hasattr(self.mmap, "madvise"):
+            return
+        # ask the kernel to start reading the next window before the cipher gets there
+        if hasattr(mmap, "MADV_WILLNEED") and self.advised < len(self.mmap):
+            self.mmap.madvise(mmap.MADV_WILLNEED, self.advised, min(READAHEAD, len(self.mmap) - self.advised))
+        # pages well behind the cursor are dropped from our RSS; the mapping is read-only, so
+        # anything still holding a view there just faults them back in from the page cache
+        if hasattr(mmap, "MADV_DONTNEED") and self.advised >= 3 * READAHEAD:
+            self.mmap.madvise(mmap.MADV_DONTNEED, self.advised - 3 * READAHEAD, READAHEAD)
+        self.advised += READAHEAD
+
+    def __join(self, views: List[memoryview]) -> bytes:
+        if len(views) == 1 and isinstance(views[0].obj, bytes) and len(views[0]) == len(views[0].obj):
+            return views[0].obj
+        ret = b"".join(views)
+        self.bytes_copied += len(ret)
+        return ret
+
     def read(self, length: int = -1) -> bytes:
         if self.file:
             ret = self.file.read(length)
             self.index += len(ret)
             return ret
-        elif length < 0:
-            return combine(self.buf, self.bytestream)
-        else:
-            try:
-                while len(self.buf) < length and self.bytestream:
-                    self.buf.extend(next(self.bytestream))
-            except StopIteration:
-                pass
-            ret = self.buf[:length]
-            self.buf = self.buf[length:]
-            return bytes(ret)
 
-    def chunks(self, size: int = 65536) -> Iterable[bytes]:
-        while len(buf := self.read(size)) != 0:
+        self.__fill(length)
+        return self.__join(self.__take(self.buffered if length < 0 else length))
+
+    def read_view(self, length: int) -> Union[bytes, memoryview]:
+        if self.file:
+            return self.read(length)
+
+        self.__fill(length)
+        views = self.__take(length)
+        if len(views) == 1:
+            return views[0]
+        return self.__join(views)
+
+    def read1(self, length: int = DEFAULT_CHUNK_SIZE) -> Union[bytes, memoryview]:
+        if self.file:
+            return self.read(length)
+
+        self.__fill(1)
+        views = self.__take(length)
+        return views[0] if len(views) > 0 else b""
+
+    def readinto(self, buffer) -> int:
+        if self.file:
+            n = self.file.readinto(buffer)
+            self.index += n
+            return n
+
+        out = memoryview(buffer).cast("B")
+        self.__fill(len(out))
+        pos = 0
+        for view in self.__take(len(out)):
+            out[pos: pos + len(view)] = view
+            pos += len(view)
+        self.bytes_copied += pos
+        return pos
+
+    def peek(self, length: int = 1) -> Union[bytes, memoryview]:
+        if self.file:
+            return self.file.peek(length)[:length]
+
+        self.__fill(max(length, 1))
+        if len(self.views) == 0:
+            return b""
+        head = self.views[0]
+        if len(head) - self.offset >= length:
+            return head[self.offset: self.offset + length]
+
+        views, remaining = [], length + self.offset
+        for view in self.views:
+            views.append(view[:remaining])
+            remaining -= len(views[-1])
+            if remaining <= 0:
+                break
+        ret = b"".join(views)[self.offset:]
+        self.bytes_copied += len(ret)
+        return ret
+
+    def chunks(self, size: int = DEFAULT_CHUNK_SIZE) -> Iterable[Union[bytes, memoryview]]:
+        # yields whatever is contiguous upstream (up to size) so chunks are passed through without copying
+        while len(buf := self.read1(size)) != 0:
             yield buf
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.file:
             self.file.close()
+        if self.mmap is not None:
+            self.views.clear()
+            self.bytestream = None
+            try:
+                self.mmap.close()
+            except BufferError:
+                # a consumer still holds a slice of the mapping; it is unmapped once that slice is freed
+                pass
+
+
+class AsyncBufferedReader:
+    def __init__(self, arg: AsyncIterable[bytes]):
+        self.stream = arg.__aiter__()
+        self.buf = bytearray()
+        self.offset = 0
+        self.index = 0
+
+    async def read(self, length: int) -> bytes:
+        while len(self.buf) - self.offset < length and self.stream is not None:
+            try:
+                self.buf += await self.stream.__anext__()
+            except StopAsyncIteration:
+                self.stream = None
+
+        ret = bytes(self.buf[self.offset: self.offset + length])
+        self.offset += len(ret)
+        self.index += len(ret)
+        # consumed bytes are dropped once they are half the buffer, which keeps reads amortized linear
+        if self.offset > len(self.buf) // 2:
+            del self.buf[:self.offset]
+            self.offset = 0
+        return ret
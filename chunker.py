@@ -0,0 +1,109 @@
+import hashlib
+from typing import Dict, Iterable, Union
+
+from bufferedreader import BufferedReader
+
+ALGORITHM = "gear"
+DEFAULT_MIN_SIZE = 16 * 1024
+DEFAULT_AVG_SIZE = 64 * 1024
+DEFAULT_MAX_SIZE = 256 * 1024
+
+# the gear table is part of the format: changing it moves every cut point, so old chunks would stop deduplicating
+GEAR = [int.from_bytes(hashlib.sha256(bytes([b])).digest()[:8], "little") for b in range(256)]
+
+
+class Chunker:
+    def __init__(self, min_size: int = DEFAULT_MIN_SIZE, avg_size: int = DEFAULT_AVG_SIZE,
+                 max_size: int = DEFAULT_MAX_SIZE):
+        if avg_size < 2 or avg_size & (avg_size - 1) != 0 or avg_size > 2 ** 24:
+            raise ValueError(f"The average chunk size must be a power of two from 2 to 16 MiB (was {avg_size}).")
+        if not 0 < min_size <= avg_size <= max_size < 2 ** 32:
+            raise ValueError(f"The chunk sizes must satisfy 0 < min <= avg <= max < 4 GiB "
+                             f"(were {min_size}, {avg_size}, {max_size}).")
+
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+
+        # a cut point is where the low `bits` bits of the gear hash are zero, so one turns up every avg_size bytes
+        self.__bits = avg_size.bit_length() - 1
+        mask = (1 << self.__bits) - 1
+        self.__value_bytes = (self.__bits + 7) // 8
+        self.__tables = [bytes(((GEAR[b] & mask) >> (8 * i)) & 0xFF for b in range(256))
+                         for i in range(self.__value_bytes)]
+        top = self.__bits % 8
+        self.__top_mask = bytes(b & ((1 << top) - 1) for b in range(256)) if top != 0 else None
+
+        # every position's hash is a sum of `bits` table values, each shifted left by up to bits - 1, so it fits in
+        # 2 * bits bits. spacing positions that far apart in one integer lets a single multiplication compute them all
+        self.__slot = (2 * self.__bits + 7) // 8
+        self.__step = 8 * self.__slot + 1
+        self.__spread = sum(1 << (i * self.__step) for i in range(self.__bits))
+
+    def serialize(self) -> Dict[str, Union[str, int]]:
+        return {
+            "algorithm": ALGORITHM,
+            "min_size": self.min_size,
+            "avg_size": self.avg_size,
+            "max_size": self.max_size
+        }
+
+    @staticmethod
+    def deserialize(props: Dict) -> "Chunker":
+        if not isinstance(props, dict) or props.get("algorithm") != ALGORITHM:
+            raise ValueError(f"The chunking algorithm must be '{ALGORITHM}'.")
+        if not all(isinstance(props.get(k), int) for k in ["min_size", "avg_size", "max_size"]):
+            raise ValueError("The chunking dictionary must have integer 'min_size', 'avg_size' and 'max_size' fields.")
+        return Chunker(props["min_size"], props["avg_size"], props["max_size"])
+
+    def cut_map(self, data: Union[bytes, bytearray, memoryview], context: bytes = b'') -> bytes:
+        # one byte per byte of data, zero wherever the hash of the window ending there is a cut point.
+        # `context` is the data just before, since a window can reach back into it
+        context = context[-(self.__bits - 1):] if self.__bits > 1 else b''
+        data = context + bytes(data)
+        n, slot = len(data), self.__slot
+
+        spaced = bytearray(n * slot)
+        for i, table in enumerate(self.__tables):
+            spaced[i::slot] = data.translate(table)
+
+        # slot i of the product is the sum over j of value[i - j] << j; carries never cross a slot
+        hashed = (int.from_bytes(spaced, "little") * self.__spread).to_bytes(n * slot + self.__bits * slot + 1,
+                                                                             "little")
+
+        zero = 0
+        for i in range(self.__value_bytes):
+            column = hashed[i: n * slot: slot]
+            if i == self.__value_bytes - 1 and self.__top_mask is not None:
+                column = column.translate(self.__top_mask)
+            zero |= int.from_bytes(column, "little")
+        return zero.to_bytes(n, "little")[len(context):]
+
+    def split(self, input: Union[bytes, Iterable[bytes], str]) -> Iterable[bytes]:
+        pending = bytearray()
+        cuts = bytearray()
+        context = b''
+        with BufferedReader(input) as br:
+            for block in br.chunks():
+                cuts += self.cut_map(block, context)
+                pending += block
+                context = (context + bytes(block))[-self.__bits:]
+
+                # chunks are only cut once max_size bytes are buffered, so the last one's end is never guessed at
+                start = 0
+                while len(pending) - start >= self.max_size:
+                    end = self.__next_cut(cuts, start, start + self.max_size)
+                    yield bytes(pending[start: end])
+                    start = end
+                del pending[:start]
+                del cuts[:start]
+
+        start = 0
+        while start < len(pending):
+            end = self.__next_cut(cuts, start, min(start + self.max_size, len(pending)))
+            yield bytes(pending[start: end])
+            start = end
+
+    def __next_cut(self, cuts: bytearray, start: int, limit: int) -> int:
+        pos = cuts.find(0, start + self.min_size - 1, limit)
+        return limit if pos < 0 else pos + 1
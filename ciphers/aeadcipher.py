@@ -1,52 +1,250 @@
 from abc import ABC, abstractmethod
+import hashlib
+import hmac
 
 from bufferedreader import BufferedReader
 from ciphers.cipher import Cipher
-from typing import Any, Iterable, Union
+from hooks import Hooks, resolve_hooks, timed
+from securerandom import rand_bytes
+from typing import Any, Iterable, Optional, Tuple, Union
+
+
+# verifying decrypts this much at a time into a reused buffer, so no plaintext is kept or allocated
+VERIFY_PIECE = 64 * 1024
+
+
+class DecryptingVerifier:
+    # checks a tag the way decrypting does, throwing the plaintext away
+    def __init__(self, decryptor: Any):
+        self.decryptor = decryptor
+        self.scratch = None
+
+    def update(self, aad: bytes) -> None:
+        self.decryptor.update(aad)
+
+    def absorb(self, ct: Union[bytes, memoryview]) -> None:
+        if self.scratch is None:
+            self.scratch = memoryview(bytearray(VERIFY_PIECE))
+        ct = memoryview(ct)
+        for i in range(0, len(ct), VERIFY_PIECE):
+            piece = ct[i: i + VERIFY_PIECE]
+            self.decryptor.decrypt(piece, output=self.scratch[:len(piece)])
+
+    def verify(self, tag: bytes) -> None:
+        self.decryptor.verify(tag)
 
 
 class AeadCipher(Cipher, ABC):
     @abstractmethod
-    def _get_encryptor(self, key: bytes) -> Any:
+    def _get_encryptor(self, key: bytes, nonce: Optional[bytes] = None) -> Any:
         pass
 
     @abstractmethod
-    def _get_decryptor(self, key: bytes) -> Any:
+    def _get_decryptor(self, key: bytes, nonce: Optional[bytes] = None) -> Any:
         pass
 
     @abstractmethod
     def _mac_len(self) -> int:
         pass
 
-    def encrypt(self, key: bytes, input: Union[bytes, Iterable[bytes], str]) -> Iterable[bytes]:
+    def mac_length(self) -> int:
+        return self._mac_len()
+
+    def _flush_encryptor(self, encryptor: Any) -> bytes:
+        # modes that hold back a partial block return it here, before the tag is taken
+        return b''
+
+    def _flush_decryptor(self, decryptor: Any) -> bytes:
+        return b''
+
+    def _get_verifier(self, key: bytes, nonce: Optional[bytes] = None) -> Any:
+        return DecryptingVerifier(self._get_decryptor(key, nonce))
+
+    def __check(self, verifier: Any, data: Union[bytes, memoryview], error: str) -> int:
+        ml = self._mac_len()
+        if len(data) < ml:
+            raise ValueError("This segment is not long enough to hold an authentication tag.")
+        data = memoryview(data)
+        verifier.absorb(data[:-ml])
+        try:
+            verifier.verify(bytes(data[-ml:]))
+        except ValueError:
+            raise ValueError(error)
+        return len(data) - ml
+
+    def _segment_nonce(self, index: int, last: bool) -> bytes:
+        # STREAM-style: the segment counter and final-segment flag are xored into the last 5 bytes of the nonce
+        if len(self.nonce) < 5:
+            raise ValueError("The nonce must be at least 5 bytes long to encrypt segments.")
+        if not 0 <= index < 2 ** 32:
+            raise ValueError(f"Segment index {index} is out of range.")
+
+        suffix = index.to_bytes(4, "big") + (b'\x01' if last else b'\x00')
+        return self.nonce[:-5] + bytes(a ^ b for a, b in zip(self.nonce[-5:], suffix))
+
+    def encrypt_segment(self, key: bytes, index: int, last: bool, data: bytes) -> bytes:
+        encryptor = self._get_encryptor(key, self._segment_nonce(index, last))
+        ct, tag = encryptor.encrypt_and_digest(data)
+        assert len(tag) == self._mac_len()
+        return ct + tag
+
+    def decrypt_segment(self, key: bytes, index: int, last: bool, data: bytes) -> bytes:
+        ml = self._mac_len()
+        if len(data) < ml:
+            raise ValueError("This segment is not long enough to hold an authentication tag.")
+
+        decryptor = self._get_decryptor(key, self._segment_nonce(index, last))
+        try:
+            return decryptor.decrypt_and_verify(data[:-ml], data[-ml:])
+        except ValueError:
+            raise ValueError(f"Segment {index} failed authentication. The data is corrupt, truncated, or the password is wrong.")
+
+    def verify_segment(self, key: bytes, index: int, last: bool, data: bytes) -> int:
+        return self.__check(self._get_verifier(key, self._segment_nonce(index, last)), data,
+                            f"Segment {index} failed authentication. The data is corrupt, truncated, or the password is wrong.")
+
+    def _append_nonce_length(self) -> int:
+        return 12
+
+    def append_overhead(self) -> int:
+        return self._append_nonce_length() + self._mac_len()
+
+    @staticmethod
+    def __append_aad(index: int, last: bool) -> bytes:
+        if not 0 <= index < 2 ** 64:
+            raise ValueError(f"Segment index {index} is out of range.")
+        return index.to_bytes(8, "big") + (b'\x01' if last else b'\x00')
+
+    def encrypt_appendable_segment(self, key: bytes, index: int, last: bool, data: bytes) -> bytes:
+        # an append rewrites the last segment, so a nonce derived from the index would be reused. instead each
+        # segment carries a random nonce, and the index and final flag are authenticated as associated data
+        nonce = rand_bytes(self._append_nonce_length())
+        encryptor = self._get_encryptor(key, nonce)
+        encryptor.update(self.__append_aad(index, last))
+        ct, tag = encryptor.encrypt_and_digest(data)
+        return nonce + ct + tag
+
+    def decrypt_appendable_segment(self, key: bytes, index: int, last: bool, data: bytes) -> bytes:
+        nl, ml = self._append_nonce_length(), self._mac_len()
+        if len(data) < nl + ml:
+            raise ValueError("This segment is not long enough to hold a nonce and an authentication tag.")
+
+        decryptor = self._get_decryptor(key, bytes(data[:nl]))
+        decryptor.update(self.__append_aad(index, last))
+        try:
+            return decryptor.decrypt_and_verify(data[nl:-ml], data[-ml:])
+        except ValueError:
+            raise ValueError(f"Segment {index} failed authentication. The data is corrupt, truncated, or the password is wrong.")
+
+    def verify_appendable_segment(self, key: bytes, index: int, last: bool, data: bytes) -> int:
+        nl = self._append_nonce_length()
+        if len(data) < nl:
+            raise ValueError("This segment is not long enough to hold a nonce and an authentication tag.")
+
+        verifier = self._get_verifier(key, bytes(data[:nl]))
+        verifier.update(self.__append_aad(index, last))
+        return self.__check(verifier, memoryview(data)[nl:],
+                            f"Segment {index} failed authentication. The data is corrupt, truncated, or the password is wrong.")
+
+    def __chunk_key(self, key: bytes, siv: bytes) -> Tuple[bytes, bytes]:
+        # SIV-style: each chunk gets its own key, derived from the MAC of its plaintext. equal chunks encrypt to equal
+        # bytes, and different chunks never share a key, so a fixed nonce is never reused with one
+        chunk_key = hmac.new(key, siv, hashlib.sha256).digest()
+        if self.key_length() > len(chunk_key):
+            raise ValueError(f"Chunk keys are {len(chunk_key)} bytes, but the cipher needs {self.key_length()}.")
+        return chunk_key[:self.key_length()], bytes(self._append_nonce_length())
+
+    def encrypt_chunk(self, key: bytes, siv: bytes, data: bytes) -> bytes:
+        ct, tag = self._get_encryptor(*self.__chunk_key(key, siv)).encrypt_and_digest(data)
+        return ct + tag
+
+    def decrypt_chunk(self, key: bytes, siv: bytes, data: bytes) -> bytes:
+        ml = self._mac_len()
+        if len(data) < ml:
+            raise ValueError("This chunk is not long enough to hold an authentication tag.")
+        try:
+            return self._get_decryptor(*self.__chunk_key(key, siv)).decrypt_and_verify(data[:-ml], data[-ml:])
+        except ValueError:
+            raise ValueError("A chunk failed authentication. The data is corrupt or the password is wrong.")
+
+    def verify_chunk(self, key: bytes, siv: bytes, data: bytes) -> int:
+        return self.__check(self._get_verifier(*self.__chunk_key(key, siv)), data,
+                            "A chunk failed authentication. The data is corrupt or the password is wrong.")
+
+    def encrypt(self, key: bytes, input: Union[bytes, Iterable[bytes], str],
+                hooks: Optional[Hooks] = None) -> Iterable[bytes]:
         encryptor = self._get_encryptor(key)
+        # the timing wrapper is only paid for when someone is listening
+        hooks = resolve_hooks(hooks)
+        encrypt = encryptor.encrypt if hooks is None else lambda b: timed(hooks, "chunk", len(b), encryptor.encrypt, b)
 
         with BufferedReader(input) as br:
-            for block in br.chunks(16 * 1024):
-                yield encryptor.encrypt(block)
+            for block in br.chunks():
+                yield encrypt(block)
+            rest = self._flush_encryptor(encryptor)
+            if len(rest) > 0:
+                yield rest
             dig = encryptor.digest()
             assert len(dig) == self._mac_len()
             yield dig
 
-    def decrypt(self, key: bytes, input: Union[bytes, Iterable[bytes], str]) -> Iterable[bytes]:
+    def decrypt(self, key: bytes, input: Union[bytes, Iterable[bytes], str],
+                hooks: Optional[Hooks] = None) -> Iterable[bytes]:
         decryptor = self._get_decryptor(key)
+        hooks = resolve_hooks(hooks)
+        decrypt = decryptor.decrypt if hooks is None else lambda b: timed(hooks, "chunk", len(b), decryptor.decrypt, b)
         ml = self._mac_len()
 
-        buf = b''
+        # the last `ml` bytes seen so far might be the tag, so they are held back until more data arrives
+        tail = b''
         with BufferedReader(input) as br:
             for block in br.chunks():
-                if len(block) < ml:
-                    buf += block
-                    if len(block) >= 2 * ml:
-                        yield decryptor.decrypt(buf[:-ml])
-                        buf = buf[-ml:]
+                if len(block) >= ml:
+                    if len(tail) > 0:
+                        yield decrypt(tail)
+                    if len(block) > ml:
+                        yield decrypt(block[:-ml])
+                    tail = bytes(block[-ml:])
                 else:
-                    yield decryptor.decrypt(buf)
-                    buf = block
+                    tail += block
+                    if len(tail) > ml:
+                        yield decrypt(tail[:-ml])
+                        tail = tail[-ml:]
 
-        if len(buf) < ml:
+        if len(tail) < ml:
             raise ValueError("This encrypted data is not long enough to hold an authentication tag.")
 
-        rem, tag = buf[:-ml], buf[-ml:]
-        yield decryptor.decrypt(rem)
-        decryptor.verify(tag)
+        rest = self._flush_decryptor(decryptor)
+        decryptor.verify(tail)
+        if len(rest) > 0:
+            yield rest
+
+    def verify(self, key: bytes, input: Union[bytes, Iterable[bytes], str],
+               hooks: Optional[Hooks] = None) -> int:
+        verifier = self._get_verifier(key)
+        hooks = resolve_hooks(hooks)
+        absorb = verifier.absorb if hooks is None else lambda b: timed(hooks, "chunk", len(b), verifier.absorb, b)
+        ml = self._mac_len()
+
+        # like decrypt, the last `ml` bytes seen are held back in case they're the tag
+        tail, n = b'', 0
+        with BufferedReader(input) as br:
+            for block in br.chunks():
+                if len(block) >= ml:
+                    if len(tail) > 0:
+                        absorb(tail)
+                    if len(block) > ml:
+                        absorb(memoryview(block)[:-ml])
+                    n += len(tail) + len(block) - ml
+                    tail = bytes(block[-ml:])
+                else:
+                    tail += block
+                    if len(tail) > ml:
+                        absorb(tail[:-ml])
+                        n += len(tail) - ml
+                        tail = tail[-ml:]
+
+        if len(tail) < ml:
+            raise ValueError("This encrypted data is not long enough to hold an authentication tag.")
+        verifier.verify(tail)
+        return n
@@ -13,11 +13,11 @@ class Aes256GcmCipher(AeadCipher):
             nonce = rand_unique_bytes(32)
         self.nonce = nonce
 
-    def _get_encryptor(self, key: bytes) -> Any:
-        return AES.new(key, AES.MODE_GCM, nonce=self.nonce, mac_len=self._mac_len())
+    def _get_encryptor(self, key: bytes, nonce: Optional[bytes] = None) -> Any:
+        return AES.new(key, AES.MODE_GCM, nonce=nonce if nonce is not None else self.nonce, mac_len=self._mac_len())
 
-    def _get_decryptor(self, key: bytes) -> Any:
-        return self._get_encryptor(key)
+    def _get_decryptor(self, key: bytes, nonce: Optional[bytes] = None) -> Any:
+        return self._get_encryptor(key, nonce)
 
     def _mac_len(self) -> int:
         return 16
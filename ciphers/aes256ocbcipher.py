@@ -0,0 +1,72 @@
+from typing import Union, Dict, List, Any, Optional
+from Crypto.Cipher import AES
+
+import b64
+from ciphers.aeadcipher import AeadCipher, DecryptingVerifier, VERIFY_PIECE
+
+from securerandom import rand_unique_bytes
+
+
+class OcbVerifier(DecryptingVerifier):
+    # ocb can't decrypt into a buffer, and holds back a partial block until it's flushed
+    def absorb(self, ct: Union[bytes, memoryview]) -> None:
+        ct = memoryview(ct)
+        for i in range(0, len(ct), VERIFY_PIECE):
+            self.decryptor.decrypt(ct[i: i + VERIFY_PIECE])
+
+    def verify(self, tag: bytes) -> None:
+        self.decryptor.decrypt()
+        self.decryptor.verify(tag)
+
+
+class Aes256OcbCipher(AeadCipher):
+    def __init__(self, nonce: Optional[bytes] = None):
+        if nonce is None:
+            nonce = rand_unique_bytes(15)
+        if not 1 <= len(nonce) <= 15:
+            raise ValueError("Nonce must be 1 to 15 bytes.")
+        self.nonce = nonce
+
+    def _get_encryptor(self, key: bytes, nonce: Optional[bytes] = None) -> Any:
+        return AES.new(key, AES.MODE_OCB, nonce=nonce if nonce is not None else self.nonce, mac_len=self._mac_len())
+
+    def _get_decryptor(self, key: bytes, nonce: Optional[bytes] = None) -> Any:
+        return self._get_encryptor(key, nonce)
+
+    def _get_verifier(self, key: bytes, nonce: Optional[bytes] = None) -> Any:
+        return OcbVerifier(self._get_decryptor(key, nonce))
+
+    def _flush_encryptor(self, encryptor: Any) -> bytes:
+        return encryptor.encrypt()
+
+    def _flush_decryptor(self, decryptor: Any) -> bytes:
+        return decryptor.decrypt()
+
+    def _mac_len(self) -> int:
+        return 16
+
+    def key_length(self) -> int:
+        return 32
+
+    def serialize(self) -> Dict[str, Union[str, int, bool, None, Dict, List]]:
+        return {
+            "algorithm": "aes-256-ocb",
+            "nonce": b64.encode(self.nonce)
+        }
+
+    @staticmethod
+    def deserialize(props: Dict[str, Union[str, int, bool, None, Dict, List]]) -> "Aes256OcbCipher":
+        ret = Aes256OcbCipher()
+
+        base_keys = set(ret.serialize().keys())
+        if not base_keys.issubset(props.keys()):
+            raise ValueError(f"The properties dict is missing required keys {base_keys - props.keys()}")
+
+        if props["algorithm"] != ret.serialize()["algorithm"]:
+            raise ValueError(f"Expected an algorithm field of 'aes-256-ocb'. Got '{props['algorithm']}'.")
+
+        ret.nonce = b64.decode(props["nonce"])
+        if not 1 <= len(ret.nonce) <= 15:
+            raise ValueError("Decoded nonce must be 1 to 15 bytes")
+
+        return ret
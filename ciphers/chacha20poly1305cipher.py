@@ -1,11 +1,42 @@
+import struct
 from typing import Any, Dict, List, Optional, Union
 import b64
 
 from ciphers.aeadcipher import AeadCipher
-from Crypto.Cipher import ChaCha20_Poly1305
+from Crypto.Cipher import ChaCha20, ChaCha20_Poly1305
+from Crypto.Hash import Poly1305
 from securerandom import rand_unique_bytes
 
 
+class Poly1305Verifier:
+    # the tag is a Poly1305 MAC of the associated data and ciphertext (RFC 8439), so it can be checked without
+    # running ChaCha20 over the data
+    def __init__(self, key: bytes, nonce: bytes):
+        self.mac = Poly1305.new(key=key, cipher=ChaCha20, nonce=nonce)
+        self.aad_length = 0
+        self.ct_length = None
+
+    @staticmethod
+    def __pad(n: int) -> bytes:
+        return bytes(-n % 16)
+
+    def update(self, aad: bytes) -> None:
+        self.mac.update(aad)
+        self.aad_length += len(aad)
+
+    def absorb(self, ct: Union[bytes, memoryview]) -> None:
+        if self.ct_length is None:
+            self.mac.update(self.__pad(self.aad_length))
+            self.ct_length = 0
+        self.mac.update(ct)
+        self.ct_length += len(ct)
+
+    def verify(self, tag: bytes) -> None:
+        self.absorb(b'')
+        self.mac.update(self.__pad(self.ct_length) + struct.pack("<QQ", self.aad_length, self.ct_length))
+        self.mac.verify(tag)
+
+
 class ChaCha20Poly1305Cipher(AeadCipher):
     def __init__(self, nonce: Optional[bytes] = None):
         if nonce is None:
@@ -14,11 +45,14 @@ class ChaCha20Poly1305Cipher(AeadCipher):
             raise ValueError("Nonce must be 12 bytes.")
         self.nonce = nonce
 
-    def _get_encryptor(self, key: bytes) -> Any:
-        return ChaCha20_Poly1305.new(key=key, nonce=self.nonce)
+    def _get_encryptor(self, key: bytes, nonce: Optional[bytes] = None) -> Any:
+        return ChaCha20_Poly1305.new(key=key, nonce=nonce if nonce is not None else self.nonce)
+
+    def _get_decryptor(self, key: bytes, nonce: Optional[bytes] = None) -> Any:
+        return self._get_encryptor(key, nonce)
 
-    def _get_decryptor(self, key: bytes) -> Any:
-        return self._get_encryptor(key)
+    def _get_verifier(self, key: bytes, nonce: Optional[bytes] = None) -> Any:
+        return Poly1305Verifier(key, nonce if nonce is not None else self.nonce)
 
     def _mac_len(self) -> int:
         return 16
@@ -1,13 +1,57 @@
 from abc import ABC, abstractmethod
-from typing import Iterable, Union, Dict, List
+from typing import Iterable, Union, Dict, List, Optional
+
+from hooks import Hooks
 
 class Cipher(ABC):
     @abstractmethod
-    def encrypt(self, key: bytes, input: Union[bytes, Iterable[bytes], str]) -> Iterable[bytes]:
+    def encrypt(self, key: bytes, input: Union[bytes, Iterable[bytes], str],
+                hooks: Optional[Hooks] = None) -> Iterable[bytes]:
+        pass
+
+    @abstractmethod
+    def decrypt(self, key: bytes, input: Union[bytes, Iterable[bytes], str],
+                hooks: Optional[Hooks] = None) -> Iterable[bytes]:
+        pass
+
+    @abstractmethod
+    def encrypt_segment(self, key: bytes, index: int, last: bool, data: bytes) -> bytes:
+        pass
+
+    @abstractmethod
+    def decrypt_segment(self, key: bytes, index: int, last: bool, data: bytes) -> bytes:
         pass
 
+    def encrypt_appendable_segment(self, key: bytes, index: int, last: bool, data: bytes) -> bytes:
+        raise ValueError(f"The {self.serialize().get('algorithm')} cipher can't write appendable files.")
+
+    def decrypt_appendable_segment(self, key: bytes, index: int, last: bool, data: bytes) -> bytes:
+        raise ValueError(f"The {self.serialize().get('algorithm')} cipher can't read appendable files.")
+
+    def append_overhead(self) -> int:
+        raise ValueError(f"The {self.serialize().get('algorithm')} cipher can't read appendable files.")
+
+    def encrypt_chunk(self, key: bytes, siv: bytes, data: bytes) -> bytes:
+        raise ValueError(f"The {self.serialize().get('algorithm')} cipher can't write chunked files.")
+
+    def decrypt_chunk(self, key: bytes, siv: bytes, data: bytes) -> bytes:
+        raise ValueError(f"The {self.serialize().get('algorithm')} cipher can't read chunked files.")
+
+    # checking a file's tags without keeping its plaintext. ciphers that can't do better decrypt and discard
+    def verify(self, key: bytes, input: Union[bytes, Iterable[bytes], str], hooks: Optional[Hooks] = None) -> int:
+        return sum(len(b) for b in self.decrypt(key, input, hooks))
+
+    def verify_segment(self, key: bytes, index: int, last: bool, data: bytes) -> int:
+        return len(self.decrypt_segment(key, index, last, data))
+
+    def verify_appendable_segment(self, key: bytes, index: int, last: bool, data: bytes) -> int:
+        return len(self.decrypt_appendable_segment(key, index, last, data))
+
+    def verify_chunk(self, key: bytes, siv: bytes, data: bytes) -> int:
+        return len(self.decrypt_chunk(key, siv, data))
+
     @abstractmethod
-    def decrypt(self, key: bytes, input: Union[bytes, Iterable[bytes], str]) -> Iterable[bytes]:
+    def mac_length(self) -> int:
         pass
 
     @abstractmethod
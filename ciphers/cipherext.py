@@ -1,16 +1,25 @@
-import re
-
-from ciphers.aes256gcmcipher import Aes256GcmCipher
-from ciphers.chacha20poly1305cipher import ChaCha20Poly1305Cipher
 from ciphers.cipher import Cipher
+from registry import Registry
 from securerandom import rand_unique_bytes
 from typing import Dict, Iterable, List, Union, Optional, Tuple
+import hostprofile
 import log
+import os
+import platform
 import sys
+import time
 import b64
 
+CIPHER_ENV = "EASYENCRYPT_CIPHER"
+# the ciphers default_cipher() picks from. both are safe; which is faster depends on the cpu having aes instructions
+CANDIDATES = ["aes-256-gcm", "chacha20-poly1305"]
+BENCH_SEGMENT_SIZE = 1024 * 1024
+BENCH_SECONDS = 0.1
+
+
+def __parse_aes256gcm(name: str, params: List[Tuple[str, Optional[str]]]) -> Cipher:
+    from ciphers.aes256gcmcipher import Aes256GcmCipher
 
-def __parse_aes256gcm(name: str, params: List[Tuple[str, Optional[str]]]) -> Aes256GcmCipher:
     ret = Aes256GcmCipher()
 
     if name not in {"aes256", "aes256gcm", "aes-256", "aes-256-gcm", "aes256-gcm"}:
@@ -21,7 +30,7 @@ def __parse_aes256gcm(name: str, params: List[Tuple[str, Optional[str]]]) -> Aes
             if value is None:
                 value = ''
             ret.nonce = b64.decode(value)
-        if key in {"iv-len", "nonce-len"}:
+        elif key in {"iv-len", "nonce-len"}:
             if value is None:
                 log.warning(f"No value given for key '{key}'.")
             iint = int(value)
@@ -32,7 +41,9 @@ def __parse_aes256gcm(name: str, params: List[Tuple[str, Optional[str]]]) -> Aes
     return ret
 
 
-def __parse_chacha20(name: str, params: List[Tuple[str, Optional[str]]]) -> ChaCha20Poly1305Cipher:
+def __parse_chacha20(name: str, params: List[Tuple[str, Optional[str]]]) -> Cipher:
+    from ciphers.chacha20poly1305cipher import ChaCha20Poly1305Cipher
+
     ret = ChaCha20Poly1305Cipher()
 
     if name not in {"chacha20poly1305", "chacha20-poly1305"}:
@@ -53,44 +64,136 @@ def __parse_chacha20(name: str, params: List[Tuple[str, Optional[str]]]) -> ChaC
     return ret
 
 
-__cipher_switcher = {
-    "aes256": (Aes256GcmCipher.deserialize, __parse_aes256gcm),
-    "aes256gcm": (Aes256GcmCipher.deserialize, __parse_aes256gcm),
-    "aes-256": (Aes256GcmCipher.deserialize, __parse_aes256gcm),
-    "aes-256-gcm": (Aes256GcmCipher.deserialize, __parse_aes256gcm),
-    "aes256-gcm": (Aes256GcmCipher.deserialize, __parse_aes256gcm),
-    "chacha20-poly1305": (ChaCha20Poly1305Cipher.deserialize, __parse_chacha20),
-    "chacha20poly1305": (ChaCha20Poly1305Cipher.deserialize, __parse_chacha20),
-}
+def __parse_aes256ocb(name: str, params: List[Tuple[str, Optional[str]]]) -> Cipher:
+    from ciphers.aes256ocbcipher import Aes256OcbCipher
+
+    ret = Aes256OcbCipher()
+
+    if name not in {"aes256ocb", "aes-256-ocb", "aes256-ocb"}:
+        raise ValueError(f"Given name '{name}' is not aes-256-ocb")
+
+    for key, value in params:
+        if key in {"iv", "nonce"}:
+            ret = Aes256OcbCipher(b64.decode(value if value is not None else ''))
+        elif key in {"iv-len", "nonce-len"}:
+            if value is None:
+                raise ValueError(f"No value given for key '{key}'.")
+            ret = Aes256OcbCipher(rand_unique_bytes(int(value)))
+        else:
+            log.warning(f"Unrecognized key '{key}' in params string.")
+
+    return ret
+
+
+def __parse_xchacha20(name: str, params: List[Tuple[str, Optional[str]]]) -> Cipher:
+    from ciphers.xchacha20poly1305cipher import XChaCha20Poly1305Cipher
+
+    ret = XChaCha20Poly1305Cipher()
+
+    if name not in {"xchacha20poly1305", "xchacha20-poly1305"}:
+        raise ValueError(f"Given name '{name}' is not xchacha20-poly1305")
+
+    for key, value in params:
+        if key in {"iv", "nonce"}:
+            ret = XChaCha20Poly1305Cipher(b64.decode(value if value is not None else ''))
+        else:
+            log.warning(f"Unrecognized key '{key}' in params string.")
+
+    return ret
+
+
+# classes are named by "module:attr" so listing or parsing one cipher doesn't import every crypto backend
+registry = Registry("cipher", "easyencrypt.ciphers")
+registry.register(["aes256", "aes256gcm", "aes-256", "aes-256-gcm", "aes256-gcm"],
+                  "ciphers.aes256gcmcipher:Aes256GcmCipher.deserialize", __parse_aes256gcm)
+registry.register(["chacha20-poly1305", "chacha20poly1305"],
+                  "ciphers.chacha20poly1305cipher:ChaCha20Poly1305Cipher.deserialize", __parse_chacha20)
+registry.register(["aes-256-ocb", "aes256ocb", "aes256-ocb"],
+                  "ciphers.aes256ocbcipher:Aes256OcbCipher.deserialize", __parse_aes256ocb)
+registry.register(["xchacha20-poly1305", "xchacha20poly1305"],
+                  "ciphers.xchacha20poly1305cipher:XChaCha20Poly1305Cipher.deserialize", __parse_xchacha20)
 
 
 def supported_ciphers() -> Iterable[str]:
-    return __cipher_switcher.keys()
+    return registry.names()
 
 
-def default_cipher() -> Cipher:
-    return Aes256GcmCipher()
+# the cpu flags that decide which cipher is faster: aes and carry-less multiply instructions, and vector widths
+CPU_FEATURES = {"aes", "pclmulqdq", "vaes", "vpclmulqdq", "avx", "avx2", "avx512f", "asimd", "neon", "pmull"}
 
 
-def deserialize(props: Dict[str, Union[str, int, bool, None, Dict, List]]):
-    if "algorithm" not in props:
-        raise ValueError("Cipher dictionary must include 'algorithm' field.")
+def cpu() -> str:
+    # what the profile is keyed on. machines with the same architecture and features measure the same, so every
+    # container or ci runner on them shares one entry, whatever its hostname
+    features = set()
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name.strip() in {"flags", "Features"}:
+                    features.update(value.split())
+    except OSError:
+        pass
+    return ",".join([platform.machine()] + sorted(features & CPU_FEATURES))
 
-    if props["algorithm"] not in supported_ciphers():
-        raise ValueError(f"The given cipher '{props['algorithm']}' is not supported.")
 
-    return __cipher_switcher[props["algorithm"]][0](props)
+def __time_cipher(cipher: Cipher, seconds: float) -> float:
+    key = bytes(cipher.key_length())
+    data = bytes(BENCH_SEGMENT_SIZE)
+    cipher.encrypt_segment(key, 0, False, data)
 
+    index, start = 1, time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < seconds:
+        cipher.encrypt_segment(key, index, False, data)
+        index += 1
+    return (index - 1) * len(data) / elapsed / 1e6
+
+
+def benchmark(seconds: float = BENCH_SECONDS) -> Dict[str, float]:
+    # MB/s of each candidate encrypting default-sized segments, which is where encryption spends its time
+    if seconds <= 0:
+        raise ValueError(f"The benchmark time must be positive (was {seconds})")
+    return {name: __time_cipher(from_option_string(name), seconds) for name in CANDIDATES}
 
-def from_option_string(s: str) -> Cipher:
-    s = s.strip().lower()
 
-    name = re.sub(r":.*$", "", s)
-    params = re.sub(r"^.*?:", "", s) if ":" in s else ""
+def fastest(results: Dict[str, float]) -> str:
+    return max(CANDIDATES, key=lambda name: results.get(name, 0.0))
 
-    par = [tuple(z) if len(z) == 2 else (z[0], None) for z in map(lambda x: x.strip().split("=") if "=" in x else [], params.split(",") if "," in params else [])]
 
-    if name not in __cipher_switcher:
-        raise ValueError(f"The given kdf algorithm '{name}' is not supported.")
+def save_profile(results: Dict[str, float]) -> str:
+    # only the per-cpu entries are kept; anything else under "cipher" is left over from an older layout
+    profile = {k: v for k, v in (hostprofile.get("cipher") or {}).items() if isinstance(v, dict) and "algorithm" in v}
+    profile[cpu()] = {"algorithm": fastest(results), "mb_per_s": results}
+    return hostprofile.put("cipher", profile)
 
-    return __cipher_switcher[name][1](name, par)
+
+def default_cipher(measure: bool = False) -> Cipher:
+    # $EASYENCRYPT_CIPHER, then what was measured on this kind of cpu. without a measurement, the cli measures and
+    # saves one, while library callers get aes-256-gcm and nothing is written
+    env = os.environ.get(CIPHER_ENV)
+    if env:
+        return from_option_string(env)
+
+    entry = (hostprofile.get("cipher") or {}).get(cpu())
+    if isinstance(entry, dict) and entry.get("algorithm") in CANDIDATES:
+        return from_option_string(entry["algorithm"])
+
+    if not measure:
+        from ciphers.aes256gcmcipher import Aes256GcmCipher
+
+        return Aes256GcmCipher()
+
+    results = benchmark()
+    try:
+        save_profile(results)
+    except OSError as e:
+        log.warning(f"Couldn't save the cipher benchmark to '{hostprofile.path()}': {e}\n")
+    return from_option_string(fastest(results))
+
+
+def deserialize(props: Dict[str, Union[str, int, bool, None, Dict, List]]) -> Cipher:
+    return registry.deserialize(props)
+
+
+def from_option_string(s: str) -> Cipher:
+    return registry.from_option_string(s)
@@ -0,0 +1,109 @@
+import struct
+from typing import Any, Dict, List, Optional, Union
+import b64
+
+from ciphers.aeadcipher import AeadCipher, DecryptingVerifier
+from ciphers.chacha20poly1305cipher import Poly1305Verifier
+from Crypto.Cipher import ChaCha20_Poly1305
+from securerandom import rand_bytes
+
+MASK = 0xFFFFFFFF
+
+
+def __quarter_round(x: List[int], a: int, b: int, c: int, d: int) -> None:
+    x[a] = (x[a] + x[b]) & MASK
+    x[d] ^= x[a]
+    x[d] = ((x[d] << 16) | (x[d] >> 16)) & MASK
+    x[c] = (x[c] + x[d]) & MASK
+    x[b] ^= x[c]
+    x[b] = ((x[b] << 12) | (x[b] >> 20)) & MASK
+    x[a] = (x[a] + x[b]) & MASK
+    x[d] ^= x[a]
+    x[d] = ((x[d] << 8) | (x[d] >> 24)) & MASK
+    x[c] = (x[c] + x[d]) & MASK
+    x[b] ^= x[c]
+    x[b] = ((x[b] << 7) | (x[b] >> 25)) & MASK
+
+
+def hchacha20(key: bytes, nonce: bytes) -> bytes:
+    # draft-irtf-cfrg-xchacha section 2.2: the chacha20 rounds over the key and a 16 byte nonce, keeping the first
+    # and last rows without the final addition
+    if len(key) != 32 or len(nonce) != 16:
+        raise ValueError("HChaCha20 takes a 32 byte key and a 16 byte nonce.")
+    x = list(struct.unpack("<4I", b"expand 32-byte k") + struct.unpack("<8I", key) + struct.unpack("<4I", nonce))
+    for _ in range(10):
+        __quarter_round(x, 0, 4, 8, 12)
+        __quarter_round(x, 1, 5, 9, 13)
+        __quarter_round(x, 2, 6, 10, 14)
+        __quarter_round(x, 3, 7, 11, 15)
+        __quarter_round(x, 0, 5, 10, 15)
+        __quarter_round(x, 1, 6, 11, 12)
+        __quarter_round(x, 2, 7, 8, 13)
+        __quarter_round(x, 3, 4, 9, 14)
+    return struct.pack("<8I", *x[:4], *x[12:])
+
+
+class XChaCha20Poly1305Cipher(AeadCipher):
+    # 24 byte nonces are long enough to pick at random without worrying about collisions
+    def __init__(self, nonce: Optional[bytes] = None):
+        if nonce is None:
+            nonce = rand_bytes(24)
+        if len(nonce) != 24:
+            raise ValueError("Nonce must be 24 bytes.")
+        self.nonce = nonce
+        # (key, nonce prefix, subkey or None) of the last verifier, see _get_verifier
+        self.__subkey = None
+
+    def _get_encryptor(self, key: bytes, nonce: Optional[bytes] = None) -> Any:
+        return ChaCha20_Poly1305.new(key=key, nonce=nonce if nonce is not None else self.nonce)
+
+    def _get_decryptor(self, key: bytes, nonce: Optional[bytes] = None) -> Any:
+        return self._get_encryptor(key, nonce)
+
+    def _get_verifier(self, key: bytes, nonce: Optional[bytes] = None) -> Any:
+        # xchacha20-poly1305 is chacha20-poly1305 under a subkey hashed from the key and the first 16 nonce bytes.
+        # hchacha20 in python costs more than decrypting a segment, so it's only worth it when the subkey gets reused:
+        # the segments of one stream share it, while appendable segments and chunks each have their own. the first
+        # verifier for a key and prefix decrypts; the second works out the subkey and keeps it for the rest
+        nonce = nonce if nonce is not None else self.nonce
+        last = self.__subkey
+        if last is None or last[0] != key or last[1] != nonce[:16]:
+            self.__subkey = (key, nonce[:16], None)
+            return DecryptingVerifier(self._get_decryptor(key, nonce))
+        subkey = last[2]
+        if subkey is None:
+            subkey = hchacha20(key, nonce[:16])
+            self.__subkey = (key, nonce[:16], subkey)
+        return Poly1305Verifier(subkey, bytes(4) + nonce[16:])
+
+    def _append_nonce_length(self) -> int:
+        return 24
+
+    def _mac_len(self) -> int:
+        return 16
+
+    def key_length(self) -> int:
+        return 32
+
+    def serialize(self) -> Dict[str, Union[str, int, bool, None, Dict, List]]:
+        return {
+            "algorithm": "xchacha20-poly1305",
+            "nonce": b64.encode(self.nonce)
+        }
+
+    @staticmethod
+    def deserialize(props: Dict[str, Union[str, int, bool, None, Dict, List]]) -> "XChaCha20Poly1305Cipher":
+        ret = XChaCha20Poly1305Cipher()
+
+        base_keys = set(ret.serialize().keys())
+        if not base_keys.issubset(props.keys()):
+            raise ValueError(f"The properties dict is missing required keys {base_keys - props.keys()}")
+
+        if props["algorithm"] != ret.serialize()["algorithm"]:
+            raise ValueError(f"Expected an algorithm field of 'xchacha20-poly1305'. Got '{props['algorithm']}'.")
+
+        ret.nonce = b64.decode(props["nonce"])
+        if len(ret.nonce) != 24:
+            raise ValueError(f"Decoded nonce must be 24 bytes")
+
+        return ret
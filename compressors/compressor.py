@@ -0,0 +1,22 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List, Union
+
+
+class Compressor(ABC):
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        pass
+
+    @abstractmethod
+    def decompress(self, data: bytes, max_length: int) -> bytes:
+        # raises ValueError if the data is corrupt or would inflate to more than max_length bytes
+        pass
+
+    @abstractmethod
+    def serialize(self) -> Dict[str, Union[str, int, bool, None, Dict, List]]:
+        pass
+
+    @staticmethod
+    @abstractmethod
+    def deserialize(props: Dict[str, Union[str, int, bool, None, Dict, List]]) -> "Compressor":
+        pass
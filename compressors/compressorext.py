@@ -0,0 +1,44 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from compressors.compressor import Compressor
+from registry import Registry, resolve
+import log
+
+
+def __parse_level(ref: str) -> Callable[[str, List[Tuple[str, Optional[str]]]], Compressor]:
+    def parse(name: str, params: List[Tuple[str, Optional[str]]]) -> Compressor:
+        level = None
+        for key, value in params:
+            # "zlib:9" is the same as "zlib:level=9"
+            if value is None and key.isdigit():
+                level = int(key)
+            elif key in {"level", "l"} and value is not None:
+                level = int(value)
+            else:
+                log.warning(f"Unrecognized key '{key}' in params string.")
+
+        cls = resolve(ref)
+        return cls() if level is None else cls(level)
+
+    return parse
+
+
+registry = Registry("compressor", "easyencrypt.compressors")
+registry.register(["zlib", "deflate"], "compressors.zlibcompressor:ZlibCompressor.deserialize",
+                  __parse_level("compressors.zlibcompressor:ZlibCompressor"))
+registry.register(["lzma", "xz"], "compressors.lzmacompressor:LzmaCompressor.deserialize",
+                  __parse_level("compressors.lzmacompressor:LzmaCompressor"))
+registry.register(["zstd", "zstandard"], "compressors.zstdcompressor:ZstdCompressor.deserialize",
+                  __parse_level("compressors.zstdcompressor:ZstdCompressor"))
+
+
+def supported_compressors() -> Iterable[str]:
+    return registry.names()
+
+
+def deserialize(props: Dict[str, Union[str, int, bool, None, Dict, List]]) -> Compressor:
+    return registry.deserialize(props)
+
+
+def from_option_string(s: str) -> Compressor:
+    return registry.from_option_string(s)
@@ -0,0 +1,42 @@
+import lzma
+from typing import Dict, List, Union
+
+from compressors.compressor import Compressor
+
+
+class LzmaCompressor(Compressor):
+    def __init__(self, level: int = 6):
+        if not 0 <= level <= 9:
+            raise ValueError(f"The lzma level must be between 0 and 9 (was {level})")
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return lzma.compress(data, preset=self.level)
+
+    def decompress(self, data: bytes, max_length: int) -> bytes:
+        decompressor = lzma.LZMADecompressor()
+        try:
+            ret = decompressor.decompress(data, max_length)
+        except lzma.LZMAError as e:
+            raise ValueError(f"The compressed data is corrupt ({e}).")
+        if not decompressor.eof:
+            # either output was cut off at max_length or the input ran out
+            raise ValueError(f"The compressed data is truncated or inflates to more than {max_length} bytes.")
+        if len(decompressor.unused_data) > 0:
+            raise ValueError("The compressed data has trailing data.")
+        return ret
+
+    def serialize(self) -> Dict[str, Union[str, int, bool, None, Dict, List]]:
+        return {
+            "algorithm": "lzma",
+            "level": self.level
+        }
+
+    @staticmethod
+    def deserialize(props: Dict[str, Union[str, int, bool, None, Dict, List]]) -> "LzmaCompressor":
+        if props.get("algorithm") != "lzma":
+            raise ValueError(f"Expected an algorithm field of 'lzma'. Got '{props.get('algorithm')}'.")
+        if not isinstance(props.get("level"), int):
+            raise ValueError("The lzma properties must include an integer 'level'.")
+
+        return LzmaCompressor(props["level"])
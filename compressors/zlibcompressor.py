@@ -0,0 +1,41 @@
+import zlib
+from typing import Dict, List, Union
+
+from compressors.compressor import Compressor
+
+
+class ZlibCompressor(Compressor):
+    def __init__(self, level: int = 6):
+        if not 0 <= level <= 9:
+            raise ValueError(f"The zlib level must be between 0 and 9 (was {level})")
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes, max_length: int) -> bytes:
+        decompressor = zlib.decompressobj()
+        try:
+            ret = decompressor.decompress(data, max_length)
+        except zlib.error as e:
+            raise ValueError(f"The compressed data is corrupt ({e}).")
+        if len(decompressor.unconsumed_tail) > 0:
+            raise ValueError(f"The compressed data inflates to more than {max_length} bytes.")
+        if not decompressor.eof or len(decompressor.unused_data) > 0:
+            raise ValueError("The compressed data is truncated or has trailing data.")
+        return ret
+
+    def serialize(self) -> Dict[str, Union[str, int, bool, None, Dict, List]]:
+        return {
+            "algorithm": "zlib",
+            "level": self.level
+        }
+
+    @staticmethod
+    def deserialize(props: Dict[str, Union[str, int, bool, None, Dict, List]]) -> "ZlibCompressor":
+        if props.get("algorithm") != "zlib":
+            raise ValueError(f"Expected an algorithm field of 'zlib'. Got '{props.get('algorithm')}'.")
+        if not isinstance(props.get("level"), int):
+            raise ValueError("The zlib properties must include an integer 'level'.")
+
+        return ZlibCompressor(props["level"])
@@ -0,0 +1,49 @@
+from typing import Dict, List, Union
+
+from compressors.compressor import Compressor
+
+
+def _zstandard():
+    # zstd is optional; the stdlib covers zlib and lzma
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd needs the 'zstandard' package (pip install zstandard).")
+    return zstandard
+
+
+class ZstdCompressor(Compressor):
+    def __init__(self, level: int = 3):
+        if not 1 <= level <= 22:
+            raise ValueError(f"The zstd level must be between 1 and 22 (was {level})")
+        self.level = level
+        _zstandard()
+
+    def compress(self, data: bytes) -> bytes:
+        zstandard = _zstandard()
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def decompress(self, data: bytes, max_length: int) -> bytes:
+        zstandard = _zstandard()
+        try:
+            # frames record their size up front, so a bomb is caught before anything is allocated
+            if zstandard.frame_content_size(data) > max_length:
+                raise ValueError(f"The compressed data inflates to more than {max_length} bytes.")
+            return zstandard.ZstdDecompressor().decompress(data, max_output_size=max_length)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"The compressed data is corrupt ({e}).")
+
+    def serialize(self) -> Dict[str, Union[str, int, bool, None, Dict, List]]:
+        return {
+            "algorithm": "zstd",
+            "level": self.level
+        }
+
+    @staticmethod
+    def deserialize(props: Dict[str, Union[str, int, bool, None, Dict, List]]) -> "ZstdCompressor":
+        if props.get("algorithm") != "zstd":
+            raise ValueError(f"Expected an algorithm field of 'zstd'. Got '{props.get('algorithm')}'.")
+        if not isinstance(props.get("level"), int):
+            raise ValueError("The zstd properties must include an integer 'level'.")
+
+        return ZstdCompressor(props["level"])
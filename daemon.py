@@ -0,0 +1,199 @@
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+# every frame is a 1-byte type, a 4-byte big-endian length, then the payload
+HEADER = b'H'
+DATA = b'D'
+END = b'E'
+ERROR = b'X'
+# no frame may be longer than this, so a client can't make the other side allocate more
+FRAME_SIZE = 1024 * 1024
+MAX_CONNECTIONS = 16
+
+
+def send_frame(sock: socket.socket, kind: bytes, payload: bytes = b'') -> None:
+    sock.sendall(kind + len(payload).to_bytes(4, "big"))
+    if len(payload) > 0:
+        sock.sendall(payload)
+
+
+def recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    pos = 0
+    while pos < n:
+        got = sock.recv_into(view[pos:])
+        if got == 0:
+            raise ValueError("The connection closed in the middle of a frame.")
+        pos += got
+    return bytes(buf)
+
+
+def recv_frame(sock: socket.socket) -> Tuple[bytes, bytes]:
+    head = recv_exact(sock, 5)
+    length = int.from_bytes(head[1:], "big")
+    if length > FRAME_SIZE:
+        raise ValueError(f"A frame of {length} bytes is over the limit of {FRAME_SIZE}.")
+    return head[:1], recv_exact(sock, length)
+
+
+def send_data(sock: socket.socket, block: bytes) -> None:
+    for i in range(0, len(block), FRAME_SIZE):
+        send_frame(sock, DATA, block[i: i + FRAME_SIZE])
+
+
+def recv_data(sock: socket.socket) -> Iterable[bytes]:
+    while True:
+        kind, payload = recv_frame(sock)
+        if kind == END:
+            return
+        if kind != DATA:
+            raise ValueError(f"Expected a data frame, got {kind!r}.")
+        yield payload
+
+
+def remove_socket(path: str) -> bool:
+    try:
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            return False
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+class Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        import ciphers.cipherext
+        import compressors.compressorext
+        import easyencrypt
+        import kdfs.kdfext
+
+        sock = self.request
+        try:
+            kind, payload = recv_frame(sock)
+            if kind != HEADER:
+                raise ValueError(f"Expected a header frame, got {kind!r}.")
+            req = json.loads(payload)
+            if not isinstance(req, dict) or not isinstance(req.get("password"), str):
+                raise ValueError("The request header must be a dictionary with a password.")
+
+            input = recv_data(sock)
+            if req.get("action") == "enc":
+                kdf = kdfs.kdfext.from_option_string(req["kdf"]) if req.get("kdf") else kdfs.kdfext.default_kdf()
+                cipher = (ciphers.cipherext.from_option_string(req["cipher"]) if req.get("cipher")
+                          else ciphers.cipherext.default_cipher())
+                compressor = (compressors.compressorext.from_option_string(req["compression"])
+                              if req.get("compression") else None)
+                out = easyencrypt.encrypt(req["password"], kdf, cipher, input, workers=req.get("workers"),
+                                          key_cache=self.server.key_cache, compressor=compressor)
+            elif req.get("action") == "dec":
+                out = easyencrypt.decrypt(req["password"], input, req.get("workers"), self.server.key_cache,
+                                          label=req.get("label"))
+            else:
+                raise ValueError(f"Action must be 'enc' or 'dec', was {req.get('action')!r}.")
+
+            for block in out:
+                send_data(sock, block)
+            send_frame(sock, END)
+        except OSError:
+            # the client went away; there's no one to report to
+            pass
+        except Exception as e:
+            try:
+                send_frame(sock, ERROR, bytes(str(e), "utf-8"))
+            except OSError:
+                pass
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, max_kdf: int = 2, reuse_keys: bool = False,
+                 max_connections: int = MAX_CONNECTIONS):
+        from kdfs.keycache import KeyCache
+
+        if max_connections < 1:
+            raise ValueError(f"The number of connections must be positive (was {max_connections})")
+        # each connection gets a thread. once max_connections are being served, the next is accepted when one ends
+        self.connections = threading.BoundedSemaphore(max_connections)
+
+        # derived keys are only kept if asked; either way at most max_kdf derivations run at once
+        self.key_cache = KeyCache(max_entries=64 if reuse_keys else 0, max_concurrent=max_kdf)
+
+        # a socket left by an earlier server is replaced, but nothing else at the path is touched
+        if not remove_socket(path) and os.path.lexists(path):
+            raise ValueError(f"'{path}' exists and is not a socket.")
+        # only the user running the server may connect
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(path, Handler)
+        finally:
+            os.umask(old_umask)
+
+
+    def process_request(self, request, client_address) -> None:
+        self.connections.acquire()
+        try:
+            super().process_request(request, client_address)
+        except BaseException:
+            self.connections.release()
+            raise
+
+    def process_request_thread(self, request, client_address) -> None:
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.connections.release()
+
+
+def serve(path: str, max_kdf: int = 2, reuse_keys: bool = False, max_connections: int = MAX_CONNECTIONS) -> None:
+    # importing the crypto backends up front means the first request doesn't pay for them
+    import easyencrypt
+
+    with Server(path, max_kdf, reuse_keys, max_connections) as server:
+        try:
+            server.serve_forever()
+        finally:
+            remove_socket(path)
+
+
+def request(path: str, action: str, password: str, input: Iterable[bytes], kdf: Optional[str] = None,
+            cipher: Optional[str] = None, workers: Optional[int] = None,
+            compression: Optional[str] = None, label: Optional[str] = None) -> Iterable[bytes]:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+
+    header: Dict = {"action": action, "password": password, "kdf": kdf, "cipher": cipher, "workers": workers,
+                    "compression": compression, "label": label}
+    send_frame(sock, HEADER, bytes(json.dumps(header), "utf-8"))
+
+    # input is sent from another thread so neither side blocks on a full socket buffer
+    def send_input():
+        try:
+            for block in input:
+                send_data(sock, block)
+            send_frame(sock, END)
+        except OSError:
+            pass
+
+    sender = threading.Thread(target=send_input, daemon=True)
+    sender.start()
+
+    try:
+        while True:
+            kind, payload = recv_frame(sock)
+            if kind == END:
+                return
+            if kind == ERROR:
+                raise ValueError(str(payload, "utf-8"))
+            if kind != DATA:
+                raise ValueError(f"Expected a data frame, got {kind!r}.")
+            yield payload
+    finally:
+        sock.close()
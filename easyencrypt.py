@@ -1,15 +1,35 @@
+import asyncio
+import copy
 import hashlib
-from typing import Iterable, Union
+import io
+import itertools
+import os
+import shutil
+import struct
+import tempfile
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import AsyncIterable, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
-from ciphers.aes256gcmcipher import Aes256GcmCipher
-from kdfs.argon2kdf import Argon2Kdf
+from chunker import Chunker
 from ciphers.cipher import Cipher
+from compressors.compressor import Compressor
 from kdfs.kdf import Kdf
+from kdfs.keycache import KeyCache
 import json
-from bufferedreader import BufferedReader
+import time
+from bufferedreader import AsyncBufferedReader, BufferedReader, DEFAULT_CHUNK_SIZE
+from encryptedfile import EncryptedFile
+import segments
+from parallel import default_workers
+import binaryheader
+from hooks import Hooks, resolve_hooks, timed, timed_input, timed_output
 
 import ciphers.cipherext
+import compressors.compressorext
 import kdfs.kdfext
+import kdfs.keywrap
+import kdfs.subkey
+from securerandom import rand_bytes
 
 
 def sha256hash(b: bytes):
@@ -18,52 +38,695 @@ def sha256hash(b: bytes):
     return m.digest()
 
 
-def encrypt(password: str, kdf: Kdf, cipher: Cipher, input: Union[bytes, Iterable[bytes], str]):
-    key = kdf.derive(password, cipher.key_length())
+def __write_header(header: Dict, segment_size: Optional[int], compressor: Optional[Compressor] = None,
+                   appendable: bool = False, chunker: Optional[Chunker] = None) -> bytes:
+    # a segment size of None writes the original single-stream format
+    if segment_size is not None:
+        header["version"] = 2
+        header["segment_size"] = segment_size
+    # compressed segments vary in size, so they need a format older readers refuse instead of misreading
+    if compressor is not None:
+        if segment_size is None:
+            raise ValueError("Compression needs the segmented format (a segment size).")
+        header["version"] = 3
+        header["compression"] = compressor.serialize()
+    # appendable segments each carry a random nonce, which version 2 readers would misread
+    if appendable:
+        if segment_size is None or compressor is not None:
+            raise ValueError("Appendable files need the segmented format (a segment size) and no compression.")
+        header["version"] = 4
+    # chunks are cut by content and framed by length; the segment size is the largest a chunk can be
+    if chunker is not None:
+        if compressor is not None or appendable:
+            raise ValueError("Chunked files can't also be compressed or appendable.")
+        header["version"] = 5
+        header["segment_size"] = chunker.max_size
+        header["chunking"] = chunker.serialize()
+    return __encode_header(header)
+
+
+def __encode_header(header: Dict, size: Optional[int] = None) -> Optional[bytes]:
+    # the binary layout is smaller and cheaper to parse; JSON is the fallback for anything it can't hold
+    header_bytes = binaryheader.encode(header)
+    is_json = header_bytes is None
+    if is_json:
+        header_bytes = bytes(json.dumps(header), "utf-8")
+
+    # a header overwriting an existing one in place is padded to exactly its size, or None if it doesn't fit
+    if size is not None:
+        pad = size - 6 - len(header_bytes)
+        if pad < 0 or (not is_json and 0 < pad < binaryheader.EXTENSION.size):
+            return None
+        header_bytes += b' ' * pad if is_json else binaryheader.padding(pad)
+
+    return b'EZ' + len(header_bytes).to_bytes(4, "big") + header_bytes
+
+
+def __timed_input(input: Union[bytes, Iterable[bytes], str], hooks: Optional[Hooks]) -> Union[bytes, Iterable[bytes], str]:
+    # files and byte strings are never waited on; only a streaming source like a pipe can block
+    if hooks is None or isinstance(input, (bytes, bytearray, memoryview, str)):
+        return input
+    return timed_input(hooks, input)
+
+
+def __timed_output(output: Iterable[bytes], hooks: Optional[Hooks], event: str, token=None,
+                   start: Optional[float] = None) -> Iterable[bytes]:
+    return output if hooks is None else timed_output(hooks, event, output, token, start)
+
+
+def __encrypt(key: bytes, header: Dict, cipher: Cipher, input: Union[bytes, Iterable[bytes], str],
+              segment_size: Optional[int], workers: Optional[int], hooks: Optional[Hooks],
+              compressor: Optional[Compressor], appendable: bool = False,
+              chunker: Optional[Chunker] = None) -> Iterable[bytes]:
+    # the cipher and segment layers resolve the caller's hooks themselves, so they're passed down unresolved
+    yield __write_header(header, segment_size, compressor, appendable, chunker)
+    input = __timed_input(input, resolve_hooks(hooks))
+    if chunker is not None:
+        yield from segments.encrypt_chunked(cipher, key, chunker, input, workers, hooks=hooks)
+    elif appendable:
+        yield from segments.encrypt_appendable(cipher, key, input, segment_size, workers, hooks=hooks)
+    elif compressor is not None:
+        yield from segments.encrypt_compressed(cipher, key, compressor, input, segment_size, workers, hooks=hooks)
+    elif segment_size is not None:
+        yield from segments.encrypt(cipher, key, input, segment_size, workers, hooks=hooks)
+    else:
+        yield from cipher.encrypt(key, input, hooks)
+
+
+def __derive(kdf: Kdf, password: str, out_len: int, key_cache: Optional[KeyCache],
+             hooks: Optional[Hooks] = None) -> bytes:
+    if hooks is not None:
+        return timed(hooks, "kdf", out_len, __derive, kdf, password, out_len, key_cache)
+    if key_cache is not None:
+        return key_cache.derive(kdf, password, out_len)
+    return kdf.derive(password, out_len)
+
+
+def __encrypt_one(password: str, kdf: Kdf, cipher: Cipher, input: Union[bytes, Iterable[bytes], str],
+                  segment_size: Optional[int], workers: Optional[int], key_cache: Optional[KeyCache],
+                  hooks: Optional[Hooks], compressor: Optional[Compressor], appendable: bool,
+                  chunker: Optional[Chunker]) -> Iterable[bytes]:
+    kek = __derive(kdf, password, kdfs.keywrap.KEY_LENGTH, key_cache, resolve_hooks(hooks))
+    key = rand_bytes(cipher.key_length())
 
     head_kdf = kdf.serialize()
     head_cipher = cipher.serialize()
     header = {
         "kdf": head_kdf,
-        "cipher": head_cipher
+        "cipher": head_cipher,
+        "keywrap": kdfs.keywrap.wrap(kek, key)
     }
-    header_bytes = bytes(json.dumps(header), "utf-8")
 
-    yield b'EZ'
-    yield len(header_bytes).to_bytes(4, "big")
-    yield header_bytes
-    yield from cipher.encrypt(key, input)
+    yield from __encrypt(key, header, cipher, input, segment_size, workers, hooks, compressor, appendable, chunker)
 
 
-def decrypt(password: str, input: Union[bytes, Iterable[bytes], str]) -> Iterable[bytes]:
-    with BufferedReader(input) as br:
-        if br.read(2) != b'EZ':
-            raise ValueError("The data is not valid easyencrypted data (magic header missing)")
+def encrypt(password: str, kdf: Kdf, cipher: Cipher, input: Union[bytes, Iterable[bytes], str],
+            segment_size: Optional[int] = segments.DEFAULT_SEGMENT_SIZE, workers: Optional[int] = None,
+            key_cache: Optional[KeyCache] = None, hooks: Optional[Hooks] = None,
+            compressor: Optional[Compressor] = None, appendable: bool = False, chunker: Optional[Chunker] = None):
+    # the kdf runs on the first next(), so it falls inside the "encrypt" event
+    yield from __timed_output(__encrypt_one(password, kdf, cipher, input, segment_size, workers, key_cache, hooks,
+                                            compressor, appendable, chunker), resolve_hooks(hooks), "encrypt")
+
+
+def __encrypt_like(password: str, base: Dict, input: Union[bytes, Iterable[bytes], str], workers: Optional[int],
+                   key_cache: Optional[KeyCache], hooks: Optional[Hooks], label: Optional[str]) -> Iterable[bytes]:
+    if base.get("version", 1) != 5:
+        raise ValueError("Only chunked (version 5) files can be encrypted over.")
+    cipher = ciphers.cipherext.deserialize(base["cipher"])
+    chunker = Chunker.deserialize(base["chunking"])
+    _, key = __unlock(password, base, key_cache, resolve_hooks(hooks), label)
+
+    # the new file keeps the old one's key slots, so it opens with the same passwords
+    header = {k: v for k, v in base.items() if k in {"kdf", "cipher", "keywrap", "label", "slots"}}
+    yield from __encrypt(key, header, cipher, input, None, workers, hooks, None, chunker=chunker)
+
+
+def encrypt_like(password: str, base: Dict, input: Union[bytes, Iterable[bytes], str], workers: Optional[int] = None,
+                 key_cache: Optional[KeyCache] = None, hooks: Optional[Hooks] = None,
+                 label: Optional[str] = None) -> Iterable[bytes]:
+    # reusing the data key, cipher and chunking of an earlier chunked file (its header, from read_header()) makes
+    # every chunk the two have in common encrypt to the same bytes, so syncing the new file only sends what changed
+    yield from __timed_output(__encrypt_like(password, base, input, workers, key_cache, hooks, label),
+                              resolve_hooks(hooks), "encrypt")
+
+
+def encrypt_many(password: str, kdf: Kdf, cipher: Cipher, inputs: Iterable[Union[bytes, Iterable[bytes], str]],
+                 segment_size: Optional[int] = segments.DEFAULT_SEGMENT_SIZE, workers: Optional[int] = None,
+                 key_cache: Optional[KeyCache] = None, hooks: Optional[Hooks] = None,
+                 compressor: Optional[Compressor] = None) -> Iterable[Tuple[Union[bytes, Iterable[bytes], str], Iterable[bytes]]]:
+    # the password kdf runs once; each input gets its own random data key and nonce, wrapped under the kdf's key
+    resolved = resolve_hooks(hooks)
+    kek = __derive(kdf, password, kdfs.keywrap.KEY_LENGTH, key_cache, resolved)
+    head_kdf = kdf.serialize()
+
+    for input in inputs:
+        key = rand_bytes(cipher.key_length())
+        file_cipher = copy.copy(cipher)
+        file_cipher.nonce = rand_bytes(len(cipher.nonce))
+
+        header = {
+            "kdf": head_kdf,
+            "cipher": file_cipher.serialize(),
+            "keywrap": kdfs.keywrap.wrap(kek, key)
+        }
+
+        yield input, __timed_output(__encrypt(key, header, file_cipher, input, segment_size, workers, hooks,
+                                              compressor), resolved, "encrypt")
+
+
+async def aencrypt(password: str, kdf: Kdf, cipher: Cipher, input: AsyncIterable[bytes],
+                   segment_size: int = segments.DEFAULT_SEGMENT_SIZE, workers: Optional[int] = None,
+                   executor: Optional[Executor] = None) -> AsyncIterator[bytes]:
+    loop = asyncio.get_running_loop()
+    kek = await loop.run_in_executor(executor, kdf.derive, password, kdfs.keywrap.KEY_LENGTH)
+    key = rand_bytes(cipher.key_length())
+
+    header = {
+        "kdf": kdf.serialize(),
+        "cipher": cipher.serialize(),
+        "keywrap": kdfs.keywrap.wrap(kek, key)
+    }
 
-        len_bytes = br.read(4)
-        if len(len_bytes) != 4:
-            raise ValueError("The data is not valid easyencrypted data (header length field missing)")
+    yield __write_header(header, segment_size)
+    async for block in segments.aencrypt(cipher, key, AsyncBufferedReader(input), segment_size, workers, executor):
+        yield block
 
-        header_len = int.from_bytes(len_bytes, "big")
-        if header_len < 0:
-            raise ValueError("The data is not valid easyencrypted data (header length is negative)")
 
-        header_bytes = br.read(header_len)
-        if len(header_bytes) != header_len:
-            raise ValueError("The data is not valid easyencrypted data (reached EOF while reading header)")
+def __read_header(br) -> Dict:
+    if br.read(2) != b'EZ':
+        raise ValueError("The data is not valid easyencrypted data (magic header missing)")
 
+    len_bytes = br.read(4)
+    if len(len_bytes) != 4:
+        raise ValueError("The data is not valid easyencrypted data (header length field missing)")
+
+    header_len = int.from_bytes(len_bytes, "big")
+    if header_len < 0:
+        raise ValueError("The data is not valid easyencrypted data (header length is negative)")
+
+    header_bytes = br.read(header_len)
+    if len(header_bytes) != header_len:
+        raise ValueError("The data is not valid easyencrypted data (reached EOF while reading header)")
+
+    if len(header_bytes) > 0 and header_bytes[0] != binaryheader.JSON_START:
+        header = binaryheader.decode(header_bytes)
+    else:
         header_str = str(header_bytes, "utf-8")
         header = json.loads(header_str)
         if not isinstance(header, dict):
             raise ValueError("The header must be a dictionary.")
-        header_kdf = header["kdf"]
-        header_cipher = header["cipher"]
 
-        kdf = kdfs.kdfext.deserialize(header_kdf)
+    version = header.get("version", 1)
+    if version not in {1, 2, 3, 4, 5}:
+        raise ValueError(f"Unsupported format version {version}.")
+
+    if version >= 2:
+        segment_size = header.get("segment_size")
+        if not isinstance(segment_size, int) or segment_size <= 0:
+            raise ValueError("The header's segment size must be a positive integer.")
+
+    if version == 3 and not isinstance(header.get("compression"), dict):
+        raise ValueError("A version 3 header must have a compression dictionary.")
+
+    if version == 5 and not isinstance(header.get("chunking"), dict):
+        raise ValueError("A version 5 header must have a chunking dictionary.")
+
+    slots = header.get("slots", [])
+    if not isinstance(slots, list) or not all(isinstance(s, dict) and "kdf" in s and "keywrap" in s for s in slots):
+        raise ValueError("The header's key slots must be dictionaries with 'kdf' and 'keywrap' fields.")
+
+    return header
+
+
+HEADER_READ_SIZE = 1024
+
+
+def __pread_header(fd: int) -> bytes:
+    # one pread covers any header this library writes, so scanning many files never reads a body
+    data = os.pread(fd, HEADER_READ_SIZE, 0)
+    if len(data) >= 6 and data[:2] == b'EZ':
+        end = 6 + int.from_bytes(data[2:6], "big")
+        # a corrupt length past the end of the file is reported by __read_header instead of read
+        if len(data) < end <= os.fstat(fd).st_size:
+            data += os.pread(fd, end - len(data), len(data))
+    return data
+
+
+def read_header(input: Union[bytes, str]) -> Dict:
+    if isinstance(input, str):
+        fd = os.open(input, os.O_RDONLY)
+        try:
+            input = __pread_header(fd)
+        finally:
+            os.close(fd)
+    return __read_header(io.BytesIO(input))
+
+
+def key_slots(header: Dict) -> List[Dict]:
+    # the first slot is kept at the top of the header, so single-password files look like they always have.
+    # files from before data keys were wrapped have none
+    if "keywrap" not in header:
+        return []
+    first = {"kdf": header["kdf"], "keywrap": header["keywrap"]}
+    if "label" in header:
+        first["label"] = header["label"]
+    return [first] + header.get("slots", [])
+
+
+def __set_key_slots(header: Dict, slots: List[Dict]) -> None:
+    header.pop("label", None)
+    header.pop("slots", None)
+    header["kdf"], header["keywrap"] = slots[0]["kdf"], slots[0]["keywrap"]
+    if "label" in slots[0]:
+        header["label"] = slots[0]["label"]
+    if len(slots) > 1:
+        header["slots"] = slots[1:]
+
+
+def __unlock(password: str, header: Dict, key_cache: Optional[KeyCache], hooks: Optional[Hooks] = None,
+             label: Optional[str] = None) -> Tuple[int, bytes]:
+    # each slot tried costs a kdf run, so a label goes straight to the right one
+    slots = key_slots(header)
+    candidates = [i for i, slot in enumerate(slots) if label is None or slot.get("label") == label]
+    if len(candidates) == 0:
+        raise ValueError(f"No key slot is labelled '{label}'.")
+
+    for i in candidates:
+        kdf = kdfs.kdfext.deserialize(slots[i]["kdf"])
+        kek = __derive(kdf, password, kdfs.keywrap.KEY_LENGTH, key_cache, hooks)
+        try:
+            return i, kdfs.keywrap.unwrap(kek, slots[i]["keywrap"])
+        except ValueError:
+            continue
+    raise ValueError("No key slot could be unlocked. The password is wrong or the header is corrupt.")
+
+
+def __derive_key(password: str, header: Dict, key_cache: Optional[KeyCache],
+                 hooks: Optional[Hooks] = None, label: Optional[str] = None) -> Tuple[Cipher, bytes]:
+    cipher = ciphers.cipherext.deserialize(header["cipher"])
+
+    # files with a keywrap have a random data key; older files use the kdf output as the key
+    if "keywrap" in header:
+        _, key = __unlock(password, header, key_cache, hooks, label)
+    else:
+        kdf = kdfs.kdfext.deserialize(header["kdf"])
+        key = __derive(kdf, password, cipher.key_length(), key_cache, hooks)
+
+    if "subkey" in header:
+        salt = kdfs.subkey.deserialize(header["subkey"])
+        key = kdfs.subkey.derive(key, salt, cipher.key_length())
+
+    return cipher, key
+
+
+def __compressor(header: Dict) -> Optional[Compressor]:
+    return compressors.compressorext.deserialize(header["compression"]) if header.get("version", 1) == 3 else None
+
+
+def __decrypt_body(br: BufferedReader, header: Dict, cipher: Cipher, key: bytes, workers: Optional[int],
+                   hooks: Optional[Hooks], compressor: Optional[Compressor]) -> Iterable[bytes]:
+    with br:
+        if compressor is not None:
+            yield from segments.decrypt_compressed(cipher, key, compressor, br.chunks(), header["segment_size"], workers,
+                                                   hooks=hooks)
+        elif header.get("version", 1) == 4:
+            yield from segments.decrypt_appendable(cipher, key, br.chunks(), header["segment_size"], workers,
+                                                   hooks=hooks)
+        elif header.get("version", 1) == 5:
+            yield from segments.decrypt_chunked(cipher, key, br.chunks(), header["segment_size"], workers, hooks=hooks)
+        elif header.get("version", 1) == 1:
+            yield from cipher.decrypt(key, br.chunks(), hooks)
+        else:
+            yield from segments.decrypt(cipher, key, br.chunks(), header["segment_size"], workers, hooks=hooks)
+
+
+def decrypt(password: str, input: Union[bytes, Iterable[bytes], str], workers: Optional[int] = None,
+            key_cache: Optional[KeyCache] = None, hooks: Optional[Hooks] = None,
+            label: Optional[str] = None) -> Iterable[bytes]:
+    resolved = resolve_hooks(hooks)
+    start = time.perf_counter()
+    token = resolved.start("decrypt", None) if resolved is not None else None
+
+    # the header is checked and the key derived before returning; the reader stays open until the body is consumed
+    br = BufferedReader(__timed_input(input, resolved))
+    try:
+        header = __read_header(br)
+        compressor = __compressor(header)
+        cipher, key = __derive_key(password, header, key_cache, resolved, label)
+    except BaseException:
+        br.__exit__(None, None, None)
+        if resolved is not None:
+            resolved.end("decrypt", 0, time.perf_counter() - start, token)
+        raise
+
+    return __timed_output(__decrypt_body(br, header, cipher, key, workers, hooks, compressor), resolved, "decrypt",
+                          token, start)
+
+
+def __blocking_iter(br: AsyncBufferedReader, loop: asyncio.AbstractEventLoop) -> Iterable[bytes]:
+    while len(block := asyncio.run_coroutine_threadsafe(br.read(DEFAULT_CHUNK_SIZE), loop).result()) != 0:
+        yield block
+
+
+async def adecrypt(password: str, input: AsyncIterable[bytes], workers: Optional[int] = None,
+                   executor: Optional[Executor] = None, key_cache: Optional[KeyCache] = None,
+                   label: Optional[str] = None) -> AsyncIterator[bytes]:
+    loop = asyncio.get_running_loop()
+    br = AsyncBufferedReader(input)
+
+    prefix = await br.read(6)
+    header_len = int.from_bytes(prefix[2:], "big") if len(prefix) == 6 else 0
+    header = __read_header(BufferedReader(prefix + await br.read(header_len)))
+    compressor = __compressor(header)
+    cipher, key = await loop.run_in_executor(executor, __derive_key, password, header, key_cache, None, label)
+
+    if header.get("version", 1) == 2:
+        async for block in segments.adecrypt(cipher, key, br, header["segment_size"], workers, executor):
+            yield block
+        return
+
+    # the other formats run on one executor thread that pulls input from the loop
+    if compressor is not None:
+        blocks = segments.decrypt_compressed(cipher, key, compressor, __blocking_iter(br, loop), header["segment_size"],
+                                             workers)
+    elif header.get("version", 1) == 4:
+        blocks = segments.decrypt_appendable(cipher, key, __blocking_iter(br, loop), header["segment_size"], workers)
+    elif header.get("version", 1) == 5:
+        blocks = segments.decrypt_chunked(cipher, key, __blocking_iter(br, loop), header["segment_size"], workers)
+    else:
+        blocks = cipher.decrypt(key, __blocking_iter(br, loop))
+    while (block := await loop.run_in_executor(executor, next, blocks, None)) is not None:
+        yield block
+
+
+def decrypt_many(password: str, inputs: Iterable[Union[bytes, Iterable[bytes], str]], workers: Optional[int] = None,
+                 key_cache: Optional[KeyCache] = None, hooks: Optional[Hooks] = None,
+                 label: Optional[str] = None) -> Iterable[Tuple[Union[bytes, Iterable[bytes], str], Iterable[bytes]]]:
+    # files from one encrypt_many batch share kdf parameters, so the cache derives the master key once
+    if key_cache is None:
+        key_cache = KeyCache(ttl=None)
+
+    for input in inputs:
+        yield input, decrypt(password, input, workers, key_cache, hooks, label)
+
+
+def verify(password: str, input: Union[bytes, Iterable[bytes], str], workers: Optional[int] = None,
+           key_cache: Optional[KeyCache] = None, hooks: Optional[Hooks] = None, label: Optional[str] = None) -> int:
+    # checks every tag without keeping any plaintext or inflating compressed segments, and raises ValueError at the
+    # first that fails. returns the number of bytes authenticated: the plaintext size, or the compressed size
+    resolved = resolve_hooks(hooks)
+    with BufferedReader(input) as br:
+        header = __read_header(br)
+        cipher, key = __derive_key(password, header, key_cache, resolved, label)
+        version, body = header.get("version", 1), br.chunks()
+        if version == 1:
+            return cipher.verify(key, body, hooks)
+        if version == 2:
+            return segments.verify(cipher, key, body, header["segment_size"], workers, hooks=hooks)
+        if version == 3:
+            return segments.verify_compressed(cipher, key, body, header["segment_size"], workers, hooks=hooks)
+        if version == 4:
+            return segments.verify_appendable(cipher, key, body, header["segment_size"], workers, hooks=hooks)
+        return segments.verify_chunked(cipher, key, body, header["segment_size"], workers, hooks=hooks)
+
+
+def __verify_report(password: str, path: str, workers: Optional[int], key_cache: KeyCache,
+                    label: Optional[str]) -> Dict:
+    start = time.perf_counter()
+    try:
+        size = os.path.getsize(path)
+        verify(password, path, workers, key_cache, label=label)
+    except (OSError, ValueError) as e:
+        return {"path": path, "ok": False, "error": str(e)}
+    seconds = time.perf_counter() - start
+    return {"path": path, "ok": True, "bytes": size, "seconds": seconds,
+            "mb_per_s": size / seconds / 1e6 if seconds > 0 else None}
+
+
+# set in each of verify_many's worker processes
+__verifier: Dict = {}
+
+
+def __start_verifier(password: str, label: Optional[str]) -> None:
+    __verifier.update(password=password, label=label, key_cache=KeyCache(ttl=None))
+
+
+def __verify_in_process(path: str) -> Dict:
+    return __verify_report(__verifier["password"], path, 1, __verifier["key_cache"], __verifier["label"])
+
+
+def verify_many(password: str, paths: Iterable[str], processes: Optional[int] = None, workers: Optional[int] = None,
+                label: Optional[str] = None) -> Iterable[Dict]:
+    # files are spread over processes that each check one file at a time, on one thread. every process caches the
+    # keys it derives, so files from one batch run the kdf once per process. with processes=1 the files are checked
+    # here one after another, each on `workers` threads
+    paths = list(paths)
+    if len(paths) == 0:
+        return
+    processes = max(1, min(len(paths), processes if processes is not None else default_workers()))
+
+    if processes == 1:
+        key_cache = KeyCache(ttl=None)
+        for path in paths:
+            yield __verify_report(password, path, workers, key_cache, label)
+        return
+
+    with ProcessPoolExecutor(processes, initializer=__start_verifier, initargs=(password, label)) as pool:
+        yield from pool.map(__verify_in_process, paths)
+
+
+def __rewrite_header(path: str, fd: int, header: Dict, header_size: int, output: Optional[str]) -> None:
+    # a header that fits in the old one's place is written with one pwrite, so only the header is touched
+    if output is None:
+        header_bytes = __encode_header(header, header_size)
+        if header_bytes is not None:
+            os.pwrite(fd, header_bytes, 0)
+            os.fsync(fd)
+            return
+
+    # otherwise the encrypted body is copied as is behind the new header. in place, that goes through a temporary
+    # file that replaces the original, so a crash never leaves a half-written file
+    if output is None:
+        tmp_fd, target = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".easyencrypt-")
+        os.close(tmp_fd)
+    else:
+        target = output
+    try:
+        with io.open(target, "wb") as out, io.open(fd, "rb", closefd=False) as src:
+            out.write(__encode_header(header))
+            src.seek(header_size)
+            shutil.copyfileobj(src, out, DEFAULT_CHUNK_SIZE)
+            out.flush()
+            os.fsync(out.fileno())
+        if output is None:
+            shutil.copymode(path, target)
+            os.replace(target, path)
+    except BaseException:
+        if output is None:
+            os.unlink(target)
+        raise
+
+
+def __fresh_kdf(props: Dict) -> Kdf:
+    # the same parameters with a new salt
+    kdf = kdfs.kdfext.deserialize(props)
+    if not hasattr(kdf, "salt"):
+        raise ValueError(f"A new salt can't be made for the '{props.get('algorithm')}' kdf. Give a kdf.")
+    kdf.salt = rand_bytes(len(kdf.salt))
+    return kdf
+
+
+def __open_locked(path: str, write: bool) -> int:
+    # appends and key slot edits lock the file. an edit that rewrites the whole file replaces it, so a lock taken
+    # while waiting on the old one is on a file nobody will read again; then the new file is opened and locked
+    try:
+        import fcntl
+    except ImportError:
+        return os.open(path, os.O_RDWR if write else os.O_RDONLY)
+
+    while True:
+        fd = os.open(path, os.O_RDWR if write else os.O_RDONLY)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+            if os.path.samestat(os.fstat(fd), os.stat(path)):
+                return fd
+        except BaseException:
+            os.close(fd)
+            raise
+        os.close(fd)
+
+
+def __edit_key_slots(path: str, password: str, label: Optional[str], output: Optional[str],
+                     key_cache: Optional[KeyCache], edit: Callable[[List[Dict], int, bytes], None]) -> Dict:
+    # only wrapped data keys change, so the body is never decrypted. an append cut short is rolled back first, so
+    # the copy or the file left in place doesn't carry its torn tail
+    pending = os.path.exists(__journal_path(path))
+    fd = __open_locked(path, output is None or pending)
+    try:
+        __roll_back_append(path, fd)
+        raw = __pread_header(fd)
+        header = __read_header(io.BytesIO(raw))
+        if "keywrap" not in header:
+            raise ValueError("This file's key comes straight from the password, so its keys can't be changed. "
+                             "Decrypt and encrypt it again instead.")
+
+        slots = key_slots(header)
+        index, key = __unlock(password, header, key_cache, label=label)
+        edit(slots, index, key)
+        __set_key_slots(header, slots)
+        __rewrite_header(path, fd, header, 6 + int.from_bytes(raw[2:6], "big"), output)
+        return header
+    finally:
+        os.close(fd)
+
+
+def rekey(path: str, password: str, new_password: str, kdf: Optional[Kdf] = None, output: Optional[str] = None,
+          key_cache: Optional[KeyCache] = None, label: Optional[str] = None) -> Dict:
+    # changes the password of the slot `password` unlocks. by default the kdf keeps its parameters with a new salt
+    def edit(slots: List[Dict], index: int, key: bytes):
+        slot_kdf = kdf if kdf is not None else __fresh_kdf(slots[index]["kdf"])
+        kek = __derive(slot_kdf, new_password, kdfs.keywrap.KEY_LENGTH, key_cache)
+        slots[index] = {**slots[index], "kdf": slot_kdf.serialize(), "keywrap": kdfs.keywrap.wrap(kek, key)}
+
+    return __edit_key_slots(path, password, label, output, key_cache, edit)
+
+
+def add_key(path: str, password: str, new_password: str, kdf: Optional[Kdf] = None, new_label: Optional[str] = None,
+            output: Optional[str] = None, key_cache: Optional[KeyCache] = None, label: Optional[str] = None) -> Dict:
+    # adds a slot for new_password. by default it uses the parameters of the slot `password` unlocks, with a new salt
+    def edit(slots: List[Dict], index: int, key: bytes):
+        if new_label is not None and (new_label == "" or any(s.get("label") == new_label for s in slots)):
+            raise ValueError(f"The label '{new_label}' is empty or already used by another key slot.")
+        slot_kdf = kdf if kdf is not None else __fresh_kdf(slots[index]["kdf"])
+        kek = __derive(slot_kdf, new_password, kdfs.keywrap.KEY_LENGTH, key_cache)
+        slot = {"kdf": slot_kdf.serialize(), "keywrap": kdfs.keywrap.wrap(kek, key)}
+        if new_label is not None:
+            slot["label"] = new_label
+        slots.append(slot)
+
+    return __edit_key_slots(path, password, label, output, key_cache, edit)
+
+
+def remove_key(path: str, password: str, remove_label: Optional[str] = None, output: Optional[str] = None,
+               key_cache: Optional[KeyCache] = None, label: Optional[str] = None) -> Dict:
+    # removes the slot labelled remove_label, or else the one `password` unlocks. the last slot is never removed
+    def edit(slots: List[Dict], index: int, key: bytes):
+        if remove_label is not None:
+            matches = [i for i, s in enumerate(slots) if s.get("label") == remove_label]
+            if len(matches) == 0:
+                raise ValueError(f"No key slot is labelled '{remove_label}'.")
+            index = matches[0]
+        if len(slots) == 1:
+            raise ValueError("The file's only key slot can't be removed.")
+        del slots[index]
+
+    return __edit_key_slots(path, password, label, output, key_cache, edit)
+
+
+def __journal_path(path: str) -> str:
+    return f"{path}.append-journal"
+
+
+def __write_journal(path: str, size: int, offset: int, segment: bytes) -> None:
+    # the old length and last segment are made durable before the last segment is overwritten
+    journal = __journal_path(path)
+    tmp = f"{journal}.{os.getpid()}.tmp"
+    with io.open(tmp, "wb") as f:
+        f.write(struct.pack(">QQ", size, offset) + segment)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, journal)
+    try:
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def __roll_back_append(path: str, fd: int) -> None:
+    # an append that didn't finish left a journal behind. putting the old last segment back and cutting off what
+    # was written after it returns the file to what it was before that append
+    try:
+        with io.open(__journal_path(path), "rb") as f:
+            journal = f.read()
+    except FileNotFoundError:
+        return
+    size, offset = struct.unpack(">QQ", journal[:16])
+    os.pwrite(fd, journal[16:], offset)
+    os.ftruncate(fd, size)
+    os.fsync(fd)
+    os.unlink(__journal_path(path))
+
+
+def append(path: str, password: str, input: Union[bytes, Iterable[bytes], str], workers: Optional[int] = None,
+           key_cache: Optional[KeyCache] = None, label: Optional[str] = None) -> int:
+    # only the last segment is read and written again, with the new data behind it, so an append costs the bytes
+    # appended plus at most one segment no matter how big the file is
+    # two appends at once would both rewrite the same last segment
+    fd = __open_locked(path, True)
+    try:
+        __roll_back_append(path, fd)
+        raw = __pread_header(fd)
+        header = __read_header(io.BytesIO(raw))
+        if header.get("version", 1) != 4:
+            raise ValueError("Only files encrypted as appendable (version 4) can be appended to.")
+        cipher, key = __derive_key(password, header, key_cache, label=label)
+
+        segment_size = header["segment_size"]
+        stride = segment_size + cipher.append_overhead()
+        body_offset = 6 + int.from_bytes(raw[2:6], "big")
+        size = os.fstat(fd).st_size
+        body_len = size - body_offset
+        last_index = max(1, -(-body_len // stride)) - 1
+        last_offset = body_offset + last_index * stride
+
+        old_last = os.pread(fd, stride, last_offset)
+        tail = cipher.decrypt_appendable_segment(key, last_index, True, old_last)
+        appended = 0
+
+        def counted():
+            nonlocal appended
+            with BufferedReader(input) as br:
+                for block in br.chunks():
+                    appended += len(block)
+                    yield block
+
+        # overwriting the old last segment is the one step that can lose data, so a journal guards it. a failed
+        # append is rolled back here; one cut short by a crash is rolled back by the next append
+        __write_journal(path, size, last_offset, old_last)
+        try:
+            pos = last_offset
+            for block in segments.encrypt_appendable(cipher, key, itertools.chain([tail], counted()), segment_size,
+                                                     workers, first_index=last_index):
+                os.pwrite(fd, block, pos)
+                pos += len(block)
+            os.fsync(fd)
+        except BaseException:
+            __roll_back_append(path, fd)
+            raise
+        os.unlink(__journal_path(path))
+        return appended
+    finally:
+        os.close(fd)
 
-        cipher = ciphers.cipherext.deserialize(header_cipher)
 
-        key = kdf.derive(password, cipher.key_length())
+def open(path: str, password: str, cache_size: int = 8, key_cache: Optional[KeyCache] = None,
+         label: Optional[str] = None) -> EncryptedFile:
+    handle = io.open(path, "rb")
+    try:
+        header = __read_header(handle)
+        if header.get("version", 1) != 2:
+            raise ValueError("Random access needs an uncompressed segmented (version 2) file. Re-encrypt it to use open().")
 
-        return cipher.decrypt(key, br.chunks())
+        cipher, key = __derive_key(password, header, key_cache, label=label)
 
+        return EncryptedFile(handle, cipher, key, header["segment_size"], handle.tell(), cache_size)
+    except BaseException:
+        handle.close()
+        raise
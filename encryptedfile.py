@@ -0,0 +1,95 @@
+import io
+import os
+from collections import OrderedDict
+from typing import BinaryIO
+
+from ciphers.cipher import Cipher
+
+
+class EncryptedFile(io.RawIOBase):
+    def __init__(self, handle: BinaryIO, cipher: Cipher, key: bytes, segment_size: int, body_offset: int,
+                 cache_size: int = 8):
+        if cache_size < 1:
+            raise ValueError(f"The cache must hold at least one segment (was {cache_size})")
+
+        self.handle = handle
+        self.cipher = cipher
+        self.key = key
+        self.segment_size = segment_size
+        self.body_offset = body_offset
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.pos = 0
+
+        # every segment but the last is full, so the offset of any segment follows from the body length
+        self.stride = segment_size + cipher.mac_length()
+        body_len = os.fstat(handle.fileno()).st_size - body_offset
+        self.n_segments = max(1, -(-body_len // self.stride))
+        last_len = body_len - (self.n_segments - 1) * self.stride
+        if last_len < cipher.mac_length():
+            raise ValueError("The data is not valid easyencrypted data (the last segment is too short)")
+        self.size = body_len - self.n_segments * cipher.mac_length()
+
+        # authenticating the final segment up front means a truncated file is caught before any read
+        self.__segment(self.n_segments - 1)
+
+    def __segment(self, index: int) -> bytes:
+        if index in self.cache:
+            self.cache.move_to_end(index)
+            return self.cache[index]
+
+        self.handle.seek(self.body_offset + index * self.stride)
+        data = self.handle.read(self.stride)
+        plain = self.cipher.decrypt_segment(self.key, index, index == self.n_segments - 1, data)
+
+        self.cache[index] = plain
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return plain
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        self._checkClosed()
+        return self.pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._checkClosed()
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self.pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence ({whence})")
+
+        if pos < 0:
+            raise ValueError(f"Negative seek position {pos}")
+        self.pos = pos
+        return pos
+
+    def readinto(self, buffer) -> int:
+        self._checkClosed()
+        out = memoryview(buffer).cast("B")
+        written = 0
+
+        while written < len(out) and self.pos < self.size:
+            index, off = divmod(self.pos, self.segment_size)
+            seg = self.__segment(index)
+            n = min(len(out) - written, len(seg) - off)
+            out[written: written + n] = seg[off: off + n]
+            written += n
+            self.pos += n
+
+        return written
+
+    def close(self):
+        if not self.closed:
+            self.cache.clear()
+            self.handle.close()
+        super().close()
@@ -0,0 +1,107 @@
+import threading
+import time
+from typing import Any, Callable, Iterable, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# events, and what their size is:
+#   "encrypt", "decrypt"  a whole call to easyencrypt.encrypt/decrypt. size is None at start and the bytes output at end
+#   "kdf"                 a key derivation, including key cache lookups. size is the key length
+#   "chunk"               one chunk or segment going through the cipher. size is the bytes going in
+#   "compress"            compressing or decompressing one segment. size is the bytes going in
+#   "input"               waiting on a streaming input for the next block. size is None at start
+#   "output"              the caller holding on to an output block, e.g. writing it. size is the block length
+EVENTS = {"encrypt", "decrypt", "kdf", "chunk", "compress", "input", "output"}
+
+
+class Hooks:
+    # "chunk" events come from worker threads when segments are processed in parallel
+    def start(self, event: str, size: Optional[int]) -> Any:
+        # the return value is handed back to end(), e.g. a tracing span
+        return None
+
+    def end(self, event: str, size: Optional[int], seconds: float, token: Any) -> None:
+        pass
+
+
+class MultiHooks(Hooks):
+    def __init__(self, hooks: List[Hooks]):
+        self.hooks = hooks
+
+    def start(self, event: str, size: Optional[int]) -> Any:
+        return [h.start(event, size) for h in self.hooks]
+
+    def end(self, event: str, size: Optional[int], seconds: float, token: Any) -> None:
+        for h, t in zip(self.hooks, token):
+            h.end(event, size, seconds, t)
+
+
+__registered: List[Hooks] = []
+__lock = threading.Lock()
+
+
+def register(hooks: Hooks) -> None:
+    global __registered
+    with __lock:
+        __registered = __registered + [hooks]
+
+
+def unregister(hooks: Hooks) -> None:
+    global __registered
+    with __lock:
+        __registered = [h for h in __registered if h is not hooks]
+
+
+def resolve_hooks(hooks: Optional[Hooks]) -> Optional[Hooks]:
+    # None means nobody is listening, which callers check once so their hot loops run untouched
+    registered = __registered
+    if len(registered) == 0:
+        return hooks
+    if hooks is None and len(registered) == 1:
+        return registered[0]
+    return MultiHooks(registered + ([hooks] if hooks is not None else []))
+
+
+def timed(hooks: Hooks, event: str, size: Optional[int], fn: Callable[..., T], *args) -> T:
+    token = hooks.start(event, size)
+    start = time.perf_counter()
+    # a span that was started is always ended, even if the call fails
+    try:
+        return fn(*args)
+    finally:
+        hooks.end(event, size, time.perf_counter() - start, token)
+
+
+def timed_input(hooks: Hooks, input: Iterable[bytes]) -> Iterable[bytes]:
+    it = iter(input)
+    while True:
+        token = hooks.start("input", None)
+        start = time.perf_counter()
+        block = None
+        try:
+            block = next(it, None)
+        finally:
+            hooks.end("input", len(block) if block is not None else 0, time.perf_counter() - start, token)
+        if block is None:
+            return
+        yield block
+
+
+def timed_output(hooks: Hooks, event: str, output: Iterable[bytes], token: Any = None,
+                 start: Optional[float] = None) -> Iterable[bytes]:
+    # the span for the whole call may have been started by the caller before any output existed
+    if start is None:
+        token = hooks.start(event, None)
+        start = time.perf_counter()
+    total = 0
+    try:
+        for block in output:
+            total += len(block)
+            out_token = hooks.start("output", len(block))
+            out_start = time.perf_counter()
+            try:
+                yield block
+            finally:
+                hooks.end("output", len(block), time.perf_counter() - out_start, out_token)
+    finally:
+        hooks.end(event, total, time.perf_counter() - start, token)
@@ -0,0 +1,39 @@
+import json
+import os
+from typing import Dict, List, Optional, Union
+
+
+def path() -> str:
+    env = os.environ.get("EASYENCRYPT_PROFILE")
+    if env:
+        return env
+    config = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    return os.path.join(config, "easyencrypt", "profile.json")
+
+
+def load() -> Dict[str, Union[str, int, bool, None, Dict, List]]:
+    try:
+        with open(path(), "r") as f:
+            ret = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return ret if isinstance(ret, dict) else {}
+
+
+def get(section: str) -> Optional[Dict[str, Union[str, int, bool, None, Dict, List]]]:
+    ret = load().get(section)
+    return ret if isinstance(ret, dict) else None
+
+
+def put(section: str, value: Dict[str, Union[str, int, bool, None, Dict, List]]) -> str:
+    p = path()
+    profile = load()
+    profile[section] = value
+
+    os.makedirs(os.path.dirname(p) or ".", exist_ok=True)
+    # write then rename so a concurrent reader never sees half a profile
+    tmp = f"{p}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp, p)
+    return p
@@ -1,21 +1,24 @@
 from typing import Dict, List, Union, Iterable, Tuple, Optional
 
+import os
+import time
+
 import b64
-from kdfs.argon2kdf import Argon2Kdf
-from kdfs.scryptkdf import ScryptKdf
+import hostprofile
 from kdfs.kdf import Kdf
 from math import floor, log2
 import re
 import log
+from registry import Registry
 
-from securerandom import rand_unique_bytes
+from securerandom import rand_bytes, rand_unique_bytes
 
 
 def __parse_memory_unit(val: str) -> int:
     if re.fullmatch(r"\d+", val):
         return int(val)
 
-    mat = re.match(r"^(\d+(?:\.\d+)?)\s*([a-z]+)$")
+    mat = re.match(r"^(\d+(?:\.\d+)?)\s*([a-z]+)$", val)
     if not mat:
         raise ValueError(f"Expected a size. Got {val}")
 
@@ -42,7 +45,13 @@ def __parse_memory_unit(val: str) -> int:
     return int(round(size * units[unit]))
 
 
-def __parse_argon2(name: str, params: List[Tuple[str, Optional[str]]]) -> Argon2Kdf:
+def parse_memory_unit(val: str) -> int:
+    return __parse_memory_unit(val.strip().lower())
+
+
+def __parse_argon2(name: str, params: List[Tuple[str, Optional[str]]]) -> Kdf:
+    from kdfs.argon2kdf import Argon2Kdf
+
     ret = Argon2Kdf.sensitive()
 
     if name == "argon2":
@@ -76,7 +85,9 @@ def __parse_argon2(name: str, params: List[Tuple[str, Optional[str]]]) -> Argon2
     return ret
 
 
-def __parse_scrypt(name: str, params: List[Tuple[str, Optional[str]]]) -> ScryptKdf:
+def __parse_scrypt(name: str, params: List[Tuple[str, Optional[str]]]) -> Kdf:
+    from kdfs.scryptkdf import ScryptKdf
+
     ret = ScryptKdf.sensitive()
 
     if name != "scrypt":
@@ -108,43 +119,128 @@ def __parse_scrypt(name: str, params: List[Tuple[str, Optional[str]]]) -> Scrypt
     return ret
 
 
-
-__kdf_switcher = {
-    "argon2": (Argon2Kdf.deserialize, __parse_argon2),
-    "argon2id": (Argon2Kdf.deserialize, __parse_argon2),
-    "argon2d": (Argon2Kdf.deserialize, __parse_argon2),
-    "argon2i": (Argon2Kdf.deserialize, __parse_argon2),
-    "scrypt": (ScryptKdf.deserialize, __parse_scrypt)
-}
+# argon2 pulls in cffi, so kdf classes are only imported once one is actually used
+registry = Registry("kdf", "easyencrypt.kdfs")
+registry.register(["argon2", "argon2id", "argon2d", "argon2i"], "kdfs.argon2kdf:Argon2Kdf.deserialize", __parse_argon2)
+registry.register(["scrypt"], "kdfs.scryptkdf:ScryptKdf.deserialize", __parse_scrypt)
 
 
 def supported_kdfs() -> Iterable[str]:
-    return __kdf_switcher.keys()
+    return registry.names()
 
 
 def default_kdf() -> Kdf:
+    profile = hostprofile.get("kdf")
+    if profile is not None:
+        try:
+            return deserialize({**profile, "salt": b64.encode(rand_bytes(32))})
+        except (ValueError, KeyError, TypeError):
+            log.warning(f"Ignoring the invalid kdf in '{hostprofile.path()}'.\n")
+
+    from kdfs.argon2kdf import Argon2Kdf
+
     return Argon2Kdf.sensitive()
 
 
-def deserialize(props: Dict[str, Union[str, int, bool, None, Dict, List]]) -> Kdf:
-    if "algorithm" not in props:
-        raise ValueError("Kdf dictionary must include 'algorithm' field.")
+def __memory_limit() -> int:
+    # containers usually cap memory below what the host reports, so the cgroup limit wins
+    limits = []
+    for path in ["/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"]:
+        try:
+            with open(path) as f:
+                limits.append(int(f.read().strip()))
+        except (OSError, ValueError):
+            pass
+    try:
+        limits.append(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES"))
+    except (ValueError, OSError, AttributeError):
+        limits.append(2 * 1024 * 1024 * 1024)
+    return min(limits)
+
+
+def __time_derive(kdf: Kdf) -> float:
+    start = time.perf_counter()
+    kdf.derive("calibration", 32)
+    return time.perf_counter() - start
+
+
+def __calibrate_argon2(target_seconds: float, max_memory: int) -> Kdf:
+    from kdfs.argon2kdf import Argon2Kdf
+
+    parallelism = min(os.cpu_count() or 1, 8)
+    floor = 8 * parallelism
+    ret = Argon2Kdf(1, max(min(max_memory // 1024, 8 * 1024), floor), parallelism, Argon2Kdf.str_to_type("argon2id"))
+    t = __time_derive(ret)
+
+    # memory is what makes argon2 expensive for attackers, so double it while the time and memory budgets allow.
+    # time scales about linearly with memory, so only the final size is measured
+    while ret.memory_cost * 2 * 1024 <= max_memory and t * 2 <= target_seconds:
+        ret.memory_cost *= 2
+        t *= 2
+    t = __time_derive(ret)
+    while ret.memory_cost // 2 >= floor and t > target_seconds * 1.1:
+        ret.memory_cost //= 2
+        t = __time_derive(ret)
+
+    # each pass over memory costs about the same, so spend the rest of the budget on passes
+    ret.time_cost = max(1, int(target_seconds / t))
+    while ret.time_cost > 1 and __time_derive(ret) > target_seconds * 1.1:
+        ret.time_cost -= 1
 
-    if props["algorithm"] not in supported_kdfs():
-        raise ValueError(f"The given kdf algorithm '{props['algorithm']}' is not supported.")
+    return ret
 
-    return __kdf_switcher[props["algorithm"]][0](props)
 
+def __calibrate_scrypt(target_seconds: float, max_memory: int) -> Kdf:
+    from kdfs.scryptkdf import ScryptKdf
 
-def from_option_string(s: str) -> Kdf:
-    s = s.strip().lower()
+    ret = ScryptKdf(14, 8, 1)
+    t = __time_derive(ret)
 
-    name = re.sub(r":.*$", "", s)
-    params = re.sub(r"^.*?:", "", s) if ":" in s else ""
+    # scrypt uses 128 * r * n bytes and its time scales linearly with n; hashlib caps memory below 2 GiB
+    memory_cap = min(max_memory, 2 ** 31 - 1)
+    while 128 * ret.r * 2 ** (ret.log2_n + 1) < memory_cap and t * 2 <= target_seconds:
+        ret.log2_n += 1
+        t *= 2
+    while ret.log2_n > 10 and 128 * ret.r * 2 ** ret.log2_n >= memory_cap:
+        ret.log2_n -= 1
+        t /= 2
+    t = __time_derive(ret)
+    while ret.log2_n > 10 and t > target_seconds * 1.1:
+        ret.log2_n -= 1
+        t = __time_derive(ret)
 
-    par = [tuple(z) if len(z) == 2 else (z[0], None) for z in map(lambda x: x.strip().split("=") if "=" in x else [], params.split(",") if "," in params else [])]
+    # once memory is maxed out, p adds time without adding memory
+    ret.p = max(1, int(target_seconds / t))
+    while ret.p > 1 and __time_derive(ret) > target_seconds * 1.1:
+        ret.p -= 1
 
-    if name not in __kdf_switcher:
-        raise ValueError(f"The given kdf algorithm '{name}' is not supported.")
+    return ret
+
+
+def calibrate(target_seconds: float = 1.0, max_memory: Optional[int] = None, algorithm: str = "argon2") -> Kdf:
+    if target_seconds <= 0:
+        raise ValueError(f"The target time must be positive (was {target_seconds})")
+    if max_memory is None:
+        max_memory = __memory_limit() // 4
+    if max_memory <= 0:
+        raise ValueError(f"The memory budget must be positive (was {max_memory})")
+
+    if algorithm in {"argon2", "argon2id"}:
+        return __calibrate_argon2(target_seconds, max_memory)
+    if algorithm == "scrypt":
+        return __calibrate_scrypt(target_seconds, max_memory)
+    raise ValueError(f"Calibration supports argon2 and scrypt, not '{algorithm}'.")
+
+
+def save_profile(kdf: Kdf) -> str:
+    props = kdf.serialize()
+    props.pop("salt", None)
+    return hostprofile.put("kdf", props)
 
-    return __kdf_switcher[name][1](name, par)
+
+def deserialize(props: Dict[str, Union[str, int, bool, None, Dict, List]]) -> Kdf:
+    return registry.deserialize(props)
+
+
+def from_option_string(s: str) -> Kdf:
+    return registry.from_option_string(s)
@@ -0,0 +1,98 @@
+import hashlib
+import hmac
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from kdfs.kdf import Kdf
+from securerandom import rand_bytes
+
+
+class KeyCache:
+    def __init__(self, max_entries: int = 16, ttl: Optional[float] = 300, max_concurrent: Optional[int] = None):
+        if max_entries < 0:
+            raise ValueError(f"max_entries must be non-negative (was {max_entries})")
+        if max_concurrent is not None and max_concurrent < 1:
+            raise ValueError(f"max_concurrent must be positive (was {max_concurrent})")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # memory-hard kdfs can each take gigabytes, so a server may want to cap how many run at once
+        self.derivations = threading.BoundedSemaphore(max_concurrent) if max_concurrent is not None else None
+        # passwords are only ever stored as an hmac under this per-process secret
+        self.secret = rand_bytes(32)
+
+    @staticmethod
+    def __params(kdf: Kdf) -> str:
+        return json.dumps(kdf.serialize(), sort_keys=True, separators=(",", ":"))
+
+    def __key(self, kdf: Kdf, password: str, out_len: int) -> Tuple[str, int, bytes]:
+        pw_hash = hmac.new(self.secret, bytes(password, "utf-8"), hashlib.sha256).digest()
+        return self.__params(kdf), out_len, pw_hash
+
+    @staticmethod
+    def __zero(buf: bytearray) -> None:
+        # keys handed out are immutable copies, so only the cached buffer itself can be wiped
+        buf[:] = bytes(len(buf))
+
+    def __evict(self, key) -> None:
+        buf, _ = self.entries.pop(key)
+        self.__zero(buf)
+
+    def __sweep(self) -> None:
+        # every expired key is wiped, not just the one being looked up, so no key outlives its ttl by more than the
+        # time until the cache is next used
+        now = time.monotonic()
+        for key in [k for k, (_, expires) in self.entries.items() if expires is not None and expires <= now]:
+            self.__evict(key)
+
+    def derive(self, kdf: Kdf, password: str, out_len: int) -> bytes:
+        key = self.__key(kdf, password, out_len)
+
+        with self.lock:
+            self.__sweep()
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return bytes(entry[0])
+            self.misses += 1
+
+        # derivation can take seconds, so it runs without holding the lock
+        if self.derivations is not None:
+            with self.derivations:
+                ret = kdf.derive(password, out_len)
+        else:
+            ret = kdf.derive(password, out_len)
+
+        if self.max_entries == 0:
+            return ret
+
+        with self.lock:
+            self.__sweep()
+            if key in self.entries:
+                self.__evict(key)
+            expires = time.monotonic() + self.ttl if self.ttl is not None else None
+            self.entries[key] = (bytearray(ret), expires)
+            while len(self.entries) > self.max_entries:
+                self.__evict(next(iter(self.entries)))
+
+        return ret
+
+    def invalidate(self, kdf: Optional[Kdf] = None) -> None:
+        with self.lock:
+            self.__sweep()
+            params = self.__params(kdf) if kdf is not None else None
+            for key in [k for k in self.entries if params is None or k[0] == params]:
+                self.__evict(key)
+
+    def clear(self) -> None:
+        self.invalidate()
+
+    def __len__(self) -> int:
+        return len(self.entries)
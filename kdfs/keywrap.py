@@ -0,0 +1,41 @@
+from typing import Dict, List, Union
+
+import b64
+from securerandom import rand_bytes
+
+ALGORITHM = "aes-256-gcm"
+# the length of the key derived from the password to wrap the data key with
+KEY_LENGTH = 32
+NONCE_LENGTH = 12
+TAG_LENGTH = 16
+
+
+def wrap(kek: bytes, data_key: bytes) -> Dict[str, Union[str, int, bool, None, Dict, List]]:
+    from Crypto.Cipher import AES
+
+    # every wrap gets a fresh nonce, so files sharing a password-derived key never reuse one
+    nonce = rand_bytes(NONCE_LENGTH)
+    ct, tag = AES.new(kek, AES.MODE_GCM, nonce=nonce, mac_len=TAG_LENGTH).encrypt_and_digest(data_key)
+    return {
+        "algorithm": ALGORITHM,
+        "nonce": b64.encode(nonce),
+        "key": b64.encode(ct + tag)
+    }
+
+
+def unwrap(kek: bytes, props: Dict[str, Union[str, int, bool, None, Dict, List]]) -> bytes:
+    from Crypto.Cipher import AES
+
+    if not isinstance(props, dict) or props.get("algorithm") != ALGORITHM:
+        raise ValueError(f"The keywrap algorithm must be '{ALGORITHM}'.")
+    if "nonce" not in props or "key" not in props:
+        raise ValueError("The keywrap dictionary must have 'nonce' and 'key' fields.")
+
+    wrapped = b64.decode(props["key"])
+    if len(wrapped) < TAG_LENGTH:
+        raise ValueError("The wrapped key is too short to hold an authentication tag.")
+    try:
+        return AES.new(kek, AES.MODE_GCM, nonce=b64.decode(props["nonce"]), mac_len=TAG_LENGTH) \
+            .decrypt_and_verify(wrapped[:-TAG_LENGTH], wrapped[-TAG_LENGTH:])
+    except ValueError:
+        raise ValueError("The data key could not be unwrapped. The password is wrong or the header is corrupt.")
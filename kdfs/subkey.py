@@ -0,0 +1,29 @@
+from typing import Dict, List, Union
+
+import b64
+
+ALGORITHM = "hkdf-sha256"
+CONTEXT = b"easyencrypt file subkey"
+
+
+def derive(master: bytes, salt: bytes, out_len: int) -> bytes:
+    from Crypto.Hash import SHA256
+    from Crypto.Protocol.KDF import HKDF
+
+    return HKDF(master, out_len, salt, SHA256, context=CONTEXT)
+
+
+def serialize(salt: bytes) -> Dict[str, Union[str, int, bool, None, Dict, List]]:
+    return {
+        "algorithm": ALGORITHM,
+        "salt": b64.encode(salt)
+    }
+
+
+def deserialize(props: Dict[str, Union[str, int, bool, None, Dict, List]]) -> bytes:
+    if not isinstance(props, dict) or props.get("algorithm") != ALGORITHM:
+        raise ValueError(f"The subkey algorithm must be '{ALGORITHM}'.")
+    if "salt" not in props:
+        raise ValueError("The subkey dictionary is missing its 'salt' field.")
+
+    return b64.decode(props["salt"])
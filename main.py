@@ -1,39 +1,103 @@
-import easyencrypt
 import argparse
+from chunker import Chunker
 import sys
 import getpass
+import json
 import os
+import time
 import ciphers.cipherext
 import kdfs.kdfext
 import log
-
-
-
-def chunk(handle, size: int):
-    while len(buf := handle.read(size)) != 0:
-        yield buf
+import pipeline
 
 
 parser = argparse.ArgumentParser(
     description="Symmetrically encrypts or decrypts input.")
 parser.add_argument("action",
                     metavar="ACTION",
-                    help="'enc' to encrypt, 'dec' to decrypt. 'kdfs' to see a list of kdfs and their options. 'ciphers' to see a list of ciphers and their options")
+                    help="'enc' to encrypt, 'dec' to decrypt. 'append' to add input to the end of an appendable file given as ARGS. 'kdfs' to see a list of kdfs and their options. 'ciphers' to see a list of ciphers and their options. 'serve' to run a daemon on --socket. 'info' to show the headers of the files given as ARGS or under -r. 'rekey' to change the password of the files given as ARGS or under -r. 'addkey' and 'rmkey' to add or remove a password. 'verify' to check the files' authentication tags without decrypting them to disk")
+parser.add_argument("args",
+                    metavar="ARGS",
+                    nargs="*",
+                    help="arguments for the action. 'kdfs calibrate' finds the strongest kdf that fits --target-time and --max-memory. 'ciphers bench' measures each cipher and makes the fastest the default. 'info', 'rekey', 'addkey', 'rmkey' and 'verify' take the files to work on")
+parser.add_argument("--appendable",
+                    action="store_true",
+                    dest="appendable",
+                    help="with 'enc', write a file that 'append' can add to later",
+                    default=False)
+parser.add_argument("--base",
+                    dest="base",
+                    metavar="FILE",
+                    help="with 'enc', encrypt in chunks with the key of FILE, an earlier chunked file, so chunks the two share encrypt to the same bytes. implies --chunked",
+                    default=None)
 parser.add_argument("-c", "--cipher",
                     dest="cipher",
                     metavar="CIPHER[:PARAMS]?",
-                    help="the cipher to use along with any parameters",
+                    help="the cipher to use along with any parameters. by default this is $EASYENCRYPT_CIPHER, or the fastest cipher on this machine",
+                    default=None)
+parser.add_argument("--chunked",
+                    action="store_true",
+                    dest="chunked",
+                    help="with 'enc', cut the input into chunks by content and encrypt each one deterministically, so an edit only changes the chunks around it",
+                    default=False)
+parser.add_argument("-z", "--compress",
+                    dest="compress",
+                    metavar="ALGO[:LEVEL]?",
+                    help="compress before encrypting with zlib, lzma or zstd (if installed). decrypting inflates automatically",
                     default=None)
 parser.add_argument("-in", "--input",
                     dest="input",
                     metavar="FILE",
                     help="a file to encrypt. by default input is taken from stdin",
                     default=None)
+parser.add_argument("-j", "--jobs",
+                    dest="jobs",
+                    metavar="N",
+                    type=int,
+                    help="the number of segments to encrypt or decrypt at once. by default this is the number of cores",
+                    default=None)
+parser.add_argument("--json",
+                    action="store_true",
+                    dest="json",
+                    help="with 'info', print one JSON object per file instead of a table",
+                    default=False)
 parser.add_argument("-k", "--kdf",
                     dest="kdf",
                     metavar="KDF[:PARAMS]?",
                     help="the key derivation function to use along with any parameters",
                     default=None)
+parser.add_argument("-r", "--recursive",
+                    dest="recursive",
+                    metavar="DIR",
+                    help="encrypt or decrypt every file under DIR into the directory given by -out, running the kdf once",
+                    default=None)
+parser.add_argument("--label",
+                    dest="label",
+                    metavar="LABEL",
+                    help="with 'addkey', a label for the new key slot. with 'rmkey', the label of the slot to remove instead of the one the password unlocks",
+                    default=None)
+parser.add_argument("--max-kdf",
+                    dest="max_kdf",
+                    metavar="N",
+                    type=int,
+                    help="the most key derivations 'serve' runs at once (default 2)",
+                    default=2)
+parser.add_argument("--max-connections",
+                    dest="max_connections",
+                    metavar="N",
+                    type=int,
+                    help="the most connections 'serve' handles at once (default 16)",
+                    default=16)
+parser.add_argument("--max-memory",
+                    dest="max_memory",
+                    metavar="SIZE",
+                    help="the most memory 'kdfs calibrate' may use. by default this is a quarter of the memory available",
+                    default=None)
+parser.add_argument("--new-password-env-var",
+                    dest="new_pass_env",
+                    metavar="ENV_VAR",
+                    help="with 'rekey', the environment variable that contains the new password (default EASYENCRYPT_NEW_PW)",
+                    default="EASYENCRYPT_NEW_PW")
 parser.add_argument("-out", "--output",
                     dest="output",
                     metavar="FILE",
@@ -44,59 +108,361 @@ parser.add_argument("-pw", "--password-env-var",
                     metavar="ENV_VAR",
                     help="the name of the environment variable that contains the password (default EASYENCRYPT_PW). this is not the password itself",
                     default=None)
+parser.add_argument("--reuse-keys",
+                    action="store_true",
+                    dest="reuse_keys",
+                    help="let 'serve' keep derived keys in memory and reuse them for files with the same header",
+                    default=False)
+parser.add_argument("--slot",
+                    dest="slot",
+                    metavar="LABEL",
+                    help="only try the key slot with this label, so the kdfs of the other slots don't run",
+                    default=None)
+parser.add_argument("--socket",
+                    dest="socket",
+                    metavar="PATH",
+                    help="with 'serve', the unix socket to listen on. with 'enc' or 'dec', send the work to the daemon listening on PATH",
+                    default=None)
+parser.add_argument("--stats-json",
+                    dest="stats_json",
+                    metavar="FILE",
+                    help="write timings, throughput and peak memory of the run to FILE as JSON",
+                    default=None)
+parser.add_argument("--target-time",
+                    dest="target_time",
+                    metavar="SECONDS",
+                    type=float,
+                    help="how long 'kdfs calibrate' should make the kdf take (default 1)",
+                    default=1.0)
 parser.add_argument("-v", "--verbose",
                     action="store_true",
                     dest="verbose",
-                    help="display information to stderr",
+                    help="show progress while running and a breakdown of where the time went afterwards on stderr",
                     default=False)
 
-options = parser.parse_args()
-
-if options.input is None:
-    stdin = sys.stdin.buffer
-else:
-    stdin = open(options.input, "rb")
-
-if options.output is None:
-    stdout = sys.stdout.buffer
-else:
-    stdout = open(options.output, "wb")
+options = parser.parse_intermixed_args()
 
 if options.action is None:
     parser.print_help()
     sys.exit(0)
 
-if options.action not in {"enc", "dec", "kdfs", "ciphers"}:
+if options.action not in {"enc", "dec", "append", "kdfs", "ciphers", "serve", "info", "rekey", "addkey", "rmkey",
+                          "verify"}:
     parser.print_help()
-    print(f"\nAction must be one of [enc, dec, kdfs, ciphers], was {options.action}.")
+    print(f"\nAction must be one of [enc, dec, append, kdfs, ciphers, serve, info, rekey, addkey, rmkey, verify], was {options.action}.")
     sys.exit(1)
 
-if not stdin.isatty() and options.pass_env is None:
-    options.pass_env = "EASYENCRYPT_PW"
-password = os.environ.get(options.pass_env)
-if password is None:
-    if not sys.stdin.isatty():
-        log.error(f"\nThe password environment variable '{options.pass_env}' was not set and stdin is not a tty.")
+if options.action == "serve":
+    if options.socket is None:
+        log.error("\n'serve' needs a socket path given by --socket.")
+        sys.exit(1)
+    if options.max_kdf < 1:
+        log.error(f"\n--max-kdf must be positive, was {options.max_kdf}.")
+        sys.exit(1)
+    if options.max_connections < 1:
+        log.error(f"\n--max-connections must be positive, was {options.max_connections}.")
         sys.exit(1)
+    import daemon
+    try:
+        daemon.serve(options.socket, options.max_kdf, options.reuse_keys, options.max_connections)
+    except KeyboardInterrupt:
+        pass
+    except ValueError as e:
+        log.error(f"\n{e}\n")
+        sys.exit(1)
+    sys.exit(0)
+
+def read_password(env_var: str, prompt: str) -> str:
+    password = os.environ.get(env_var) if env_var is not None else None
+    if password is None:
+        if not sys.stdin.isatty():
+            log.error(f"\nThe password environment variable '{env_var}' was not set and stdin is not a tty.")
+            sys.exit(1)
+        password = getpass.getpass(prompt)
+    return password
+
+
+def batch_paths():
+    for root, dirs, files in os.walk(options.recursive):
+        dirs.sort()
+        for name in sorted(files):
+            yield os.path.join(root, name)
+
+
+if options.socket is not None and options.recursive is not None:
+    log.error("\n-r can't be combined with --socket.")
+    sys.exit(1)
+
+if options.action == "append" and (len(options.args) != 1 or options.recursive is not None or options.socket is not None):
+    log.error("\n'append' takes exactly one file to append to, and can't be combined with -r or --socket.")
+    sys.exit(1)
+
+if (options.chunked or options.base is not None) and (options.action != "enc" or options.socket is not None or
+                                                     options.recursive is not None):
+    log.error("\n--chunked and --base only work with 'enc', and can't be combined with -r or --socket.")
+    sys.exit(1)
+
+if options.action == "kdfs" and options.args == ["calibrate"]:
+    max_memory = kdfs.kdfext.parse_memory_unit(options.max_memory) if options.max_memory is not None else None
+    algorithm = kdfs.kdfext.from_option_string(options.kdf).serialize()["algorithm"] if options.kdf is not None else "argon2"
+    calibrated = kdfs.kdfext.calibrate(options.target_time, max_memory, algorithm)
+    props = calibrated.serialize()
+    props.pop("salt")
+    print(", ".join(f"{k}={v}" for k, v in props.items()))
+    print(f"Saved to {kdfs.kdfext.save_profile(calibrated)}. default_kdf() will use these parameters.")
+    sys.exit(0)
+
+if options.action == "ciphers" and options.args == ["bench"]:
+    results = ciphers.cipherext.benchmark()
+    for name, mb_per_s in results.items():
+        print(f"{name:<20} {mb_per_s:10.1f} MB/s")
+    print(f"Saved to {ciphers.cipherext.save_profile(results)}. "
+          f"default_cipher() will use {ciphers.cipherext.fastest(results)}.")
+    if os.environ.get(ciphers.cipherext.CIPHER_ENV):
+        log.warning(f"{ciphers.cipherext.CIPHER_ENV} is set and overrides it.\n")
+    sys.exit(0)
+
+if options.action in {"kdfs", "ciphers"}:
+    if len(options.args) > 0:
+        log.error(f"\nUnrecognized arguments {options.args} for '{options.action}'.")
+        sys.exit(1)
+    print("\n".join(kdfs.kdfext.supported_kdfs() if options.action == "kdfs" else ciphers.cipherext.supported_ciphers()))
+    sys.exit(0)
+
+if options.action == "info":
+    import easyencrypt
+    import parallel
+
+    if options.jobs is not None and options.jobs < 1:
+        log.error(f"\nThe number of jobs must be positive, was {options.jobs}.")
+        sys.exit(1)
+
+    def read_info(path):
+        try:
+            return path, easyencrypt.read_header(path), None
+        except (OSError, ValueError) as e:
+            return path, None, str(e)
+
+    def describe(params):
+        rest = ",".join(f"{k}={v}" for k, v in params.items() if k not in {"algorithm", "salt", "nonce"})
+        return str(params.get("algorithm")) + (":" + rest if rest != "" else "")
+
+    paths = options.args if options.recursive is None else batch_paths()
+    # reading headers waits on the disk rather than the cpu, so more threads than cores keep it busy
+    workers = options.jobs if options.jobs is not None else min(32, (os.cpu_count() or 1) + 4)
+    failed = False
+    if not options.json:
+        print(f"{'VERSION':<8}{'SEGMENT':<10}{'CIPHER':<20}{'COMPRESSION':<14}{'SLOTS':<6}{'KDF':<64}PATH")
+    for path, header, error in parallel.ordered_map(read_info, paths, workers):
+        failed = failed or error is not None
+        if options.json:
+            print(json.dumps({"path": path, "header": header} if error is None else {"path": path, "error": error}))
+        elif error is not None:
+            log.error(f"{path}: {error}\n")
+        else:
+            compression = header.get("compression")
+            print(f"{header.get('version', 1):<8}{header.get('segment_size', '-'):<10}"
+                  f"{describe(header.get('cipher', {})):<20}{describe(compression) if compression else '-':<14}"
+                  f"{len(easyencrypt.key_slots(header)) or '-':<6}"
+                  f"{describe(header.get('kdf', {})):<64}{path}")
+    sys.exit(1 if failed else 0)
+
+if options.action in {"rekey", "addkey", "rmkey"}:
+    import easyencrypt
+    from kdfs.keycache import KeyCache
+
+    paths = options.args if options.recursive is None else list(batch_paths())
+    if options.output is not None and len(paths) != 1:
+        log.error(f"\n'{options.action}' with -out takes exactly one file.")
+        sys.exit(1)
+    try:
+        kdf = kdfs.kdfext.from_option_string(options.kdf) if options.kdf is not None else None
+    except ValueError as e:
+        log.error(f"\n{e}\n")
+        sys.exit(1)
+
+    password = read_password(options.pass_env or "EASYENCRYPT_PW", "Enter current passphrase: ")
+    new_password = read_password(options.new_pass_env, "Enter new passphrase: ") if options.action != "rmkey" else None
+
+    def kdf_params(slot):
+        return json.dumps({k: v for k, v in slot["kdf"].items() if k != "salt"}, sort_keys=True)
+
+    # files from one batch share kdf parameters, so both the old and new keys are derived once for all of them.
+    # without -k, a new slot keeps the parameters of the one that was unlocked, with one fresh salt per set
+    key_cache = KeyCache(ttl=None)
+    new_kdfs = {}
+    failed = False
+    for path in paths:
+        try:
+            if options.action == "rmkey":
+                easyencrypt.remove_key(path, password, options.label, options.output, key_cache, options.slot)
+                continue
+
+            before = easyencrypt.key_slots(easyencrypt.read_header(path))
+            candidates = {kdf_params(s) for s in before if options.slot is None or s.get("label") == options.slot}
+            file_kdf = kdf if kdf is not None or len(candidates) != 1 else new_kdfs.get(candidates.pop())
+            if options.action == "rekey":
+                header = easyencrypt.rekey(path, password, new_password, file_kdf, options.output, key_cache,
+                                           options.slot)
+            else:
+                header = easyencrypt.add_key(path, password, new_password, file_kdf, options.label, options.output,
+                                             key_cache, options.slot)
+            if kdf is None:
+                new_slot = next(s for s in easyencrypt.key_slots(header) if s not in before)
+                new_kdfs.setdefault(kdf_params(new_slot), kdfs.kdfext.deserialize(new_slot["kdf"]))
+        except (OSError, ValueError) as e:
+            failed = True
+            log.error(f"{path}: {e}\n")
+    sys.exit(1 if failed else 0)
+
+if options.action == "verify":
+    import easyencrypt
+
+    if options.jobs is not None and options.jobs < 1:
+        log.error(f"\nThe number of jobs must be positive, was {options.jobs}.")
+        sys.exit(1)
+
+    paths = options.args if options.recursive is None else list(batch_paths())
+    if len(paths) == 0:
+        sys.exit(0)
+    password = read_password(options.pass_env or "EASYENCRYPT_PW", "Enter passphrase: ")
+
+    # many files are checked in -j processes, one file each; a lone file gets -j threads instead
+    if len(paths) == 1:
+        reports = easyencrypt.verify_many(password, paths, 1, options.jobs, options.slot)
     else:
-        password = getpass.getpass("Enter passphrase: ")
+        reports = easyencrypt.verify_many(password, paths, min(len(paths), options.jobs or os.cpu_count() or 1),
+                                          label=options.slot)
+    failed = False
+    for report in reports:
+        failed = failed or not report["ok"]
+        print(json.dumps(report), flush=True)
+    sys.exit(1 if failed else 0)
 
-if options.kdf is None:
-    kdf = kdfs.kdfext.default_kdf()
+# files are passed by path so they can be memory-mapped; stdin and pipes are streamed
+if options.input is None:
+    input = pipeline.read_blocks(sys.stdin.buffer)
 else:
-    kdf = kdfs.kdfext.from_option_string(options.kdf)
+    input = options.input
+
+# the base's header is read before -out is opened, since they're usually the same file
+base = None
+if options.base is not None and os.path.exists(options.base):
+    import easyencrypt
+    try:
+        base = easyencrypt.read_header(options.base)
+    except ValueError as e:
+        log.error(f"\n{options.base}: {e}\n")
+        sys.exit(1)
 
-if options.cipher is None:
-    cipher = ciphers.cipherext.default_cipher()
+if options.recursive is not None:
+    if options.output is None:
+        log.error("\n-r needs an output directory given by -out.")
+        sys.exit(1)
+    stdout = None
+elif options.output is None:
+    stdout = sys.stdout.buffer
 else:
-    cipher = ciphers.cipherext.from_option_string(options.cipher)
+    stdout = open(options.output, "wb")
+
+if (options.input is not None or not sys.stdin.isatty()) and options.pass_env is None:
+    options.pass_env = "EASYENCRYPT_PW"
+password = read_password(options.pass_env, "Enter passphrase: ")
+
+if options.jobs is not None and options.jobs < 1:
+    log.error(f"\nThe number of jobs must be positive, was {options.jobs}.")
+    sys.exit(1)
+
+# a daemon parses -k, -c and -z itself, so the client never imports the crypto backends
+kdf, cipher, compressor = None, None, None
+if options.socket is None:
+    import easyencrypt
+    import compressors.compressorext
+    try:
+        kdf = kdfs.kdfext.default_kdf() if options.kdf is None else kdfs.kdfext.from_option_string(options.kdf)
+        cipher = ciphers.cipherext.default_cipher(measure=True) if options.cipher is None else ciphers.cipherext.from_option_string(options.cipher)
+        if options.compress is not None:
+            compressor = compressors.compressorext.from_option_string(options.compress)
+    except ValueError as e:
+        log.error(f"\n{e}\n")
+        sys.exit(1)
+
+stats = None
+if options.verbose or options.stats_json is not None:
+    from stats import Stats
+
+    total = os.path.getsize(options.input) if options.input is not None and os.path.isfile(options.input) else None
+    last_progress = [0.0]
+
+    def show_progress(s):
+        now = time.monotonic()
+        if now - last_progress[0] >= 0.2:
+            last_progress[0] = now
+            sys.stderr.write("\r\033[K" + s.progress_line(total))
+            sys.stderr.flush()
+
+    stats = Stats(show_progress if options.verbose and sys.stderr.isatty() else None)
+
+
+def write_batch(outputs):
+    for path, chunks in outputs:
+        out_path = os.path.join(options.output, os.path.relpath(path, options.recursive))
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        with open(out_path, "wb") as out:
+            pipeline.write_blocks(out, chunks)
+
 
 try:
-    if options.action == "enc":
-        for chunk in easyencrypt.encrypt(password, kdf, cipher, chunk(stdin, 1024 * 1024)):
-            stdout.write(chunk)
+    if options.socket is not None:
+        import daemon
+        import hooks
+
+        def via_daemon(blocks):
+            output = daemon.request(options.socket, options.action, password, blocks, options.kdf, options.cipher,
+                                    options.jobs, options.compress, options.slot)
+            pipeline.write_blocks(stdout, hooks.timed_output(stats, options.action, output) if stats is not None
+                                  else output)
+
+        # the daemon is the one place a file given by path is streamed, so it's only opened here
+        if isinstance(input, str):
+            with open(input, "rb") as f:
+                via_daemon(pipeline.read_blocks(f))
+        else:
+            via_daemon(input)
+    elif options.recursive is not None and options.action == "enc":
+        write_batch(easyencrypt.encrypt_many(password, kdf, cipher, batch_paths(), workers=options.jobs, hooks=stats,
+                                             compressor=compressor))
+    elif options.recursive is not None and options.action == "dec":
+        write_batch(easyencrypt.decrypt_many(password, batch_paths(), workers=options.jobs, hooks=stats,
+                                             label=options.slot))
+    elif options.action == "enc" and base is not None:
+        pipeline.write_blocks(stdout, easyencrypt.encrypt_like(password, base, input, workers=options.jobs, hooks=stats,
+                                                               label=options.slot))
+    elif options.action == "enc":
+        # a --base that doesn't exist yet is written as a fresh chunked file, so the first run of a backup needs no flag
+        chunker = Chunker() if options.chunked or options.base is not None else None
+        pipeline.write_blocks(stdout, easyencrypt.encrypt(password, kdf, cipher, input, workers=options.jobs, hooks=stats,
+                                                          compressor=compressor, appendable=options.appendable,
+                                                          chunker=chunker))
+    elif options.action == "append" and not os.path.exists(options.args[0]):
+        # the first append to a log creates it
+        with open(options.args[0], "wb") as out:
+            pipeline.write_blocks(out, easyencrypt.encrypt(password, kdf, cipher, input, workers=options.jobs,
+                                                           hooks=stats, appendable=True))
+    elif options.action == "append":
+        easyencrypt.append(options.args[0], password, input, workers=options.jobs, label=options.slot)
     elif options.action == "dec":
-        for chunk in easyencrypt.decrypt(password, chunk(stdin, 1024 * 1024)):
-            stdout.write(chunk)
+        pipeline.write_blocks(stdout, easyencrypt.decrypt(password, input, workers=options.jobs, hooks=stats,
+                                                          label=options.slot))
 except Exception as e:
     sys.stderr.write(str(e) + "\n")
+
+if stats is not None:
+    stats.finish()
+    if stats.on_update is not None:
+        sys.stderr.write("\r\033[K")
+    if options.verbose:
+        sys.stderr.write(stats.summary())
+    if options.stats_json is not None:
+        with open(options.stats_json, "w") as f:
+            json.dump({"action": options.action, **stats.as_dict()}, f, indent=2)
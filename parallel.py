@@ -0,0 +1,36 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+U = TypeVar("U")
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def ordered_map(fn: Callable[[T], U], items: Iterable[T], workers: Optional[int] = None,
+                window: Optional[int] = None) -> Iterable[U]:
+    if workers is None:
+        workers = default_workers()
+    if workers < 1:
+        raise ValueError(f"The number of workers must be positive (was {workers})")
+    if window is None:
+        window = 2 * workers
+
+    if workers == 1:
+        for item in items:
+            yield fn(item)
+        return
+
+    # at most `window` items are in flight, so memory stays bounded no matter how far ahead the input is
+    with ThreadPoolExecutor(workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
@@ -0,0 +1,128 @@
+import queue
+import threading
+from collections import deque
+from typing import BinaryIO, Iterable, Optional
+
+from bufferedreader import DEFAULT_CHUNK_SIZE
+
+# how many blocks may sit between two stages; with the block in each stage that bounds memory at about 6 blocks
+DEFAULT_DEPTH = 4
+
+__DONE = object()
+
+
+def in_use(buf: bytearray) -> bool:
+    # a bytearray can't be resized while anything holds a view of it, so a no-op resize tells whether one is alive
+    try:
+        buf.append(0)
+    except BufferError:
+        return True
+    buf.pop()
+    return False
+
+
+class BufferPool:
+    def __init__(self, size: int, limit: int):
+        if size <= 0:
+            raise ValueError(f"The buffer size must be positive (was {size})")
+        self.size = size
+        self.limit = limit
+        self.free = deque()
+        self.lock = threading.Lock()
+        self.allocated = 0
+
+    def get(self) -> bytearray:
+        # a buffer a consumer still has a view of is skipped and looked at again next time
+        with self.lock:
+            for _ in range(len(self.free)):
+                buf = self.free.popleft()
+                if not in_use(buf):
+                    return buf
+                self.free.append(buf)
+            self.allocated += 1
+        return bytearray(self.size)
+
+    def put(self, buf: bytearray) -> None:
+        with self.lock:
+            if len(self.free) < self.limit:
+                self.free.append(buf)
+
+
+def __put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    # gives up once the other side has gone away, so an abandoned pipeline doesn't leave a thread blocked forever
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def read_blocks(handle: BinaryIO, buffer_size: int = DEFAULT_CHUNK_SIZE, depth: int = DEFAULT_DEPTH,
+                pool: Optional[BufferPool] = None) -> Iterable[memoryview]:
+    # a thread reads ahead into recycled buffers while the caller works on earlier blocks. file reads release the gil
+    if pool is None:
+        pool = BufferPool(buffer_size, depth + 2)
+    q = queue.Queue(depth)
+    stop = threading.Event()
+
+    def run():
+        try:
+            while True:
+                buf = pool.get()
+                n = handle.readinto(buf)
+                if not n:
+                    break
+                if not __put(q, (buf, n), stop):
+                    return
+            __put(q, __DONE, stop)
+        except BaseException as e:
+            __put(q, e, stop)
+
+    thread = threading.Thread(target=run, name="easyencrypt-reader", daemon=True)
+    thread.start()
+    try:
+        while (item := q.get()) is not __DONE:
+            if isinstance(item, BaseException):
+                raise item
+            buf, n = item
+            view = memoryview(buf)[:n]
+            yield view
+            # the buffer only goes back in the pool; it is reused once the consumer drops every view of it
+            del view
+            pool.put(buf)
+    finally:
+        # not joined, since the thread may be blocked reading a pipe that never ends; it exits after that read
+        stop.set()
+
+
+def write_blocks(handle: BinaryIO, blocks: Iterable[bytes], depth: int = DEFAULT_DEPTH) -> int:
+    # the caller's thread keeps producing blocks (e.g. encrypting) while a thread writes the earlier ones
+    q = queue.Queue(depth)
+    stop = threading.Event()
+    errors = []
+
+    def run():
+        try:
+            while (block := q.get()) is not __DONE:
+                handle.write(block)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    thread = threading.Thread(target=run, name="easyencrypt-writer", daemon=True)
+    thread.start()
+    total = 0
+    try:
+        for block in blocks:
+            if not __put(q, block, stop):
+                break
+            total += len(block)
+    finally:
+        # blocks already queued are written before returning, even when the producer failed
+        __put(q, __DONE, stop)
+        thread.join()
+    if len(errors) > 0:
+        raise errors[0]
+    return total
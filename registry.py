@@ -0,0 +1,96 @@
+import importlib
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import log
+
+Ref = Union[str, Callable]
+
+
+def resolve(ref: Ref) -> Callable:
+    # "package.module:Attr.attr" is only imported the first time it's needed
+    if callable(ref):
+        return ref
+    module, _, attrs = ref.partition(":")
+    ret: Any = importlib.import_module(module)
+    for attr in attrs.split("."):
+        ret = getattr(ret, attr)
+    return ret
+
+
+def parse_option_string(s: str) -> Tuple[str, List[Tuple[str, Optional[str]]]]:
+    s = s.strip().lower()
+
+    name = re.sub(r":.*$", "", s)
+    params = re.sub(r"^.*?:", "", s) if ":" in s else ""
+
+    par = [(x.strip().split("=", 1)[0], x.split("=", 1)[1].strip()) if "=" in x else (x.strip(), None)
+           for x in params.split(",") if x.strip() != ""]
+
+    return name, par
+
+
+def _entry_points(group: str) -> Iterable[Any]:
+    from importlib import metadata
+
+    eps = metadata.entry_points()
+    if hasattr(eps, "select"):
+        return eps.select(group=group)
+    return eps.get(group, [])
+
+
+class Registry:
+    def __init__(self, kind: str, group: str):
+        self.kind = kind
+        self.group = group
+        self.entries: Dict[str, Tuple[Ref, Ref]] = {}
+        self.plugins_loaded = False
+
+    def register(self, names: Iterable[str], deserialize: Ref, parse: Ref) -> None:
+        for name in names:
+            self.entries[name] = (deserialize, parse)
+
+    def __load_plugins(self) -> None:
+        # third-party packages register under the entry point group with the algorithm as the name and a class
+        # with static deserialize(props) and from_params(name, params) methods as the value
+        if self.plugins_loaded:
+            return
+        self.plugins_loaded = True
+        try:
+            eps = list(_entry_points(self.group))
+        except Exception as e:
+            log.warning(f"Could not list {self.kind} plugins: {e}\n")
+            return
+        for ep in eps:
+            if ep.name in self.entries:
+                continue
+
+            self.entries[ep.name] = (lambda props, ep=ep: ep.load().deserialize(props),
+                                     lambda name, params, ep=ep: ep.load().from_params(name, params))
+
+    def names(self) -> Iterable[str]:
+        self.__load_plugins()
+        return self.entries.keys()
+
+    def __contains__(self, name: str) -> bool:
+        if name in self.entries:
+            return True
+        self.__load_plugins()
+        return name in self.entries
+
+    def deserialize(self, props: Dict[str, Union[str, int, bool, None, Dict, List]]):
+        if "algorithm" not in props:
+            raise ValueError(f"{self.kind.capitalize()} dictionary must include 'algorithm' field.")
+
+        if props["algorithm"] not in self:
+            raise ValueError(f"The given {self.kind} algorithm '{props['algorithm']}' is not supported.")
+
+        return resolve(self.entries[props["algorithm"]][0])(props)
+
+    def from_option_string(self, s: str):
+        name, par = parse_option_string(s)
+
+        if name not in self:
+            raise ValueError(f"The given {self.kind} algorithm '{name}' is not supported.")
+
+        return resolve(self.entries[name][1])(name, par)
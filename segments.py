@@ -0,0 +1,358 @@
+import asyncio
+import hashlib
+import hmac
+import threading
+from collections import deque
+from concurrent.futures import Executor
+from typing import AsyncIterator, Callable, Iterable, Optional, Tuple, TypeVar, Union
+
+from bufferedreader import AsyncBufferedReader, BufferedReader
+from chunker import Chunker
+from ciphers.cipher import Cipher
+from compressors.compressor import Compressor
+from parallel import default_workers, ordered_map
+from hooks import Hooks, resolve_hooks, timed
+
+T = TypeVar("T")
+
+DEFAULT_SEGMENT_SIZE = 1024 * 1024
+
+# compressed segments start with one of these bytes, before encryption
+STORED = b'\x00'
+COMPRESSED = b'\x01'
+# compression stays on for the rest of the input only if the first segments shrank by at least this much
+SAMPLE_SEGMENTS = 4
+MIN_SAVING = 0.05
+# chunked files end with a zero length where the next chunk's would be, then the manifest
+SIV_LENGTH = 16
+END_OF_CHUNKS = bytes(4)
+MANIFEST_LENGTH = 32
+
+
+def split(br: BufferedReader, size: int) -> Iterable[Tuple[int, bool, Union[bytes, memoryview]]]:
+    # one segment of lookahead is needed to know which segment is the last
+    index = 0
+    cur = br.read_view(size)
+    while True:
+        nxt = br.read_view(size)
+        last = len(nxt) == 0
+        yield index, last, cur
+        if last:
+            return
+        cur = nxt
+        index += 1
+
+
+def __timed(fn: Callable[..., bytes], hooks: Optional[Hooks]) -> Callable[[Tuple[int, bool, bytes]], bytes]:
+    hooks = resolve_hooks(hooks)
+    if hooks is None:
+        return lambda seg: fn(*seg)
+    return lambda seg: timed(hooks, "chunk", len(seg[2]), fn, *seg)
+
+
+def encrypt(cipher: Cipher, key: bytes, input: Union[bytes, Iterable[bytes], str],
+            segment_size: int = DEFAULT_SEGMENT_SIZE, workers: Optional[int] = None,
+            window: Optional[int] = None, hooks: Optional[Hooks] = None) -> Iterable[bytes]:
+    if segment_size <= 0:
+        raise ValueError(f"The segment size must be positive (was {segment_size})")
+
+    fn = __timed(lambda *seg: cipher.encrypt_segment(key, *seg), hooks)
+    with BufferedReader(input) as br:
+        yield from ordered_map(fn, split(br, segment_size), workers, window)
+
+
+def decrypt(cipher: Cipher, key: bytes, input: Union[bytes, Iterable[bytes], str],
+            segment_size: int = DEFAULT_SEGMENT_SIZE, workers: Optional[int] = None,
+            window: Optional[int] = None, hooks: Optional[Hooks] = None) -> Iterable[bytes]:
+    if segment_size <= 0:
+        raise ValueError(f"The segment size must be positive (was {segment_size})")
+
+    # plaintext is only yielded once every earlier segment has authenticated
+    fn = __timed(lambda *seg: cipher.decrypt_segment(key, *seg), hooks)
+    with BufferedReader(input) as br:
+        yield from ordered_map(fn, split(br, segment_size + cipher.mac_length()), workers, window)
+
+
+def verify(cipher: Cipher, key: bytes, input: Union[bytes, Iterable[bytes], str],
+           segment_size: int = DEFAULT_SEGMENT_SIZE, workers: Optional[int] = None,
+           window: Optional[int] = None, hooks: Optional[Hooks] = None) -> int:
+    if segment_size <= 0:
+        raise ValueError(f"The segment size must be positive (was {segment_size})")
+
+    # the verify functions check every tag like their decrypt counterparts, but keep no plaintext
+    fn = __timed(lambda *seg: cipher.verify_segment(key, *seg), hooks)
+    with BufferedReader(input) as br:
+        return sum(ordered_map(fn, split(br, segment_size + cipher.mac_length()), workers, window))
+
+
+def encrypt_appendable(cipher: Cipher, key: bytes, input: Union[bytes, Iterable[bytes], str],
+                       segment_size: int = DEFAULT_SEGMENT_SIZE, workers: Optional[int] = None,
+                       window: Optional[int] = None, hooks: Optional[Hooks] = None,
+                       first_index: int = 0) -> Iterable[bytes]:
+    if segment_size <= 0:
+        raise ValueError(f"The segment size must be positive (was {segment_size})")
+
+    # an append starts at the old last segment, which is written again with the new data behind it
+    fn = __timed(lambda index, last, data: cipher.encrypt_appendable_segment(key, first_index + index, last, data),
+                 hooks)
+    with BufferedReader(input) as br:
+        yield from ordered_map(fn, split(br, segment_size), workers, window)
+
+
+def decrypt_appendable(cipher: Cipher, key: bytes, input: Union[bytes, Iterable[bytes], str],
+                       segment_size: int = DEFAULT_SEGMENT_SIZE, workers: Optional[int] = None,
+                       window: Optional[int] = None, hooks: Optional[Hooks] = None) -> Iterable[bytes]:
+    if segment_size <= 0:
+        raise ValueError(f"The segment size must be positive (was {segment_size})")
+
+    fn = __timed(lambda *seg: cipher.decrypt_appendable_segment(key, *seg), hooks)
+    with BufferedReader(input) as br:
+        yield from ordered_map(fn, split(br, segment_size + cipher.append_overhead()), workers, window)
+
+
+def verify_appendable(cipher: Cipher, key: bytes, input: Union[bytes, Iterable[bytes], str],
+                      segment_size: int = DEFAULT_SEGMENT_SIZE, workers: Optional[int] = None,
+                      window: Optional[int] = None, hooks: Optional[Hooks] = None) -> int:
+    if segment_size <= 0:
+        raise ValueError(f"The segment size must be positive (was {segment_size})")
+
+    fn = __timed(lambda *seg: cipher.verify_appendable_segment(key, *seg), hooks)
+    with BufferedReader(input) as br:
+        return sum(ordered_map(fn, split(br, segment_size + cipher.append_overhead()), workers, window))
+
+
+def encrypt_compressed(cipher: Cipher, key: bytes, compressor: Compressor, input: Union[bytes, Iterable[bytes], str],
+                       segment_size: int = DEFAULT_SEGMENT_SIZE, workers: Optional[int] = None,
+                       window: Optional[int] = None, hooks: Optional[Hooks] = None) -> Iterable[bytes]:
+    if segment_size <= 0:
+        raise ValueError(f"The segment size must be positive (was {segment_size})")
+
+    hooks = resolve_hooks(hooks)
+    lock = threading.Lock()
+    sample = {"raw": 0, "compressed": 0, "done": 0, "enabled": True}
+
+    def compress(index: int, data: Union[bytes, memoryview]) -> bytes:
+        if not sample["enabled"]:
+            return STORED + data
+        out = compressor.compress(data) if hooks is None else timed(hooks, "compress", len(data), compressor.compress, data)
+        if index < SAMPLE_SEGMENTS:
+            with lock:
+                sample["raw"] += len(data)
+                sample["compressed"] += len(out)
+                sample["done"] += 1
+                if sample["done"] == SAMPLE_SEGMENTS and sample["compressed"] > sample["raw"] * (1 - MIN_SAVING):
+                    sample["enabled"] = False
+        # a segment that didn't shrink is stored as is, so incompressible data only costs one byte per segment
+        return COMPRESSED + out if len(out) < len(data) else STORED + data
+
+    def encrypt_segment(seg: Tuple[int, bool, Union[bytes, memoryview]]) -> Tuple[bytes, bytes]:
+        index, last, data = seg
+        plain = compress(index, data)
+        if hooks is None:
+            out = cipher.encrypt_segment(key, index, last, plain)
+        else:
+            out = timed(hooks, "chunk", len(data), cipher.encrypt_segment, key, index, last, plain)
+        return len(out).to_bytes(4, "big"), out
+
+    # compressed segments vary in size, so each one is prefixed with its length
+    with BufferedReader(input) as br:
+        for head, out in ordered_map(encrypt_segment, split(br, segment_size), workers, window):
+            yield head
+            yield out
+
+
+def __read_frame(br: BufferedReader, max_length: int) -> Optional[Union[bytes, memoryview]]:
+    head = br.read(4)
+    if len(head) == 0:
+        return None
+    if len(head) != 4:
+        raise ValueError("The encrypted data is truncated (segment length cut off).")
+
+    length = int.from_bytes(head, "big")
+    if length > max_length:
+        raise ValueError(f"A segment claims to be {length} bytes, more than the most a segment can be ({max_length}).")
+
+    ret = br.read_view(length)
+    if len(ret) != length:
+        raise ValueError("The encrypted data is truncated (reached EOF in the middle of a segment).")
+    return ret
+
+
+def split_frames(br: BufferedReader, max_length: int) -> Iterable[Tuple[int, bool, Union[bytes, memoryview]]]:
+    index = 0
+    cur = __read_frame(br, max_length)
+    if cur is None:
+        raise ValueError("The encrypted data is truncated (no segments).")
+    while True:
+        nxt = __read_frame(br, max_length)
+        last = nxt is None
+        yield index, last, cur
+        if last:
+            return
+        cur = nxt
+        index += 1
+
+
+def decrypt_compressed(cipher: Cipher, key: bytes, compressor: Compressor, input: Union[bytes, Iterable[bytes], str],
+                       segment_size: int = DEFAULT_SEGMENT_SIZE, workers: Optional[int] = None,
+                       window: Optional[int] = None, hooks: Optional[Hooks] = None) -> Iterable[bytes]:
+    if segment_size <= 0:
+        raise ValueError(f"The segment size must be positive (was {segment_size})")
+
+    hooks = resolve_hooks(hooks)
+
+    def decrypt_segment(seg: Tuple[int, bool, Union[bytes, memoryview]]) -> bytes:
+        index, last, data = seg
+        if hooks is None:
+            plain = cipher.decrypt_segment(key, index, last, data)
+        else:
+            plain = timed(hooks, "chunk", len(data), cipher.decrypt_segment, key, index, last, data)
+
+        mode, body = plain[:1], memoryview(plain)[1:]
+        if mode == STORED:
+            return plain[1:]
+        if mode != COMPRESSED:
+            raise ValueError(f"Segment {index} has an unknown compression mode {mode!r}.")
+        # a segment never inflates past segment_size, which stops decompression bombs
+        if hooks is None:
+            return compressor.decompress(body, segment_size)
+        return timed(hooks, "compress", len(body), compressor.decompress, body, segment_size)
+
+    with BufferedReader(input) as br:
+        yield from ordered_map(decrypt_segment, split_frames(br, segment_size + 1 + cipher.mac_length()),
+                               workers, window)
+
+
+def verify_compressed(cipher: Cipher, key: bytes, input: Union[bytes, Iterable[bytes], str],
+                      segment_size: int = DEFAULT_SEGMENT_SIZE, workers: Optional[int] = None,
+                      window: Optional[int] = None, hooks: Optional[Hooks] = None) -> int:
+    if segment_size <= 0:
+        raise ValueError(f"The segment size must be positive (was {segment_size})")
+
+    # the tag covers the compressed segment, so nothing is inflated
+    fn = __timed(lambda *seg: cipher.verify_segment(key, *seg), hooks)
+    with BufferedReader(input) as br:
+        return sum(ordered_map(fn, split_frames(br, segment_size + 1 + cipher.mac_length()), workers, window))
+
+
+def __chunk_keys(key: bytes) -> Tuple[bytes, bytes, bytes]:
+    # the chunk cipher, the SIVs and the manifest each get their own key, derived from the file's data key
+    return tuple(hmac.new(key, b"easyencrypt chunk " + purpose, hashlib.sha256).digest()
+                 for purpose in [b"encryption", b"siv", b"manifest"])
+
+
+def encrypt_chunked(cipher: Cipher, key: bytes, chunker: Chunker, input: Union[bytes, Iterable[bytes], str],
+                    workers: Optional[int] = None, window: Optional[int] = None,
+                    hooks: Optional[Hooks] = None) -> Iterable[bytes]:
+    enc_key, siv_key, manifest_key = __chunk_keys(key)
+    hooks = resolve_hooks(hooks)
+
+    def encrypt_chunk(data: bytes) -> Tuple[bytes, bytes]:
+        siv = hmac.new(siv_key, data, hashlib.sha256).digest()[:SIV_LENGTH]
+        if hooks is None:
+            return siv, cipher.encrypt_chunk(enc_key, siv, data)
+        return siv, timed(hooks, "chunk", len(data), cipher.encrypt_chunk, enc_key, siv, data)
+
+    # chunks carry no index, so an edit early on doesn't change the bytes of any later chunk. their order and count
+    # are authenticated by the manifest, a MAC over every SIV in order, written after the last chunk
+    manifest = hmac.new(manifest_key, digestmod=hashlib.sha256)
+    for siv, out in ordered_map(encrypt_chunk, chunker.split(input), workers, window):
+        manifest.update(siv)
+        yield (len(siv) + len(out)).to_bytes(4, "big") + siv
+        yield out
+    yield END_OF_CHUNKS + manifest.digest()
+
+
+def __open_chunks(cipher: Cipher, key: bytes, input: Union[bytes, Iterable[bytes], str], max_size: int,
+                  fn: Callable[[bytes, bytes, Union[bytes, memoryview]], T], workers: Optional[int],
+                  window: Optional[int], hooks: Optional[Hooks]) -> Iterable[T]:
+    enc_key, siv_key, manifest_key = __chunk_keys(key)
+    hooks = resolve_hooks(hooks)
+    manifest = hmac.new(manifest_key, digestmod=hashlib.sha256)
+    trailer = []
+
+    def chunks(br: BufferedReader) -> Iterable[Tuple[bytes, Union[bytes, memoryview]]]:
+        while True:
+            frame = __read_frame(br, max_size + SIV_LENGTH + cipher.mac_length())
+            if frame is None:
+                raise ValueError("The encrypted data is truncated (the chunk manifest is missing).")
+            if len(frame) == 0:
+                trailer.append(br.read(MANIFEST_LENGTH + 1))
+                return
+            if len(frame) < SIV_LENGTH:
+                raise ValueError("A chunk is too short to hold its SIV.")
+            siv = bytes(frame[:SIV_LENGTH])
+            manifest.update(siv)
+            yield siv, frame[SIV_LENGTH:]
+
+    def open_chunk(chunk: Tuple[bytes, Union[bytes, memoryview]]) -> T:
+        siv, data = chunk
+        if hooks is None:
+            return fn(enc_key, siv, data)
+        return timed(hooks, "chunk", len(data), fn, enc_key, siv, data)
+
+    with BufferedReader(input) as br:
+        yield from ordered_map(open_chunk, chunks(br), workers, window)
+
+    if len(trailer[0]) != MANIFEST_LENGTH or not hmac.compare_digest(trailer[0], manifest.digest()):
+        raise ValueError("The chunk manifest failed authentication. Chunks were reordered, duplicated, removed, "
+                         "or the data is corrupt.")
+
+
+def decrypt_chunked(cipher: Cipher, key: bytes, input: Union[bytes, Iterable[bytes], str], max_size: int,
+                    workers: Optional[int] = None, window: Optional[int] = None,
+                    hooks: Optional[Hooks] = None) -> Iterable[bytes]:
+    yield from __open_chunks(cipher, key, input, max_size, cipher.decrypt_chunk, workers, window, hooks)
+
+
+def verify_chunked(cipher: Cipher, key: bytes, input: Union[bytes, Iterable[bytes], str], max_size: int,
+                   workers: Optional[int] = None, window: Optional[int] = None,
+                   hooks: Optional[Hooks] = None) -> int:
+    return sum(__open_chunks(cipher, key, input, max_size, cipher.verify_chunk, workers, window, hooks))
+
+
+async def __amap(fn: Callable[[int, bool, bytes], bytes], br: AsyncBufferedReader, size: int,
+                 workers: Optional[int], executor: Optional[Executor]) -> AsyncIterator[bytes]:
+    loop = asyncio.get_running_loop()
+    window = 2 * (workers or default_workers())
+    pending = deque()
+
+    # input is only read while fewer than `window` segments are in flight, so a slow consumer stalls the producer
+    try:
+        index = 0
+        cur = await br.read(size)
+        while True:
+            nxt = await br.read(size)
+            last = len(nxt) == 0
+            pending.append(loop.run_in_executor(executor, fn, index, last, cur))
+            if len(pending) >= window:
+                yield await pending.popleft()
+            if last:
+                break
+            cur = nxt
+            index += 1
+
+        while len(pending) > 0:
+            yield await pending.popleft()
+    finally:
+        for f in pending:
+            f.cancel()
+
+
+async def aencrypt(cipher: Cipher, key: bytes, br: AsyncBufferedReader, segment_size: int = DEFAULT_SEGMENT_SIZE,
+                   workers: Optional[int] = None, executor: Optional[Executor] = None) -> AsyncIterator[bytes]:
+    if segment_size <= 0:
+        raise ValueError(f"The segment size must be positive (was {segment_size})")
+
+    async for block in __amap(lambda *seg: cipher.encrypt_segment(key, *seg), br, segment_size, workers, executor):
+        yield block
+
+
+async def adecrypt(cipher: Cipher, key: bytes, br: AsyncBufferedReader, segment_size: int = DEFAULT_SEGMENT_SIZE,
+                   workers: Optional[int] = None, executor: Optional[Executor] = None) -> AsyncIterator[bytes]:
+    if segment_size <= 0:
+        raise ValueError(f"The segment size must be positive (was {segment_size})")
+
+    async for block in __amap(lambda *seg: cipher.decrypt_segment(key, *seg), br,
+                              segment_size + cipher.mac_length(), workers, executor):
+        yield block
@@ -0,0 +1,110 @@
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Union
+
+from hooks import Hooks
+
+
+def peak_rss() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    # linux reports kilobytes, macos bytes
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def rate(n: int, seconds: float) -> Optional[float]:
+    return n / seconds / 1e6 if seconds > 0 else None
+
+
+class Stats(Hooks):
+    def __init__(self, on_update: Optional[Callable[["Stats"], None]] = None):
+        self.lock = threading.Lock()
+        self.on_update = on_update
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        self.kdf_seconds = 0.0
+        # summed across worker threads, so with -j this can exceed the wall time
+        self.cipher_seconds = 0.0
+        self.compress_seconds = 0.0
+        self.input_seconds = 0.0
+        self.output_seconds = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def end(self, event: str, size: Optional[int], seconds: float, token: Any) -> None:
+        # hooks fire from worker and pipeline threads, so every counter is updated under the lock
+        with self.lock:
+            if event == "kdf":
+                self.kdf_seconds += seconds
+            elif event == "chunk":
+                self.bytes_in += size
+                self.cipher_seconds += seconds
+            elif event == "compress":
+                self.compress_seconds += seconds
+            elif event == "input":
+                self.input_seconds += seconds
+            elif event == "output":
+                self.bytes_out += size
+                self.output_seconds += seconds
+        if event == "output" and self.on_update is not None:
+            self.on_update(self)
+        elif event in {"encrypt", "decrypt"}:
+            self.finish()
+
+    def finish(self) -> None:
+        # called again by every stream that shares these stats, so the last one to finish sets the end
+        with self.lock:
+            self.end_time = time.perf_counter()
+
+    def elapsed(self) -> float:
+        return (self.end_time if self.end_time is not None else time.perf_counter()) - self.start_time
+
+    def as_dict(self) -> Dict[str, Union[int, float, None]]:
+        elapsed = self.elapsed()
+        return {
+            "elapsed_seconds": elapsed,
+            "kdf_seconds": self.kdf_seconds,
+            "cipher_seconds": self.cipher_seconds,
+            "compress_seconds": self.compress_seconds,
+            "input_wait_seconds": self.input_seconds,
+            "output_wait_seconds": self.output_seconds,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "cipher_mb_per_s": rate(self.bytes_in, self.cipher_seconds),
+            "overall_mb_per_s": rate(self.bytes_in, elapsed - self.kdf_seconds),
+            "peak_rss_bytes": peak_rss(),
+        }
+
+    def progress_line(self, total: Optional[int] = None) -> str:
+        elapsed = self.elapsed()
+        done = f"{self.bytes_in / 1e6:.1f}"
+        if total is not None and total > 0:
+            done += f"/{total / 1e6:.1f} MB ({min(100.0, 100 * self.bytes_in / total):.0f}%)"
+        else:
+            done += " MB"
+        mbps = rate(self.bytes_in, elapsed - self.kdf_seconds)
+        return (f"{done} {mbps or 0:.1f} MB/s, kdf {self.kdf_seconds:.2f}s, "
+                f"waiting on input {self.input_seconds:.2f}s, output {self.output_seconds:.2f}s")
+
+    def summary(self) -> str:
+        d = self.as_dict()
+
+        def fmt(mbps):
+            return f"{mbps:.1f} MB/s" if mbps is not None else "-"
+
+        lines = [
+            f"total        {d['elapsed_seconds']:.3f}s",
+            f"kdf          {d['kdf_seconds']:.3f}s",
+            f"cipher       {d['cipher_seconds']:.3f}s  {fmt(d['cipher_mb_per_s'])}",
+            f"compression  {d['compress_seconds']:.3f}s",
+            f"input wait   {d['input_wait_seconds']:.3f}s  {fmt(rate(self.bytes_in, self.input_seconds))}",
+            f"output wait  {d['output_wait_seconds']:.3f}s  {fmt(rate(self.bytes_out, self.output_seconds))}",
+            f"bytes        {d['bytes_in']} in, {d['bytes_out']} out  {fmt(d['overall_mb_per_s'])} overall",
+        ]
+        if d["peak_rss_bytes"] is not None:
+            lines.append(f"peak rss     {d['peak_rss_bytes'] / 1024 / 1024:.1f} MiB")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,56 @@
+from ciphers.aes256ocbcipher import Aes256OcbCipher
+from chunker import Chunker
+import ciphers.cipherext
+import segments
+import unittest
+
+from tests.symmetric import symmetric_test_env
+
+
+class TestAes256OcbCipher(unittest.TestCase):
+    def test_encrypt_decrypt(self):
+        key = bytes(range(32))
+        cipher = Aes256OcbCipher(bytes(range(15)))
+
+        enc, dec = symmetric_test_env(lambda x: cipher.encrypt(key, x), lambda x: cipher.decrypt(key, x))
+        self.assertEqual(enc, dec)
+
+    def test_verify(self):
+        # ocb holds back partial blocks, so lengths around the block size are the interesting ones
+        key = bytes(range(32))
+        cipher = Aes256OcbCipher(bytes(range(15)))
+
+        for n in [0, 1, 15, 16, 17, 100000]:
+            data = bytes(range(256)) * (n // 256) + bytes(n % 256)
+            enc = b''.join(cipher.encrypt(key, data))
+            self.assertEqual(len(enc), n + 16)
+            self.assertEqual(b''.join(cipher.decrypt(key, [enc[i: i + 7] for i in range(0, len(enc), 7)])), data)
+            self.assertEqual(cipher.verify(key, [enc[i: i + 7] for i in range(0, len(enc), 7)]), n)
+            self.assertRaises(ValueError, cipher.verify, key, enc[:-1] + bytes([enc[-1] ^ 1]))
+
+    def test_segments(self):
+        key = bytes(range(32))
+        cipher = Aes256OcbCipher(bytes(range(15)))
+        data = bytes(range(256)) * 40
+
+        for size in [1, 16, 71, 1000]:
+            enc, dec = symmetric_test_env(lambda x: segments.encrypt(cipher, key, x, size),
+                                          lambda x: segments.decrypt(cipher, key, x, size))
+            self.assertEqual(enc, dec)
+
+        enc = b''.join(segments.encrypt_appendable(cipher, key, data, 1000))
+        self.assertEqual(b''.join(segments.decrypt_appendable(cipher, key, enc, 1000)), data)
+
+        chunker = Chunker(64, 256, 1024)
+        enc = b''.join(segments.encrypt_chunked(cipher, key, chunker, data))
+        self.assertEqual(b''.join(segments.decrypt_chunked(cipher, key, enc, chunker.max_size)), data)
+        self.assertEqual(segments.verify_chunked(cipher, key, enc, chunker.max_size), len(data))
+
+    def test_serialize(self):
+        cipher = ciphers.cipherext.from_option_string("aes-256-ocb:nonce-len=12")
+        self.assertEqual(len(cipher.nonce), 12)
+        self.assertEqual(ciphers.cipherext.deserialize(cipher.serialize()).nonce, cipher.nonce)
+
+        self.assertRaises(ValueError, Aes256OcbCipher, bytes(16))
+        self.assertRaises(ValueError, ciphers.cipherext.from_option_string, "aes-256-ocb:nonce-len=16")
+        self.assertRaises(ValueError, Aes256OcbCipher.deserialize, {"algorithm": "aes-256-gcm", "nonce": "AAAA"})
@@ -0,0 +1,72 @@
+import json
+import unittest
+
+import binaryheader
+from chunker import Chunker
+from ciphers.aes256gcmcipher import Aes256GcmCipher
+from ciphers.aes256ocbcipher import Aes256OcbCipher
+from ciphers.chacha20poly1305cipher import ChaCha20Poly1305Cipher
+from ciphers.xchacha20poly1305cipher import XChaCha20Poly1305Cipher
+from compressors.zlibcompressor import ZlibCompressor
+from kdfs.argon2kdf import Argon2Kdf
+from kdfs.scryptkdf import ScryptKdf
+import kdfs.keywrap
+import kdfs.subkey
+
+
+class TestBinaryHeader(unittest.TestCase):
+    def headers(self):
+        yield {"kdf": Argon2Kdf.sensitive().serialize(), "cipher": Aes256GcmCipher().serialize()}
+        yield {"kdf": ScryptKdf.fast().serialize(), "cipher": ChaCha20Poly1305Cipher().serialize(),
+               "version": 2, "segment_size": 1024 * 1024}
+        yield {"kdf": Argon2Kdf.fast().serialize(), "cipher": Aes256GcmCipher().serialize(), "version": 3,
+               "segment_size": 4096, "subkey": kdfs.subkey.serialize(bytes(32)),
+               "compression": ZlibCompressor(9).serialize()}
+        yield {"kdf": ScryptKdf.fast().serialize(), "cipher": Aes256GcmCipher().serialize(),
+               "keywrap": kdfs.keywrap.wrap(bytes(32), bytes(range(32)))}
+        yield {"kdf": ScryptKdf.fast().serialize(), "cipher": Aes256GcmCipher().serialize(),
+               "keywrap": kdfs.keywrap.wrap(bytes(32), bytes(range(32))), "label": "ops",
+               "slots": [{"kdf": Argon2Kdf.fast().serialize(), "keywrap": kdfs.keywrap.wrap(bytes(32), bytes(32)),
+                          "label": "dev"},
+                         {"kdf": ScryptKdf.fast().serialize(), "keywrap": kdfs.keywrap.wrap(bytes(32), bytes(32))}]}
+        yield {"kdf": Argon2Kdf.fast().serialize(), "cipher": ChaCha20Poly1305Cipher().serialize(), "version": 5,
+               "segment_size": 262144, "keywrap": kdfs.keywrap.wrap(bytes(32), bytes(32)),
+               "chunking": Chunker().serialize()}
+        yield {"kdf": ScryptKdf.fast().serialize(), "cipher": Aes256OcbCipher().serialize(), "version": 2,
+               "segment_size": 65536, "keywrap": kdfs.keywrap.wrap(bytes(32), bytes(32))}
+        yield {"kdf": ScryptKdf.fast().serialize(), "cipher": XChaCha20Poly1305Cipher().serialize(), "version": 4,
+               "segment_size": 65536, "keywrap": kdfs.keywrap.wrap(bytes(32), bytes(32))}
+
+    def test_round_trip(self):
+        for header in self.headers():
+            body = binaryheader.encode(header)
+            self.assertNotEqual(body[0], binaryheader.JSON_START)
+            self.assertLess(len(body), len(json.dumps(header)) // 2)
+            self.assertEqual(binaryheader.decode(body), header)
+
+    def test_fallback(self):
+        header = next(self.headers())
+        self.assertIsNone(binaryheader.encode({**header, "extra": 1}))
+        self.assertIsNone(binaryheader.encode({**header, "cipher": {"algorithm": "serpent", "nonce": ""}}))
+        self.assertIsNone(binaryheader.encode({**header, "version": 2, "segment_size": 2 ** 32}))
+        self.assertIsNone(binaryheader.encode({**header, "slots": [{"kdf": header["kdf"], "keywrap": {}, "label": ""}]}))
+
+    def test_padding(self):
+        header = next(self.headers())
+        for n in [0, 3, 4, 100]:
+            self.assertEqual(binaryheader.decode(binaryheader.encode(header) + binaryheader.padding(n)), header)
+        self.assertRaises(ValueError, binaryheader.padding, 2)
+
+    def test_truncated(self):
+        for header in self.headers():
+            body = binaryheader.encode(header)
+            for n in range(1, len(body)):
+                try:
+                    decoded = binaryheader.decode(body[:n])
+                except ValueError:
+                    continue
+                # cutting off a whole extension still parses, but never to the same header
+                self.assertNotEqual(decoded, header)
+
+        with self.assertRaises(ValueError):
+            binaryheader.decode(b'\x01\x09')
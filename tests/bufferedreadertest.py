@@ -0,0 +1,72 @@
+from bufferedreader import BufferedReader
+import os
+import tempfile
+import unittest
+
+
+class TestBufferedReader(unittest.TestCase):
+    def setUp(self):
+        self.chunks = [bytes(range(i, 71 + i)) for i in range(6)]
+        self.flat = b''.join(self.chunks)
+
+    def test_read(self):
+        with BufferedReader(self.chunks) as br:
+            out = []
+            while len(buf := br.read(50)) != 0:
+                self.assertLessEqual(len(buf), 50)
+                out.append(buf)
+            self.assertEqual(b''.join(out), self.flat)
+            self.assertEqual(br.index, len(self.flat))
+
+    def test_read_all(self):
+        with BufferedReader(self.chunks) as br:
+            self.assertEqual(br.read(10), self.flat[:10])
+            self.assertEqual(br.read(), self.flat[10:])
+            self.assertEqual(br.read(), b'')
+
+    def test_pass_through(self):
+        with BufferedReader(self.chunks) as br:
+            self.assertIs(br.read(71), self.chunks[0])
+            self.assertEqual(list(map(bytes, br.chunks())), self.chunks[1:])
+            self.assertEqual(br.bytes_copied, 0)
+
+    def test_chunks_split(self):
+        with BufferedReader(self.chunks) as br:
+            out = list(br.chunks(30))
+            self.assertTrue(all(len(x) <= 30 for x in out))
+            self.assertEqual(b''.join(out), self.flat)
+            self.assertEqual(br.bytes_copied, 0)
+
+    def test_readinto_peek(self):
+        with BufferedReader(self.chunks) as br:
+            self.assertEqual(bytes(br.peek(100)), self.flat[:100])
+            buf = bytearray(100)
+            self.assertEqual(br.readinto(buf), 100)
+            self.assertEqual(bytes(buf), self.flat[:100])
+            self.assertEqual(bytes(br.peek(5)), self.flat[100:105])
+            self.assertEqual(bytes(br.read_view(1000)), self.flat[100:])
+            self.assertEqual(br.readinto(buf), 0)
+            self.assertEqual(br.peek(), b'')
+
+    def test_mapped_file(self):
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.flat)
+            with BufferedReader(path) as br:
+                self.assertIsNotNone(br.mmap)
+                self.assertEqual(bytes(br.read_view(100)), self.flat[:100])
+                self.assertEqual(b''.join(br.chunks(50)), self.flat[100:])
+                self.assertEqual(br.bytes_copied, 0)
+        finally:
+            os.remove(path)
+
+    def test_empty_file(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            with BufferedReader(path) as br:
+                self.assertIsNone(br.mmap)
+                self.assertEqual(br.read(), b'')
+        finally:
+            os.remove(path)
@@ -11,4 +11,20 @@ class TestAes256GcmCipher(unittest.TestCase):
         cipher = ChaCha20Poly1305Cipher(iv)
 
         enc, dec = symmetric_test_env(lambda x: cipher.encrypt(key, x), lambda x: cipher.decrypt(key, x))
-        self.assertEqual(enc, dec)
\ No newline at end of file
+        self.assertEqual(enc, dec)
+
+    def test_verify(self):
+        # the Poly1305-only check has to accept exactly what decrypting accepts
+        key = bytes(range(32))
+        cipher = ChaCha20Poly1305Cipher(bytes(range(12)))
+
+        for n in [0, 1, 16, 17, 100000]:
+            data = bytes(range(256)) * (n // 256) + bytes(n % 256)
+            enc = b''.join(cipher.encrypt(key, data))
+            self.assertEqual(cipher.verify(key, [enc[i: i + 7] for i in range(0, len(enc), 7)]), n)
+            self.assertRaises(ValueError, cipher.verify, key, enc[:-1] + bytes([enc[-1] ^ 1]))
+
+            seg = cipher.encrypt_appendable_segment(key, 5, False, data)
+            self.assertEqual(cipher.verify_appendable_segment(key, 5, False, seg), n)
+            self.assertRaises(ValueError, cipher.verify_appendable_segment, key, 5, True, seg)
+            self.assertRaises(ValueError, cipher.verify_segment, key, 0, False, seg[12:])
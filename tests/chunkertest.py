@@ -0,0 +1,61 @@
+import os
+import random
+import unittest
+
+from chunker import Chunker, GEAR
+
+
+def gear_cuts(chunker: Chunker, data: bytes):
+    # the byte at a time gear hash that cut_map computes all at once
+    bits = chunker.avg_size.bit_length() - 1
+    h, mask = 0, (1 << bits) - 1
+    for i, b in enumerate(data):
+        h = ((h << 1) + GEAR[b]) & mask
+        if h == 0:
+            yield i
+
+
+class TestChunker(unittest.TestCase):
+    def test_cut_map(self):
+        data = os.urandom(20000) + bytes(500) + b'ab' * 500
+        for avg in [2, 8, 256, 1024, 2 ** 13, 2 ** 16, 2 ** 20]:
+            chunker = Chunker(1, avg, avg)
+            cuts = chunker.cut_map(data[1000:], data[:1000])
+            self.assertEqual([i for i, b in enumerate(cuts) if b == 0], [i - 1000 for i in gear_cuts(chunker, data)
+                                                                         if i >= 1000])
+
+    def test_split(self):
+        chunker = Chunker(256, 1024, 4096)
+        data = os.urandom(200000) + bytes(20000)
+        chunks = list(chunker.split(data))
+        self.assertEqual(b''.join(chunks), data)
+        self.assertTrue(all(chunker.min_size <= len(c) <= chunker.max_size for c in chunks[:-1]))
+        # runs of zeros never hit a cut point, so they're cut at the max size
+        self.assertEqual(len(chunks[-2]), chunker.max_size)
+        self.assertEqual(list(chunker.split(b'')), [])
+
+        # where the input's blocks happen to end makes no difference
+        rng = random.Random(1)
+        blocks, pos = [], 0
+        while pos < len(data):
+            n = rng.choice([1, 7, 100, 5000, 70000])
+            blocks.append(data[pos: pos + n])
+            pos += n
+        self.assertEqual(list(chunker.split(blocks)), chunks)
+
+    def test_shift(self):
+        chunker = Chunker(256, 1024, 4096)
+        data = os.urandom(100000)
+        chunks = list(chunker.split(data))
+        edited = list(chunker.split(data[:50000] + b'inserted' + data[50000:]))
+        # only the chunks around the insertion change
+        self.assertLessEqual(len(set(edited) - set(chunks)), 2)
+
+    def test_serialize(self):
+        chunker = Chunker(100, 128, 1000)
+        same = Chunker.deserialize(chunker.serialize())
+        self.assertEqual((same.min_size, same.avg_size, same.max_size), (100, 128, 1000))
+        self.assertRaises(ValueError, Chunker, 16, 100, 1000)
+        self.assertRaises(ValueError, Chunker, 200, 128, 1000)
+        self.assertRaises(ValueError, Chunker.deserialize, {"algorithm": "rabin"})
+        self.assertRaises(ValueError, Chunker.deserialize, {"algorithm": "gear", "min_size": "1"})
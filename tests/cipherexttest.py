@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+import ciphers.cipherext
+import hostprofile
+from ciphers.aes256gcmcipher import Aes256GcmCipher
+from ciphers.chacha20poly1305cipher import ChaCha20Poly1305Cipher
+
+
+class TestCipherExt(unittest.TestCase):
+    def setUp(self):
+        fd, self.profile = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(self.profile)
+        self.old_env = {k: os.environ.get(k) for k in ["EASYENCRYPT_PROFILE", ciphers.cipherext.CIPHER_ENV]}
+        os.environ["EASYENCRYPT_PROFILE"] = self.profile
+        os.environ.pop(ciphers.cipherext.CIPHER_ENV, None)
+
+    def tearDown(self):
+        for k, v in self.old_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+        if os.path.exists(self.profile):
+            os.remove(self.profile)
+
+    def test_benchmark(self):
+        results = ciphers.cipherext.benchmark(0.01)
+        self.assertEqual(set(results.keys()), set(ciphers.cipherext.CANDIDATES))
+        self.assertTrue(all(v > 0 for v in results.values()))
+        self.assertEqual(ciphers.cipherext.fastest({"aes-256-gcm": 1.0, "chacha20-poly1305": 2.0}), "chacha20-poly1305")
+        self.assertRaises(ValueError, ciphers.cipherext.benchmark, 0)
+
+    def test_default_cipher(self):
+        # library callers get the static default and nothing is written
+        self.assertIsInstance(ciphers.cipherext.default_cipher(), Aes256GcmCipher)
+        self.assertFalse(os.path.exists(self.profile))
+
+        # the cli measures and saves once, later calls read the profile
+        first = ciphers.cipherext.default_cipher(measure=True)
+        entry = hostprofile.get("cipher")[ciphers.cipherext.cpu()]
+        self.assertEqual(first.serialize()["algorithm"], entry["algorithm"])
+
+        ciphers.cipherext.save_profile({"aes-256-gcm": 1.0, "chacha20-poly1305": 2.0})
+        self.assertIsInstance(ciphers.cipherext.default_cipher(), ChaCha20Poly1305Cipher)
+        ciphers.cipherext.save_profile({"aes-256-gcm": 2.0, "chacha20-poly1305": 1.0})
+        self.assertIsInstance(ciphers.cipherext.default_cipher(), Aes256GcmCipher)
+
+        # entries for other kinds of cpu are kept and don't apply here; old top-level keys are dropped
+        hostprofile.put("cipher", {"elsewhere": {"algorithm": "chacha20-poly1305"}, "algorithm": "aes-256-gcm",
+                                   "host": "old", "mb_per_s": {"aes-256-gcm": 1.0}})
+        self.assertIsInstance(ciphers.cipherext.default_cipher(), Aes256GcmCipher)
+        ciphers.cipherext.save_profile({"aes-256-gcm": 2.0, "chacha20-poly1305": 1.0})
+        self.assertEqual(set(hostprofile.get("cipher").keys()), {"elsewhere", ciphers.cipherext.cpu()})
+
+        os.environ[ciphers.cipherext.CIPHER_ENV] = "chacha20-poly1305"
+        self.assertIsInstance(ciphers.cipherext.default_cipher(), ChaCha20Poly1305Cipher)
+        os.environ[ciphers.cipherext.CIPHER_ENV] = "rot13"
+        self.assertRaises(ValueError, ciphers.cipherext.default_cipher)
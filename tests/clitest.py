@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(profile_dir: str, *args: str) -> subprocess.CompletedProcess:
+    # the cli saves cipher measurements to the profile, so it gets a throwaway one
+    env = {**os.environ, "EASYENCRYPT_PW": "hunter2", "EASYENCRYPT_PROFILE": os.path.join(profile_dir, "profile.json")}
+    return subprocess.run([sys.executable, os.path.join(ROOT, "main.py"), *args], capture_output=True, text=True,
+                          cwd=ROOT, env=env, stdin=subprocess.DEVNULL)
+
+
+class TestCli(unittest.TestCase):
+    def test_verify_nothing(self):
+        with tempfile.TemporaryDirectory() as d:
+            res = run(d, "verify")
+            self.assertEqual((res.returncode, res.stdout), (0, ""), res.stderr)
+
+            empty = os.path.join(d, "empty")
+            os.mkdir(empty)
+            res = run(d, "verify", "-r", empty)
+            self.assertEqual((res.returncode, res.stdout), (0, ""), res.stderr)
+
+    def test_enc_profile(self):
+        # enc without -c measures the ciphers once and saves them to the profile it's given
+        with tempfile.TemporaryDirectory() as d:
+            plain = os.path.join(d, "plain")
+            with open(plain, "wb") as f:
+                f.write(b'secret')
+            res = run(d, "enc", "-k", "scrypt:fast", "-in", plain, "-out", os.path.join(d, "enc"))
+            self.assertEqual(res.returncode, 0, res.stderr)
+            with open(os.path.join(d, "profile.json")) as f:
+                self.assertIn("cipher", json.load(f))
@@ -0,0 +1,43 @@
+import unittest
+import zlib
+
+import compressors.compressorext
+from compressors.lzmacompressor import LzmaCompressor
+from compressors.zlibcompressor import ZlibCompressor
+
+
+class TestCompressors(unittest.TestCase):
+    def test_round_trip(self):
+        data = b'{"level": "info", "msg": "request handled"}\n' * 100
+
+        for compressor in [ZlibCompressor(), ZlibCompressor(0), LzmaCompressor(1)]:
+            out = compressor.compress(data)
+            self.assertEqual(compressor.decompress(out, len(data)), data)
+            self.assertEqual(compressors.compressorext.deserialize(compressor.serialize()).serialize(),
+                             compressor.serialize())
+
+    def test_limits(self):
+        data = bytes(1024 * 1024)
+
+        for compressor in [ZlibCompressor(), LzmaCompressor()]:
+            out = compressor.compress(data)
+            with self.assertRaises(ValueError):
+                compressor.decompress(out, len(data) - 1)
+            with self.assertRaises(ValueError):
+                compressor.decompress(out[:-5], len(data))
+            with self.assertRaises(ValueError):
+                compressor.decompress(out + b'x', len(data))
+
+        with self.assertRaises(ValueError):
+            ZlibCompressor().decompress(zlib.compress(b'abc')[:2] + b'garbage', 100)
+
+    def test_from_option_string(self):
+        self.assertEqual(compressors.compressorext.from_option_string("zlib").level, 6)
+        self.assertEqual(compressors.compressorext.from_option_string("zlib:9").level, 9)
+        self.assertEqual(compressors.compressorext.from_option_string("xz:level=2").serialize(),
+                         {"algorithm": "lzma", "level": 2})
+
+        with self.assertRaises(ValueError):
+            compressors.compressorext.from_option_string("zlib:12")
+        with self.assertRaises(ValueError):
+            compressors.compressorext.from_option_string("brotli")
@@ -0,0 +1,91 @@
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+import daemon
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "ez.sock")
+        self.server = daemon.Server(self.path, max_kdf=1, reuse_keys=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.dir.cleanup()
+
+    def test_encrypt_decrypt(self):
+        data = [bytes(range(i, 71 + i)) * 1000 for i in range(6)]
+
+        enc = b''.join(daemon.request(self.path, "enc", "hunter2", data, kdf="scrypt:log2n=10,r=8", cipher="chacha20-poly1305"))
+        for _ in range(2):
+            dec = b''.join(daemon.request(self.path, "dec", "hunter2", [enc[i: i + 4096] for i in range(0, len(enc), 4096)]))
+            self.assertEqual(dec, b''.join(data))
+        self.assertEqual((self.server.key_cache.hits, self.server.key_cache.misses), (2, 1))
+
+    def test_error(self):
+        enc = b''.join(daemon.request(self.path, "enc", "hunter2", [b'secret'], kdf="scrypt:log2n=10,r=8"))
+
+        with self.assertRaises(ValueError):
+            b''.join(daemon.request(self.path, "dec", "hunter3", [enc]))
+        with self.assertRaises(ValueError):
+            b''.join(daemon.request(self.path, "rot13", "hunter2", [enc]))
+
+    def test_limits(self):
+        # a frame over the limit is refused before anything is allocated for it
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        sock.sendall(daemon.HEADER + (2 ** 31).to_bytes(4, "big"))
+        kind, payload = daemon.recv_frame(sock)
+        self.assertEqual(kind, daemon.ERROR)
+        self.assertIn(b"limit", payload)
+        sock.close()
+
+        # output longer than a frame comes back in several
+        data = os.urandom(3 * daemon.FRAME_SIZE)
+        enc = b''.join(daemon.request(self.path, "enc", "hunter2", [data], kdf="scrypt:log2n=10,r=8"))
+        self.assertEqual(b''.join(daemon.request(self.path, "dec", "hunter2", [enc])), data)
+
+    def test_socket_path(self):
+        # only an old socket is replaced; any other file at the path is left alone
+        path = os.path.join(self.dir.name, "notasock")
+        with open(path, "w") as f:
+            f.write("keep me")
+        self.assertRaises(ValueError, daemon.Server, path)
+        with open(path) as f:
+            self.assertEqual(f.read(), "keep me")
+
+        stale = os.path.join(self.dir.name, "stale.sock")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(stale)
+        sock.close()
+        server = daemon.Server(stale)
+        server.server_close()
+
+    def test_max_connections(self):
+        path = os.path.join(self.dir.name, "one.sock")
+        server = daemon.Server(path, max_kdf=1, max_connections=1)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            idle = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            idle.connect(path)
+
+            result = []
+            waiting = threading.Thread(target=lambda: result.append(b''.join(
+                daemon.request(path, "enc", "hunter2", [b'secret'], kdf="scrypt:log2n=10,r=8"))))
+            waiting.start()
+            waiting.join(0.5)
+            self.assertTrue(waiting.is_alive())
+
+            idle.close()
+            waiting.join(10)
+            self.assertEqual(len(result), 1)
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -1,9 +1,36 @@
+import asyncio
+import binaryheader
 import easyencrypt
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from chunker import Chunker
 from kdfs.argon2kdf import Argon2Kdf
+from kdfs.keycache import KeyCache
 from ciphers.aes256gcmcipher import Aes256GcmCipher
+from compressors.lzmacompressor import LzmaCompressor
+from compressors.zlibcompressor import ZlibCompressor
+from kdfs.scryptkdf import ScryptKdf
+from stats import Stats
 from tests.symmetric import symmetric_test_env
 
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class CountingKdf(ScryptKdf):
+    calls = 0
+
+    def derive(self, password: str, out_len: int) -> bytes:
+        self.calls += 1
+        return super().derive(password, out_len)
+
 
 class TestEasyEncryptDecrypt(unittest.TestCase):
     def test_encrypt_decrypt(self):
@@ -15,3 +42,389 @@ class TestEasyEncryptDecrypt(unittest.TestCase):
                                       lambda x: easyencrypt.decrypt(password, x))
 
         self.assertEqual(enc, dec)
+
+    def test_encrypt_decrypt_segments(self):
+        password = "hunter2"
+        kdf = Argon2Kdf.fast()
+        cipher = Aes256GcmCipher(b'0' * 16)
+
+        enc, dec = symmetric_test_env(lambda x: easyencrypt.encrypt(password, kdf, cipher, x, segment_size=50, workers=4),
+                                      lambda x: easyencrypt.decrypt(password, x))
+
+        self.assertEqual(enc, dec)
+
+    def test_encrypt_decrypt_legacy(self):
+        password = "hunter2"
+        kdf = Argon2Kdf.fast()
+        cipher = Aes256GcmCipher(b'0' * 16)
+
+        enc, dec = symmetric_test_env(lambda x: easyencrypt.encrypt(password, kdf, cipher, x, segment_size=None),
+                                      lambda x: easyencrypt.decrypt(password, x))
+
+        self.assertEqual(enc, dec)
+
+    def test_encrypt_decrypt_compressed(self):
+        password = "hunter2"
+        kdf = ScryptKdf.fast()
+        cipher = Aes256GcmCipher()
+
+        enc, dec = symmetric_test_env(lambda x: easyencrypt.encrypt(password, kdf, cipher, x, segment_size=50,
+                                                                    workers=4, compressor=ZlibCompressor()),
+                                      lambda x: easyencrypt.decrypt(password, x))
+        self.assertEqual(enc, dec)
+
+        text = b'{"level": "info", "msg": "request handled"}\n' * 1000
+        enc = b''.join(easyencrypt.encrypt(password, kdf, cipher, text, compressor=LzmaCompressor(1)))
+        self.assertLess(len(enc), len(text) // 10)
+        self.assertEqual(b''.join(easyencrypt.decrypt(password, enc)), text)
+
+        with self.assertRaises(ValueError):
+            easyencrypt.encrypt(password, kdf, cipher, text, segment_size=None, compressor=ZlibCompressor()).__next__()
+
+    def test_json_header(self):
+        password = "hunter2"
+        enc = b''.join(easyencrypt.encrypt(password, ScryptKdf.fast(), Aes256GcmCipher(), bytes(1000), segment_size=100))
+        self.assertNotEqual(enc[6:7], b'{')
+
+        # files written before the binary header existed still decrypt
+        header_len = int.from_bytes(enc[2:6], "big")
+        header = bytes(json.dumps(binaryheader.decode(enc[6: 6 + header_len])), "utf-8")
+        legacy = b'EZ' + len(header).to_bytes(4, "big") + header + enc[6 + header_len:]
+        self.assertEqual(b''.join(easyencrypt.decrypt(password, legacy)), bytes(1000))
+
+    def test_read_header(self):
+        enc = b''.join(easyencrypt.encrypt("hunter2", ScryptKdf.fast(), Aes256GcmCipher(), bytes(1000), segment_size=100))
+        header = easyencrypt.read_header(enc)
+        self.assertEqual(header["segment_size"], 100)
+        self.assertEqual(header["cipher"]["algorithm"], "aes-256-gcm")
+
+        with tempfile.TemporaryDirectory() as d:
+            # a padded JSON header is longer than the first read
+            body = bytes(json.dumps({**header, "padding": "x" * 5000}), "utf-8")
+            path = os.path.join(d, "big.ez")
+            with open(path, "wb") as f:
+                f.write(b'EZ' + len(body).to_bytes(4, "big") + body)
+            self.assertEqual(easyencrypt.read_header(path)["padding"], "x" * 5000)
+
+            with open(path, "wb") as f:
+                f.write(enc[:20])
+            self.assertRaises(ValueError, easyencrypt.read_header, path)
+
+    def test_rekey(self):
+        data = bytes(range(256)) * 100
+        with tempfile.TemporaryDirectory() as d:
+            path, copy = os.path.join(d, "a.ez"), os.path.join(d, "b.ez")
+            with open(path, "wb") as f:
+                for block in easyencrypt.encrypt("old", ScryptKdf.fast(), Aes256GcmCipher(), data, segment_size=1000):
+                    f.write(block)
+            size = os.path.getsize(path)
+
+            header = easyencrypt.rekey(path, "old", "new")
+            self.assertEqual(os.path.getsize(path), size)
+            self.assertEqual(easyencrypt.read_header(path), header)
+            self.assertEqual(b''.join(easyencrypt.decrypt("new", path)), data)
+            self.assertRaises(ValueError, easyencrypt.decrypt, "old", path)
+            self.assertRaises(ValueError, easyencrypt.rekey, path, "old", "newer")
+
+            # a smaller header is padded to fit in place; a bigger one moves the body behind it
+            easyencrypt.rekey(path, "new", "newer", Argon2Kdf.fast())
+            self.assertEqual(os.path.getsize(path), size)
+            self.assertEqual(b''.join(easyencrypt.decrypt("newer", path)), data)
+            easyencrypt.rekey(path, "newer", "newest", ScryptKdf(10, 8, 1, bytes(64)))
+            self.assertGreater(os.path.getsize(path), size)
+            self.assertEqual(b''.join(easyencrypt.decrypt("newest", path)), data)
+            easyencrypt.rekey(path, "newest", "copied", ScryptKdf.fast(), copy)
+            self.assertEqual(b''.join(easyencrypt.decrypt("copied", copy)), data)
+            self.assertEqual(b''.join(easyencrypt.decrypt("newest", path)), data)
+            self.assertEqual(os.listdir(d), ["a.ez", "b.ez"] if os.listdir(d)[0] == "a.ez" else ["b.ez", "a.ez"])
+
+            # files whose key came straight from the kdf can't be rekeyed
+            kdf, cipher = ScryptKdf.fast(), Aes256GcmCipher()
+            body = b''.join(cipher.encrypt(kdf.derive("old", 32), data))
+            header = bytes(json.dumps({"kdf": kdf.serialize(), "cipher": cipher.serialize()}), "utf-8")
+            with open(path, "wb") as f:
+                f.write(b'EZ' + len(header).to_bytes(4, "big") + header + body)
+            self.assertEqual(b''.join(easyencrypt.decrypt("old", path)), data)
+            self.assertRaises(ValueError, easyencrypt.rekey, path, "old", "new")
+
+    def test_key_slots(self):
+        data = bytes(range(256)) * 10
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "a.ez")
+            with open(path, "wb") as f:
+                for block in easyencrypt.encrypt("ops", ScryptKdf.fast(), Aes256GcmCipher(), data):
+                    f.write(block)
+
+            easyencrypt.add_key(path, "ops", "dev", new_label="dev")
+            easyencrypt.add_key(path, "dev", "qa", ScryptKdf(10, 8, 1), new_label="qa", label="dev")
+            header = easyencrypt.read_header(path)
+            self.assertEqual([s.get("label") for s in easyencrypt.key_slots(header)], [None, "dev", "qa"])
+            self.assertEqual(binaryheader.decode(binaryheader.encode(header)), header)
+            for password in ["ops", "dev", "qa"]:
+                self.assertEqual(b''.join(easyencrypt.decrypt(password, path)), data)
+            self.assertEqual(b''.join(easyencrypt.decrypt("qa", path, label="qa")), data)
+
+            # a label means only that slot's kdf runs
+            kdf_runs = []
+            key_cache = KeyCache()
+            key_cache.derive = lambda kdf, password, out_len: kdf_runs.append(kdf) or kdf.derive(password, out_len)
+            self.assertRaises(ValueError, easyencrypt.decrypt, "ops", path, key_cache=key_cache, label="qa")
+            self.assertEqual(len(kdf_runs), 1)
+            self.assertRaises(ValueError, easyencrypt.decrypt, "ops", path, label="nope")
+            self.assertRaises(ValueError, easyencrypt.add_key, path, "ops", "x", new_label="dev")
+
+            easyencrypt.rekey(path, "dev", "dev2", label="dev")
+            self.assertEqual(b''.join(easyencrypt.decrypt("dev2", path, label="dev")), data)
+            easyencrypt.remove_key(path, "qa", "dev")
+            easyencrypt.remove_key(path, "ops")
+            self.assertRaises(ValueError, easyencrypt.decrypt, "ops", path)
+            self.assertRaises(ValueError, easyencrypt.remove_key, path, "qa")
+            self.assertEqual([s.get("label") for s in easyencrypt.key_slots(easyencrypt.read_header(path))], ["qa"])
+            self.assertEqual(b''.join(easyencrypt.decrypt("qa", path)), data)
+
+    def test_append(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "log.ez")
+            with open(path, "wb") as f:
+                for block in easyencrypt.encrypt("pw", ScryptKdf.fast(), Aes256GcmCipher(), b'first ', segment_size=16,
+                                                 appendable=True):
+                    f.write(block)
+
+            expected = b'first '
+            for data in [b'', b'line', b'x' * 40, bytes(range(256)) * 4]:
+                size = os.path.getsize(path)
+                self.assertEqual(easyencrypt.append(path, "pw", data, workers=2), len(data))
+                expected += data
+                self.assertEqual(b''.join(easyencrypt.decrypt("pw", path)), expected)
+                # only the old last segment is written again, plus whatever the new bytes need
+                self.assertLessEqual(os.path.getsize(path) - size, len(data) + (len(data) // 16 + 1) * (12 + 16))
+
+            self.assertRaises(ValueError, easyencrypt.append, path, "wrong", b'x')
+            with open(path, "r+b") as f:
+                f.truncate(os.path.getsize(path) - 1)
+            self.assertRaises(ValueError, easyencrypt.append, path, "pw", b'x')
+
+        self.assertRaises(ValueError, lambda: b''.join(easyencrypt.encrypt("pw", ScryptKdf.fast(), Aes256GcmCipher(), b'',
+                                                                           appendable=True, compressor=ZlibCompressor())))
+
+    def test_interrupted_append(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "log.ez")
+            with open(path, "wb") as f:
+                for block in easyencrypt.encrypt("pw", ScryptKdf.fast(), Aes256GcmCipher(), b'first ', segment_size=16,
+                                                 appendable=True):
+                    f.write(block)
+
+            def failing():
+                yield b'x' * 100
+                raise OSError("input went away")
+
+            self.assertRaises(OSError, easyencrypt.append, path, "pw", failing(), workers=1)
+            self.assertEqual(b''.join(easyencrypt.decrypt("pw", path)), b'first ')
+            self.assertFalse(os.path.exists(path + ".append-journal"))
+
+            # a crash halfway through overwriting the old last segment leaves the journal for the next append
+            crash = (f"import os, sys\n"
+                     f"sys.path.insert(0, {ROOT!r})\n"
+                     f"import easyencrypt\n"
+                     f"pwrite = os.pwrite\n"
+                     f"def torn(fd, data, pos):\n"
+                     f"    pwrite(fd, data[:len(data) // 2], pos)\n"
+                     f"    os._exit(3)\n"
+                     f"os.pwrite = torn\n"
+                     f"easyencrypt.append({path!r}, 'pw', b'y' * 100, workers=1)\n")
+            self.assertEqual(subprocess.run([sys.executable, "-c", crash]).returncode, 3)
+            self.assertTrue(os.path.exists(path + ".append-journal"))
+
+            self.assertEqual(easyencrypt.append(path, "pw", b'second', workers=1), 6)
+            self.assertEqual(b''.join(easyencrypt.decrypt("pw", path)), b'first second')
+            self.assertFalse(os.path.exists(path + ".append-journal"))
+
+    def test_append_and_rekey(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "log.ez")
+            with open(path, "wb") as f:
+                for block in easyencrypt.encrypt("pw", ScryptKdf.fast(), Aes256GcmCipher(), b'first ', segment_size=16,
+                                                 appendable=True):
+                    f.write(block)
+
+            # a key slot edit rolls back an append a crash cut short, both in place and into a copy
+            crash = (f"import os, sys\n"
+                     f"sys.path.insert(0, {ROOT!r})\n"
+                     f"import easyencrypt\n"
+                     f"pwrite = os.pwrite\n"
+                     f"def torn(fd, data, pos):\n"
+                     f"    pwrite(fd, data[:len(data) // 2], pos)\n"
+                     f"    os._exit(3)\n"
+                     f"os.pwrite = torn\n"
+                     f"easyencrypt.append({path!r}, 'pw', b'y' * 100, workers=1)\n")
+            self.assertEqual(subprocess.run([sys.executable, "-c", crash]).returncode, 3)
+            copy = os.path.join(d, "copy.ez")
+            easyencrypt.add_key(path, "pw", "other", kdf=ScryptKdf.fast(), output=copy)
+            self.assertEqual(b''.join(easyencrypt.decrypt("other", copy)), b'first ')
+            self.assertFalse(os.path.exists(path + ".append-journal"))
+
+            # an append that waited on the lock of a file a key slot edit then replaced appends to the new file
+            import fcntl
+            fd = os.open(path, os.O_RDWR)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            appender = threading.Thread(target=easyencrypt.append, args=(path, "pw", b'second'), kwargs={"workers": 1})
+            appender.start()
+            time.sleep(0.2)
+            replacement = os.path.join(d, "replacement.ez")
+            shutil.copyfile(path, replacement)
+            os.replace(replacement, path)
+            os.close(fd)
+            appender.join(10)
+
+            self.assertFalse(appender.is_alive())
+            self.assertEqual(b''.join(easyencrypt.decrypt("pw", path)), b'first second')
+
+    def test_encrypt_like(self):
+        # fixed data, since where the chunks fall decides how much of the ciphertext the edit leaves alone
+        data = random.Random(0).randbytes(300000)
+        edited = data[:100000] + b'edit' + data[100000:]
+        chunker = Chunker(4096, 16384, 65536)
+
+        enc = b''.join(easyencrypt.encrypt("pw", ScryptKdf.fast(), Aes256GcmCipher(), data, chunker=chunker))
+        header = easyencrypt.read_header(enc)
+        self.assertEqual(header["version"], 5)
+        self.assertEqual(header["chunking"], chunker.serialize())
+        self.assertEqual(b''.join(easyencrypt.decrypt("pw", enc)), data)
+
+        enc2 = b''.join(easyencrypt.encrypt_like("pw", header, edited))
+        self.assertEqual(b''.join(easyencrypt.decrypt("pw", enc2)), edited)
+        self.assertEqual(easyencrypt.read_header(enc2), header)
+        # the chunks before and after the edit come out byte for byte the same
+        body = 6 + int.from_bytes(enc[2:6], "big")
+        self.assertEqual(enc[body: body + 65536], enc2[body: body + 65536])
+        self.assertEqual(enc[-100000:-36], enc2[-100000:-36])
+
+        self.assertRaises(ValueError, lambda: b''.join(easyencrypt.encrypt_like("wrong", header, edited)))
+        plain = easyencrypt.read_header(b''.join(easyencrypt.encrypt("pw", ScryptKdf.fast(), Aes256GcmCipher(), b'')))
+        self.assertRaises(ValueError, lambda: b''.join(easyencrypt.encrypt_like("pw", plain, edited)))
+        self.assertRaises(ValueError, lambda: b''.join(easyencrypt.encrypt("pw", ScryptKdf.fast(), Aes256GcmCipher(),
+                                                                           b'', chunker=chunker, appendable=True)))
+
+    def test_verify(self):
+        data = os.urandom(50000) + bytes(50000)
+        kdf = ScryptKdf.fast()
+        formats = [{"segment_size": None}, {"segment_size": 4096}, {"segment_size": 4096, "compressor": ZlibCompressor()},
+                   {"segment_size": 4096, "appendable": True}, {"chunker": Chunker(1024, 4096, 16384)}]
+
+        with tempfile.TemporaryDirectory() as d:
+            paths = []
+            for i, kwargs in enumerate(formats):
+                enc = b''.join(easyencrypt.encrypt("pw", kdf, Aes256GcmCipher(), data, **kwargs))
+                self.assertGreaterEqual(easyencrypt.verify("pw", enc), 0)
+                self.assertRaises(ValueError, easyencrypt.verify, "wrong", enc)
+                for bad in [enc[:-1], enc[:-3000] + bytes([enc[-3000] ^ 1]) + enc[-2999:]]:
+                    self.assertRaises(ValueError, easyencrypt.verify, "pw", bad)
+
+                paths.append(os.path.join(d, str(i)))
+                with open(paths[-1], "wb") as f:
+                    f.write(enc if i != 2 else enc[:-1])
+
+            self.assertEqual(list(easyencrypt.verify_many("pw", [], 4)), [])
+            expected = [True, True, False, True, True, False]
+            for processes in [1, 2]:
+                reports = list(easyencrypt.verify_many("pw", paths + [os.path.join(d, "missing")], processes))
+                self.assertEqual([r["path"] for r in reports], paths + [os.path.join(d, "missing")])
+                self.assertEqual([r["ok"] for r in reports], expected)
+                self.assertEqual(reports[0]["bytes"], os.path.getsize(paths[0]))
+
+        self.assertEqual(easyencrypt.verify("pw", b''.join(easyencrypt.encrypt("pw", kdf, Aes256GcmCipher(), data))),
+                         len(data))
+
+    def test_truncated_segments(self):
+        password = "hunter2"
+        kdf = Argon2Kdf.fast()
+        cipher = Aes256GcmCipher(b'0' * 16)
+
+        enc = b''.join(easyencrypt.encrypt(password, kdf, cipher, bytes(200), segment_size=50))
+        # drop the final segment so the file ends on a segment boundary
+        truncated = enc[:-(50 + 16)]
+
+        with self.assertRaises(ValueError):
+            b''.join(easyencrypt.decrypt(password, truncated))
+
+    def test_key_cache(self):
+        password = "hunter2"
+        cache = KeyCache()
+        enc = b''.join(easyencrypt.encrypt(password, Argon2Kdf.fast(), Aes256GcmCipher(), bytes(100)))
+
+        for _ in range(3):
+            self.assertEqual(b''.join(easyencrypt.decrypt(password, enc, key_cache=cache)), bytes(100))
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_encrypt_decrypt_many(self):
+        password = "hunter2"
+        kdf = CountingKdf(10, 8, 1)
+        inputs = [bytes(range(i)) for i in range(0, 200, 40)]
+
+        outputs = [b''.join(chunks) for _, chunks in easyencrypt.encrypt_many(password, kdf, Aes256GcmCipher(), inputs)]
+        self.assertEqual(kdf.calls, 1)
+        self.assertEqual(len(set(outputs)), len(outputs))
+
+        cache = KeyCache()
+        decrypted = [b''.join(chunks) for _, chunks in easyencrypt.decrypt_many(password, outputs, key_cache=cache)]
+        self.assertEqual(decrypted, inputs)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(b''.join(easyencrypt.decrypt(password, outputs[2])), inputs[2])
+
+    def test_stats(self):
+        password = "hunter2"
+        data = [bytes(range(i, 100 + i)) for i in range(50)]
+
+        for segment_size in [None, 1000]:
+            enc_stats, dec_stats = Stats(), Stats()
+            enc = b''.join(easyencrypt.encrypt(password, ScryptKdf.fast(), Aes256GcmCipher(), data,
+                                               segment_size=segment_size, workers=2, hooks=enc_stats))
+            dec = b''.join(easyencrypt.decrypt(password, enc, hooks=dec_stats))
+            self.assertEqual(dec, b''.join(data))
+
+            self.assertEqual(enc_stats.bytes_in, 5000)
+            self.assertEqual(enc_stats.bytes_out, len(enc))
+            self.assertEqual(dec_stats.bytes_out, 5000)
+            for s in [enc_stats, dec_stats]:
+                self.assertGreater(s.kdf_seconds, 0)
+                self.assertGreater(s.cipher_seconds, 0)
+                self.assertLessEqual(s.kdf_seconds, s.elapsed())
+            self.assertGreater(enc_stats.as_dict()["peak_rss_bytes"], 0)
+
+    def test_async(self):
+        password = "hunter2"
+        data = bytes(i % 256 for i in range(1000))
+
+        async def source(b: bytes):
+            for i in range(0, len(b), 67):
+                await asyncio.sleep(0)
+                yield b[i: i + 67]
+
+        async def collect(it):
+            return b''.join([block async for block in it])
+
+        async def run():
+            enc = await collect(easyencrypt.aencrypt(password, ScryptKdf.fast(), Aes256GcmCipher(), source(data),
+                                                     segment_size=100, workers=2))
+            self.assertEqual(b''.join(easyencrypt.decrypt(password, enc)), data)
+            self.assertEqual(await collect(easyencrypt.adecrypt(password, source(enc), workers=3)), data)
+
+            legacy = b''.join(easyencrypt.encrypt(password, ScryptKdf.fast(), Aes256GcmCipher(), data, segment_size=None))
+            self.assertEqual(await collect(easyencrypt.adecrypt(password, source(legacy))), data)
+
+            compressed = b''.join(easyencrypt.encrypt(password, ScryptKdf.fast(), Aes256GcmCipher(), data,
+                                                      segment_size=100, compressor=ZlibCompressor()))
+            self.assertEqual(await collect(easyencrypt.adecrypt(password, source(compressed))), data)
+
+            appendable = b''.join(easyencrypt.encrypt(password, ScryptKdf.fast(), Aes256GcmCipher(), data,
+                                                      segment_size=100, appendable=True))
+            self.assertEqual(await collect(easyencrypt.adecrypt(password, source(appendable))), data)
+            chunked = b''.join(easyencrypt.encrypt(password, ScryptKdf.fast(), Aes256GcmCipher(), data,
+                                                   chunker=Chunker(16, 64, 256)))
+            self.assertEqual(await collect(easyencrypt.adecrypt(password, source(chunked))), data)
+
+            with self.assertRaises(ValueError):
+                await collect(easyencrypt.adecrypt(password, source(enc[:-1])))
+
+        asyncio.run(run())
@@ -0,0 +1,54 @@
+import io
+import os
+import tempfile
+import unittest
+
+import easyencrypt
+from ciphers.chacha20poly1305cipher import ChaCha20Poly1305Cipher
+from kdfs.scryptkdf import ScryptKdf
+
+
+class TestEncryptedFile(unittest.TestCase):
+    def setUp(self):
+        self.password = "hunter2"
+        self.data = bytes(i % 251 for i in range(1000))
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, "wb") as f:
+            for chunk in easyencrypt.encrypt(self.password, ScryptKdf.fast(), ChaCha20Poly1305Cipher(), self.data,
+                                             segment_size=64):
+                f.write(chunk)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_read_ranges(self):
+        with easyencrypt.open(self.path, self.password) as f:
+            self.assertEqual(f.read(), self.data)
+            for start, length in [(0, 10), (60, 10), (64, 64), (500, 300), (990, 100), (1000, 5)]:
+                f.seek(start)
+                self.assertEqual(f.read(length), self.data[start: start + length])
+                self.assertEqual(f.tell(), min(start + length, len(self.data)))
+
+    def test_seek_end_readinto(self):
+        with easyencrypt.open(self.path, self.password, cache_size=1) as f:
+            self.assertEqual(f.seek(-100, io.SEEK_END), 900)
+            buf = bytearray(50)
+            self.assertEqual(f.readinto(buf), 50)
+            self.assertEqual(bytes(buf), self.data[900:950])
+            f.seek(-10, io.SEEK_CUR)
+            self.assertEqual(f.read(20), self.data[940:960])
+
+    def test_buffered(self):
+        with io.BufferedReader(easyencrypt.open(self.path, self.password), 16) as f:
+            f.seek(333)
+            self.assertEqual(f.read(100), self.data[333:433])
+
+    def test_decrypt_path(self):
+        self.assertEqual(b''.join(easyencrypt.decrypt(self.password, self.path)), self.data)
+
+    def test_truncated(self):
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - (1000 % 64 + 16))
+
+        with self.assertRaises(ValueError):
+            easyencrypt.open(self.path, self.password)
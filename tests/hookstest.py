@@ -0,0 +1,85 @@
+import threading
+import unittest
+
+import easyencrypt
+import hooks
+from ciphers.aes256gcmcipher import Aes256GcmCipher
+from hooks import Hooks
+from kdfs.scryptkdf import ScryptKdf
+
+
+class RecordingHooks(Hooks):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+
+    def start(self, event, size):
+        return event
+
+    def end(self, event, size, seconds, token):
+        assert token == event and seconds >= 0
+        with self.lock:
+            self.events.append((event, size))
+
+    def sizes(self, event):
+        return [size for e, size in self.events if e == event]
+
+
+class TestHooks(unittest.TestCase):
+    def test_events(self):
+        password = "hunter2"
+        data = [bytes(range(100))] * 10
+
+        for segment_size in [None, 300]:
+            h = RecordingHooks()
+            enc = b''.join(easyencrypt.encrypt(password, ScryptKdf.fast(), Aes256GcmCipher(), data,
+                                               segment_size=segment_size, workers=2, hooks=h))
+            self.assertEqual(h.sizes("kdf"), [32])
+            self.assertEqual(h.sizes("encrypt"), [len(enc)])
+            self.assertEqual(sum(h.sizes("chunk")), 1000)
+            self.assertEqual(sum(h.sizes("output")), len(enc))
+            self.assertEqual(sum(h.sizes("input")), 1000)
+            self.assertEqual(h.events[-1][0], "encrypt")
+
+            h = RecordingHooks()
+            self.assertEqual(b''.join(easyencrypt.decrypt(password, enc, hooks=h)), b''.join(data))
+            self.assertEqual(h.sizes("decrypt"), [1000])
+            self.assertEqual(len(h.sizes("kdf")), 1)
+            self.assertEqual(h.sizes("input"), [])
+
+    def test_failure(self):
+        # spans are closed even when the work inside them raises
+        h = RecordingHooks()
+
+        def fail():
+            raise ValueError("failed")
+
+        self.assertRaises(ValueError, hooks.timed, h, "kdf", 32, fail)
+        self.assertEqual(h.sizes("kdf"), [32])
+
+        def broken_input():
+            yield b'abc'
+            raise OSError("read failed")
+
+        with self.assertRaises(OSError):
+            list(hooks.timed_input(h, broken_input()))
+        self.assertEqual(h.sizes("input"), [3, 0])
+
+    def test_register(self):
+        password = "hunter2"
+        registered, passed = RecordingHooks(), RecordingHooks()
+        hooks.register(registered)
+        try:
+            enc = b''.join(easyencrypt.encrypt(password, ScryptKdf.fast(), Aes256GcmCipher(), bytes(100), hooks=passed))
+            b''.join(Aes256GcmCipher().encrypt(bytes(32), bytes(100)))
+        finally:
+            hooks.unregister(registered)
+
+        self.assertEqual(registered.sizes("encrypt"), [len(enc)])
+        self.assertEqual(passed.sizes("encrypt"), [len(enc)])
+        self.assertEqual(registered.sizes("chunk"), [100, 100])
+        self.assertEqual(passed.sizes("chunk"), [100])
+
+        b''.join(easyencrypt.decrypt(password, enc))
+        self.assertEqual(registered.sizes("decrypt"), [])
+        self.assertIsNone(hooks.resolve_hooks(None))
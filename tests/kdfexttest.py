@@ -0,0 +1,74 @@
+import os
+import tempfile
+import time
+import unittest
+
+import kdfs.kdfext
+from kdfs.argon2kdf import Argon2Kdf
+from kdfs.scryptkdf import ScryptKdf
+
+
+class TestKdfExt(unittest.TestCase):
+    def setUp(self):
+        fd, self.profile = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(self.profile)
+        self.old_profile = os.environ.get("EASYENCRYPT_PROFILE")
+        os.environ["EASYENCRYPT_PROFILE"] = self.profile
+
+    def tearDown(self):
+        if self.old_profile is None:
+            del os.environ["EASYENCRYPT_PROFILE"]
+        else:
+            os.environ["EASYENCRYPT_PROFILE"] = self.old_profile
+        if os.path.exists(self.profile):
+            os.remove(self.profile)
+
+    def test_calibrate_argon2(self):
+        kdf = kdfs.kdfext.calibrate(0.1, 16 * 1024 * 1024, "argon2")
+        self.assertIsInstance(kdf, Argon2Kdf)
+        self.assertLessEqual(kdf.memory_cost * 1024, 16 * 1024 * 1024)
+
+        start = time.perf_counter()
+        kdf.derive("hunter2", 32)
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+    def test_calibrate_scrypt(self):
+        kdf = kdfs.kdfext.calibrate(0.1, 16 * 1024 * 1024, "scrypt")
+        self.assertIsInstance(kdf, ScryptKdf)
+        self.assertLess(128 * kdf.r * 2 ** kdf.log2_n, 16 * 1024 * 1024)
+
+    def test_profile(self):
+        self.assertIsInstance(kdfs.kdfext.default_kdf(), Argon2Kdf)
+
+        saved = ScryptKdf(12, 8, 2)
+        kdfs.kdfext.save_profile(saved)
+        first, second = kdfs.kdfext.default_kdf(), kdfs.kdfext.default_kdf()
+
+        self.assertIsInstance(first, ScryptKdf)
+        self.assertEqual((first.log2_n, first.r, first.p), (12, 8, 2))
+        self.assertNotEqual(first.salt, second.salt)
+
+    def test_parse_memory_unit(self):
+        self.assertEqual(kdfs.kdfext.parse_memory_unit("1024"), 1024)
+        self.assertEqual(kdfs.kdfext.parse_memory_unit("2 MiB"), 2 * 1024 * 1024)
+        self.assertEqual(kdfs.kdfext.parse_memory_unit("1.5kb"), 1500)
+
+    def test_from_option_string(self):
+        fast = kdfs.kdfext.from_option_string("scrypt:fast")
+        self.assertEqual(fast.log2_n, ScryptKdf.fast().log2_n)
+
+        kdf = kdfs.kdfext.from_option_string("scrypt:log2n=12")
+        self.assertEqual(kdf.log2_n, 12)
+
+        kdf = kdfs.kdfext.from_option_string("scrypt:fast,r=4")
+        self.assertEqual((kdf.log2_n, kdf.r), (ScryptKdf.fast().log2_n, 4))
+
+        with self.assertRaises(ValueError):
+            kdfs.kdfext.from_option_string("bcrypt")
+
+    def test_deserialize(self):
+        kdf = ScryptKdf(12, 8, 1)
+        self.assertEqual(kdfs.kdfext.deserialize(kdf.serialize()).serialize(), kdf.serialize())
+        with self.assertRaises(ValueError):
+            kdfs.kdfext.deserialize({"algorithm": "bcrypt"})
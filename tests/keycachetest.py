@@ -0,0 +1,63 @@
+from kdfs.keycache import KeyCache
+from kdfs.scryptkdf import ScryptKdf
+import time
+import unittest
+
+
+class TestKeyCache(unittest.TestCase):
+    def test_hit_miss(self):
+        cache = KeyCache()
+        kdf = ScryptKdf.fast()
+
+        key = cache.derive(kdf, "hunter2", 32)
+        self.assertEqual(cache.derive(kdf, "hunter2", 32), key)
+        self.assertEqual(key, kdf.derive("hunter2", 32))
+        self.assertNotEqual(cache.derive(kdf, "hunter3", 32), key)
+        self.assertEqual(len(cache.derive(kdf, "hunter2", 16)), 16)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+    def test_max_entries(self):
+        cache = KeyCache(max_entries=2)
+        kdfs = [ScryptKdf.fast() for _ in range(3)]
+
+        for kdf in kdfs:
+            cache.derive(kdf, "hunter2", 32)
+        evicted = next(iter(cache.entries.values()))[0]
+        cache.derive(kdfs[0], "hunter2", 32)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(evicted, bytes(32))
+        self.assertEqual(cache.misses, 4)
+
+    def test_ttl(self):
+        cache = KeyCache(ttl=0.05)
+        kdf = ScryptKdf.fast()
+
+        cache.derive(kdf, "hunter2", 32)
+        time.sleep(0.1)
+        cache.derive(kdf, "hunter2", 32)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+    def test_sweep(self):
+        # a key that's never asked for again is still wiped once it expires
+        cache = KeyCache(ttl=0.05)
+        kdf, other = ScryptKdf.fast(), ScryptKdf.fast()
+
+        cache.derive(kdf, "hunter2", 32)
+        stale = next(iter(cache.entries.values()))[0]
+        time.sleep(0.1)
+        cache.derive(other, "hunter3", 32)
+
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(stale, bytes(32))
+
+    def test_invalidate(self):
+        cache = KeyCache()
+        kdf, other = ScryptKdf.fast(), ScryptKdf.fast()
+
+        cache.derive(kdf, "hunter2", 32)
+        cache.derive(other, "hunter2", 32)
+        cache.invalidate(kdf)
+        self.assertEqual(len(cache), 1)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
@@ -0,0 +1,66 @@
+import io
+import os
+import unittest
+
+import pipeline
+import segments
+from ciphers.aes256gcmcipher import Aes256GcmCipher
+
+
+class FailingIO(io.RawIOBase):
+    def readinto(self, buf):
+        raise OSError("read failed")
+
+    def write(self, b):
+        raise OSError("write failed")
+
+
+class TestPipeline(unittest.TestCase):
+    def test_read_blocks(self):
+        data = os.urandom(1000)
+        pool = pipeline.BufferPool(7, 6)
+        self.assertEqual(b''.join(bytes(v) for v in pipeline.read_blocks(io.BytesIO(data), pool=pool)), data)
+        # blocks that are copied out right away let the reader cycle through a handful of buffers
+        self.assertLess(pool.allocated, 20)
+
+    def test_held_views(self):
+        data = os.urandom(1000)
+        pool = pipeline.BufferPool(7, 6)
+        views = list(pipeline.read_blocks(io.BytesIO(data), pool=pool))
+        self.assertEqual(b''.join(views), data)
+        self.assertEqual(pool.allocated, len(views) + 1)
+
+    def test_in_use(self):
+        buf = bytearray(10)
+        view = memoryview(buf)[2:4]
+        self.assertTrue(pipeline.in_use(buf))
+        del view
+        self.assertFalse(pipeline.in_use(buf))
+        self.assertEqual(len(buf), 10)
+
+    def test_segments(self):
+        # segments hold zero-copy views of the recycled buffers while they are encrypted
+        key = bytes(range(32))
+        cipher = Aes256GcmCipher(bytes(range(12)))
+        data = os.urandom(10000)
+        enc = b''.join(segments.encrypt(cipher, key, pipeline.read_blocks(io.BytesIO(data), 100), 100, workers=3))
+        dec = b''.join(segments.decrypt(cipher, key, pipeline.read_blocks(io.BytesIO(enc), 116), 100, workers=3))
+        self.assertEqual(dec, data)
+
+    def test_write_blocks(self):
+        out = io.BytesIO()
+        blocks = [os.urandom(n) for n in range(100)]
+        self.assertEqual(pipeline.write_blocks(out, iter(blocks)), sum(len(b) for b in blocks))
+        self.assertEqual(out.getvalue(), b''.join(blocks))
+
+    def test_errors(self):
+        self.assertRaises(OSError, lambda: list(pipeline.read_blocks(FailingIO())))
+        self.assertRaises(OSError, pipeline.write_blocks, FailingIO(), [b'a'] * 100)
+
+        def failing_blocks():
+            yield b'a'
+            raise ValueError("bad input")
+
+        out = io.BytesIO()
+        self.assertRaises(ValueError, pipeline.write_blocks, out, failing_blocks())
+        self.assertEqual(out.getvalue(), b'a')
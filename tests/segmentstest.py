@@ -0,0 +1,123 @@
+from chunker import Chunker
+from ciphers.chacha20poly1305cipher import ChaCha20Poly1305Cipher
+from compressors.zlibcompressor import ZlibCompressor
+import os
+import segments
+import unittest
+
+from tests.symmetric import symmetric_test_env
+
+
+class TestSegments(unittest.TestCase):
+    def test_encrypt_decrypt(self):
+        key = bytes(range(32))
+        cipher = ChaCha20Poly1305Cipher(bytes(range(12)))
+
+        for size in [1, 16, 71, 1000]:
+            enc, dec = symmetric_test_env(lambda x: segments.encrypt(cipher, key, x, size),
+                                          lambda x: segments.decrypt(cipher, key, x, size))
+            self.assertEqual(enc, dec)
+
+    def test_empty(self):
+        key = bytes(range(32))
+        cipher = ChaCha20Poly1305Cipher(bytes(range(12)))
+
+        enc = b''.join(segments.encrypt(cipher, key, b'', 64))
+        self.assertEqual(len(enc), 16)
+        self.assertEqual(b''.join(segments.decrypt(cipher, key, enc, 64)), b'')
+
+    def test_reordered(self):
+        key = bytes(range(32))
+        cipher = ChaCha20Poly1305Cipher(bytes(range(12)))
+
+        enc = b''.join(segments.encrypt(cipher, key, bytes(range(96)), 32))
+        seg = 32 + 16
+        swapped = enc[seg:2 * seg] + enc[:seg] + enc[2 * seg:]
+
+        with self.assertRaises(ValueError):
+            b''.join(segments.decrypt(cipher, key, swapped, 32))
+
+    def test_parallel(self):
+        key = bytes(range(32))
+        cipher = ChaCha20Poly1305Cipher(bytes(range(12)))
+
+        for workers in [1, 2, 8]:
+            enc, dec = symmetric_test_env(lambda x: segments.encrypt(cipher, key, x, 16, workers),
+                                          lambda x: segments.decrypt(cipher, key, x, 16, workers, 3))
+            self.assertEqual(enc, dec)
+
+    def test_appendable(self):
+        key = bytes(range(32))
+        cipher = ChaCha20Poly1305Cipher(bytes(range(12)))
+
+        for size in [1, 16, 1000]:
+            enc, dec = symmetric_test_env(lambda x: segments.encrypt_appendable(cipher, key, x, size, 2),
+                                          lambda x: segments.decrypt_appendable(cipher, key, x, size, 2))
+            self.assertEqual(enc, dec)
+
+        enc = b''.join(segments.encrypt_appendable(cipher, key, bytes(range(96)), 32))
+        seg = 12 + 32 + 16
+        swapped = enc[seg:2 * seg] + enc[:seg] + enc[2 * seg:]
+        # dropping whole segments from the end is caught by the final-segment flag
+        for bad in [swapped, enc[:2 * seg], enc[:-1]]:
+            with self.assertRaises(ValueError):
+                b''.join(segments.decrypt_appendable(cipher, key, bad, 32))
+
+    def test_chunked(self):
+        key = bytes(range(32))
+        cipher = ChaCha20Poly1305Cipher(bytes(range(12)))
+        chunker = Chunker(16, 64, 256)
+
+        enc, dec = symmetric_test_env(lambda x: segments.encrypt_chunked(cipher, key, chunker, x, 2),
+                                      lambda x: segments.decrypt_chunked(cipher, key, x, 256, 2))
+        self.assertEqual(enc, dec)
+        self.assertEqual(b''.join(segments.decrypt_chunked(cipher, key, b''.join(
+            segments.encrypt_chunked(cipher, key, chunker, b'')), 256)), b'')
+
+        data = os.urandom(5000)
+        enc = b''.join(segments.encrypt_chunked(cipher, key, chunker, data))
+        # the same chunks always encrypt to the same bytes
+        self.assertEqual(b''.join(segments.encrypt_chunked(cipher, key, chunker, data)), enc)
+
+        first = 4 + int.from_bytes(enc[:4], "big")
+        second = first + 4 + int.from_bytes(enc[first: first + 4], "big")
+        swapped = enc[first: second] + enc[:first] + enc[second:]
+        dropped = enc[first:]
+        flipped = enc[:first - 1] + bytes([enc[first - 1] ^ 1]) + enc[first:]
+        for bad in [swapped, dropped, flipped, enc[:-1], enc[:-36], enc + b'\x00']:
+            with self.assertRaises(ValueError):
+                b''.join(segments.decrypt_chunked(cipher, key, bad, 256))
+
+    def test_compressed(self):
+        key = bytes(range(32))
+        cipher = ChaCha20Poly1305Cipher(bytes(range(12)))
+        compressor = ZlibCompressor()
+
+        for workers in [1, 4]:
+            enc, dec = symmetric_test_env(lambda x: segments.encrypt_compressed(cipher, key, compressor, x, 50, workers),
+                                          lambda x: segments.decrypt_compressed(cipher, key, compressor, x, 50, workers))
+            self.assertEqual(enc, dec)
+
+        text = b'{"level": "info", "msg": "request handled"}\n' * 1000
+        enc = b''.join(segments.encrypt_compressed(cipher, key, compressor, text, 4096, 2))
+        self.assertLess(len(enc), len(text) // 10)
+        self.assertEqual(b''.join(segments.decrypt_compressed(cipher, key, compressor, enc, 4096, 2)), text)
+
+        with self.assertRaises(ValueError):
+            b''.join(segments.decrypt_compressed(cipher, key, compressor, enc[:-30], 4096))
+
+    def test_incompressible(self):
+        key = bytes(range(32))
+        cipher = ChaCha20Poly1305Cipher(bytes(range(12)))
+        compressor = ZlibCompressor()
+        data = os.urandom(64 * 1024)
+
+        calls = []
+        compress = compressor.compress
+        compressor.compress = lambda b: calls.append(len(b)) or compress(b)
+
+        enc = b''.join(segments.encrypt_compressed(cipher, key, compressor, data, 1024, 1))
+        # after sampling, segments are stored without trying to compress them
+        self.assertEqual(len(calls), segments.SAMPLE_SEGMENTS)
+        self.assertEqual(len(enc), len(data) + 64 * (4 + 1 + 16))
+        self.assertEqual(b''.join(segments.decrypt_compressed(cipher, key, compressor, enc, 1024)), data)
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = {"Crypto", "argon2", "_cffi_backend", "asyncio"}
+# main.py kdfs may take this many times as long as a bare interpreter, plus some slack for the spawn itself
+BUDGET = 10
+SLACK = 0.1
+
+
+def imported_modules(*args: str):
+    # which modules were imported is deterministic, unlike how long it took
+    res = subprocess.run([sys.executable, "-X", "importtime", os.path.join(ROOT, "main.py"), *args],
+                         capture_output=True, text=True, cwd=ROOT)
+    modules = set()
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        modules.add(line[len("import time:"):].split("|")[2].strip())
+    return res, modules
+
+
+def best_time(*argv: str, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *argv], capture_output=True, cwd=ROOT, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+class TestStartup(unittest.TestCase):
+    def check(self, *args: str):
+        res, modules = imported_modules(*args)
+        self.assertEqual(res.returncode, 0, res.stderr)
+
+        heavy = {name for name in modules if name.split(".")[0] in HEAVY_MODULES}
+        self.assertEqual(heavy, set())
+        return res.stdout.split()
+
+    def test_kdfs(self):
+        self.assertIn("argon2id", self.check("kdfs"))
+
+    def test_ciphers(self):
+        self.assertIn("aes-256-gcm", self.check("ciphers"))
+
+    def test_budget(self):
+        # both are measured in the same run, so a loaded machine slows them down alike
+        baseline = best_time("-c", "pass")
+        kdfs = best_time(os.path.join(ROOT, "main.py"), "kdfs")
+        self.assertLessEqual(kdfs, baseline * BUDGET + SLACK,
+                             f"main.py kdfs took {kdfs:.3f}s, python -c pass took {baseline:.3f}s")
@@ -0,0 +1,64 @@
+from ciphers.xchacha20poly1305cipher import XChaCha20Poly1305Cipher, hchacha20
+from chunker import Chunker
+import ciphers.cipherext
+import segments
+import unittest
+
+from tests.symmetric import symmetric_test_env
+
+
+class TestXChaCha20Poly1305Cipher(unittest.TestCase):
+    def test_encrypt_decrypt(self):
+        key = bytes(range(32))
+        cipher = XChaCha20Poly1305Cipher(bytes(range(24)))
+
+        enc, dec = symmetric_test_env(lambda x: cipher.encrypt(key, x), lambda x: cipher.decrypt(key, x))
+        self.assertEqual(enc, dec)
+
+    def test_verify(self):
+        # the Poly1305-only check goes through HChaCha20, and has to accept exactly what decrypting accepts
+        key = bytes(range(32))
+        cipher = XChaCha20Poly1305Cipher(bytes(range(24)))
+
+        for n in [0, 1, 16, 17, 100000]:
+            data = bytes(range(256)) * (n // 256) + bytes(n % 256)
+            enc = b''.join(cipher.encrypt(key, data))
+            self.assertEqual(cipher.verify(key, [enc[i: i + 7] for i in range(0, len(enc), 7)]), n)
+            self.assertRaises(ValueError, cipher.verify, key, enc[:-1] + bytes([enc[-1] ^ 1]))
+
+            seg = cipher.encrypt_appendable_segment(key, 5, False, data)
+            self.assertEqual(len(seg), n + 24 + 16)
+            self.assertEqual(cipher.decrypt_appendable_segment(key, 5, False, seg), data)
+            self.assertEqual(cipher.verify_appendable_segment(key, 5, False, seg), n)
+            self.assertRaises(ValueError, cipher.verify_appendable_segment, key, 5, True, seg)
+
+    def test_segments(self):
+        key = bytes(range(32))
+        cipher = XChaCha20Poly1305Cipher(bytes(range(24)))
+        data = bytes(range(256)) * 40
+
+        enc = b''.join(segments.encrypt(cipher, key, data, 1000))
+        self.assertEqual(b''.join(segments.decrypt(cipher, key, enc, 1000)), data)
+        self.assertEqual(segments.verify(cipher, key, enc, 1000), len(data))
+        # later segments reuse the subkey worked out for the earlier ones, and still catch tampering
+        self.assertRaises(ValueError, segments.verify, cipher, key, enc[:-20] + bytes([enc[-20] ^ 1]) + enc[-19:], 1000)
+
+        chunker = Chunker(64, 256, 1024)
+        enc = b''.join(segments.encrypt_chunked(cipher, key, chunker, data))
+        self.assertEqual(b''.join(segments.decrypt_chunked(cipher, key, enc, chunker.max_size)), data)
+
+    def test_hchacha20(self):
+        # the test vector from draft-irtf-cfrg-xchacha section 2.2.1
+        nonce = bytes.fromhex("000000090000004a0000000031415927")
+        self.assertEqual(hchacha20(bytes(range(32)), nonce).hex(),
+                         "82413b4227b27bfed30e42508a877d73a0f9e4d58a74a853c12ec41326d3ecdc")
+        self.assertRaises(ValueError, hchacha20, bytes(32), bytes(12))
+
+    def test_serialize(self):
+        cipher = ciphers.cipherext.from_option_string("xchacha20-poly1305")
+        self.assertEqual(len(cipher.nonce), 24)
+        self.assertNotEqual(cipher.nonce, XChaCha20Poly1305Cipher().nonce)
+        self.assertEqual(ciphers.cipherext.deserialize(cipher.serialize()).nonce, cipher.nonce)
+
+        self.assertRaises(ValueError, XChaCha20Poly1305Cipher, bytes(12))
+        self.assertRaises(ValueError, ciphers.cipherext.from_option_string, "xchacha20-poly1305:nonce=AAAA")